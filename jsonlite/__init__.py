@@ -1,4 +1,4 @@
-from .jsonlite import JSONlite, MongoClient, Database, Collection, Cursor, AggregationCursor
+from .jsonlite import JSONlite, MongoClient, Database, Collection, Cursor, AggregationCursor, AutoIndexPolicy, CachePool
 from .transaction import Transaction, TransactionError
 from .server import JSONLiteServer, run_server
 from .client import MongoClient as RemoteMongoClient, connect
@@ -12,6 +12,8 @@ __all__ = [
     'Collection',
     'Cursor',
     'AggregationCursor',
+    'AutoIndexPolicy',
+    'CachePool',
     'Transaction',
     'TransactionError',
     'JSONLiteServer',
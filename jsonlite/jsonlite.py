@@ -2,18 +2,23 @@ import json
 import fcntl
 import os
 import re
+import sys
 import tempfile
+import unicodedata
 import base64
 import math
 import gzip
 from dataclasses import dataclass
 from functools import wraps
-from typing import List, Dict, Union, Any, Optional, Tuple
+from typing import List, Dict, Union, Any, Optional, Tuple, Iterator, Iterable, FrozenSet, Callable
 from datetime import datetime
 from decimal import Decimal
 from copy import deepcopy
 from bisect import insort_left, bisect_left, bisect_right
 from collections import OrderedDict
+from array import array
+import heapq
+from itertools import islice, count as _count, product
 import hashlib
 from contextlib import contextmanager
 
@@ -28,6 +33,18 @@ except ImportError:
 # Import transaction support
 from .transaction import TransactionManager, TransactionError
 
+# Cost model for plan selection, in units of "one document fetched and
+# matched against the filter". Reading an index posting is much cheaper.
+_PLAN_KEY_COST = 0.05
+# Cached plans are re-costed once index or collection sizes move by this factor
+_PLAN_DRIFT_RATIO = 1.5
+# Default memory budget of a QueryCache; one entry may use at most an eighth
+_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Containers longer than this are sized from an evenly spaced sample
+_SIZE_SAMPLE = 64
+# A shared cache pool evicts the cheapest of this many least recently used entries
+_EVICTION_WINDOW = 8
+
 
 def _fast_dumps(obj: Any, **kwargs) -> str:
     """Fast JSON serialization using orjson if available.
@@ -99,6 +116,23 @@ def _decompress_data(data: bytes) -> bytes:
     return gzip.decompress(data)
 
 
+def _file_signature(file: Any) -> Tuple[int, int, int]:
+    """Identify the version of an open database file.
+    
+    Saves either replace the file (a new inode) or rewrite it in place (a
+    new modification time and usually size), so a changed signature means
+    the file was written since it was last seen.
+    
+    Args:
+        file: Open file object
+    
+    Returns:
+        (inode, size, modification time in nanoseconds)
+    """
+    stat = os.fstat(file.fileno())
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
 def _is_compressed(data: bytes) -> bool:
     """Check if data appears to be gzip compressed.
     
@@ -650,97 +684,494 @@ def _geohash_in_range(geohash: str, min_lon: float, min_lat: float,
                 bbox[1][1] < min_lat or bbox[0][1] > max_lat)
 
 
+class _CopyOnWriteDict(dict):
+    """Result document that shares nested values with the engine until touched.
+    
+    The top level is a shallow copy of the stored document. Nested dicts,
+    lists and other mutable values are still the engine's own objects and
+    are deep-copied the first time they are read through this dict, so
+    callers can mutate results freely without touching stored data. Equality,
+    repr and len() read the shared values in place, without copying.
+    """
+    
+    __slots__ = ('_shared',)
+    
+    _IMMUTABLE = (str, int, float, bool, type(None), Decimal, datetime, bytes)
+    
+    def __init__(self, source: Any = ()):
+        dict.__init__(self, source)
+        self._shared = {key for key, value in dict.items(self)
+                        if not isinstance(value, self._IMMUTABLE)}
+    
+    def _own(self, key: Any) -> None:
+        """Replace a shared value with a private copy."""
+        if key in self._shared:
+            self._shared.discard(key)
+            dict.__setitem__(self, key, deepcopy(dict.__getitem__(self, key)))
+    
+    def _own_all(self) -> None:
+        for key in list(self._shared):
+            self._own(key)
+    
+    def __getitem__(self, key: Any) -> Any:
+        self._own(key)
+        return dict.__getitem__(self, key)
+    
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self._shared.discard(key)
+        dict.__setitem__(self, key, value)
+    
+    def __delitem__(self, key: Any) -> None:
+        self._shared.discard(key)
+        dict.__delitem__(self, key)
+    
+    def __iter__(self):
+        # Defining __iter__ keeps dict(doc) and {**doc} off CPython's storage
+        # copy fast path, so they read values through __getitem__
+        return dict.__iter__(self)
+    
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self[key] if key in self else default
+    
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+    
+    def pop(self, key: Any, *default: Any) -> Any:
+        self._own(key)
+        return dict.pop(self, key, *default)
+    
+    def popitem(self) -> Tuple[Any, Any]:
+        self._own_all()
+        return dict.popitem(self)
+    
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+    
+    def __ior__(self, other: Any) -> '_CopyOnWriteDict':
+        self.update(other)
+        return self
+    
+    def __or__(self, other: Any) -> Dict:
+        merged = self.copy()
+        merged.update(other)
+        return merged
+    
+    def clear(self) -> None:
+        self._shared.clear()
+        dict.clear(self)
+    
+    def values(self):
+        self._own_all()
+        return dict.values(self)
+    
+    def items(self):
+        self._own_all()
+        return dict.items(self)
+    
+    def copy(self) -> '_CopyOnWriteDict':
+        clone = _CopyOnWriteDict()
+        dict.update(clone, dict.items(self))
+        clone._shared = set(self._shared)
+        return clone
+    
+    def __copy__(self) -> '_CopyOnWriteDict':
+        return self.copy()
+    
+    def __deepcopy__(self, memo: Dict) -> Dict:
+        return {key: deepcopy(value, memo) for key, value in dict.items(self)}
+    
+    def __reduce__(self):
+        return (dict, (dict(dict.items(self)),))
+
+
+def _copy_path(doc: Dict, path: str) -> Dict:
+    """Shallow-copy a document and the nested dicts along a dotted path.
+    
+    The copy can then be changed at ``path`` without touching ``doc``.
+    """
+    new_doc = dict(doc)
+    current = new_doc
+    for part in path.split('.')[:-1]:
+        child = current.get(part)
+        if not isinstance(child, dict):
+            break
+        current[part] = dict(child)
+        current = current[part]
+    return new_doc
+
+
+def _approximate_size(obj: Any) -> int:
+    """Approximate the memory held by a value, in bytes.
+    
+    Walks dicts, lists and tuples, adding up sys.getsizeof. Long containers
+    are estimated from _SIZE_SAMPLE evenly spaced items, so sizing a large
+    result costs about the same as sizing a small one.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        if len(items) > _SIZE_SAMPLE:
+            step = len(items) / _SIZE_SAMPLE
+            sample = [items[int(i * step)] for i in range(_SIZE_SAMPLE)]
+            return size + sum(_approximate_size(k) + _approximate_size(v)
+                              for k, v in sample) * len(items) // _SIZE_SAMPLE
+        return size + sum(_approximate_size(k) + _approximate_size(v) for k, v in items)
+    if isinstance(obj, (list, tuple)):
+        if len(obj) > _SIZE_SAMPLE:
+            step = len(obj) / _SIZE_SAMPLE
+            sample = sum(_approximate_size(obj[int(i * step)]) for i in range(_SIZE_SAMPLE))
+            return size + sample * len(obj) // _SIZE_SAMPLE
+        return size + sum(_approximate_size(item) for item in obj)
+    return size
+
+
+def _freeze(obj: Any, ordered: bool = False) -> Any:
+    """Turn a filter value into a hashable equivalent for cache keys.
+    
+    Dicts become frozensets of items (tuples of items when ``ordered``, for
+    specs whose key order matters such as pipelines) and lists become
+    tuples, recursively. Values that are still unhashable are keyed by type
+    and repr.
+    """
+    if isinstance(obj, dict):
+        if ordered:
+            return ('dict',) + tuple((key, _freeze(value, True)) for key, value in obj.items())
+        return frozenset((key, _freeze(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        frozen = tuple(obj)
+        try:
+            hash(frozen)  # Usually flat: no need to recurse
+            return frozen
+        except TypeError:
+            return tuple(_freeze(item, ordered) for item in obj)
+    try:
+        hash(obj)
+    except TypeError:
+        return ('repr', type(obj).__name__, repr(obj))
+    return obj
+
+
+# Stages whose output depends on more than the collection's own documents
+_UNCACHEABLE_STAGES = frozenset(['$lookup', '$graphLookup', '$unionWith', '$sample', '$out', '$merge'])
+
+
+def _pipeline_cacheable(pipeline: List[Dict]) -> bool:
+    """Check whether an aggregation result depends only on the collection."""
+    for stage in pipeline:
+        if not isinstance(stage, dict):
+            return False
+        for op, spec in stage.items():
+            if op in _UNCACHEABLE_STAGES:
+                return False
+            if op == '$facet' and isinstance(spec, dict):
+                if not all(_pipeline_cacheable(sub) for sub in spec.values()):
+                    return False
+    return True
+
+
+class CachePool:
+    """Query cache memory shared by several collections.
+    
+    A MongoClient attaches the QueryCache of each of its collections to one
+    pool. Every cache stays a namespace of its own (keys, TTL, statistics
+    and invalidation are per collection), while the pool keeps a single
+    recency order and memory budget over all their entries. To make room,
+    it evicts among the _EVICTION_WINDOW least recently used entries the one
+    cheapest to recompute per byte freed; the cost of an entry is the
+    execution time measured when its result was computed.
+    """
+    
+    def __init__(self, max_bytes: int = _CACHE_MAX_BYTES, max_entry_bytes: Optional[int] = None,
+                 max_size: Optional[int] = None):
+        """Initialize the pool.
+        
+        Args:
+            max_bytes: Memory budget for all entries, in approximate bytes
+                (default: 32 MiB)
+            max_entry_bytes: Largest entry admitted (default: max_bytes // 8)
+            max_size: Maximum number of entries, None for no limit
+        """
+        self._entries: OrderedDict = OrderedDict()  # (cache, key) -> (bytes, cost per byte)
+        self._max_bytes = max_bytes
+        self._max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        self._max_size = max_size
+        self._bytes = 0
+        self._evictions = 0
+    
+    def admit(self, cache: 'QueryCache', key: Any, size: int, cost: float) -> bool:
+        """Account for a new entry, evicting others until it fits.
+        
+        Args:
+            cache: Cache (namespace) storing the entry
+            key: Key of the entry in that cache
+            size: Approximate size of the entry in bytes
+            cost: Milliseconds it took to compute the entry
+        
+        Returns:
+            False if the entry is over max_entry_bytes and must not be stored
+        """
+        if size > self._max_entry_bytes:
+            return False
+        while self._entries and (self._bytes + size > self._max_bytes
+                                 or (self._max_size is not None
+                                     and len(self._entries) >= self._max_size)):
+            self._evict()
+        self._entries[(cache, key)] = (size, cost / max(size, 1))
+        self._bytes += size
+        return True
+    
+    def _evict(self) -> None:
+        """Evict the cheapest entry among the least recently used ones."""
+        window = islice(self._entries.items(), _EVICTION_WINDOW)
+        (cache, key), _ = min(window, key=lambda item: item[1][1])
+        cache._evict(key)  # Releases the entry through release()
+        self._evictions += 1
+    
+    def touch(self, cache: 'QueryCache', key: Any) -> None:
+        """Mark an entry as most recently used."""
+        self._entries.move_to_end((cache, key))
+    
+    def release(self, cache: 'QueryCache', key: Any) -> None:
+        """Forget an entry removed from its cache."""
+        self._bytes -= self._entries.pop((cache, key))[0]
+    
+    def clear(self) -> None:
+        """Clear the entries of every attached cache."""
+        for cache in {cache for cache, _ in self._entries}:
+            cache.clear()
+    
+    @property
+    def stats(self) -> Dict:
+        """Get pool statistics.
+        
+        Returns:
+            Dict with size, memory_bytes, max_bytes, max_entry_bytes,
+            max_size, evictions, and namespaces (size and memory_bytes per
+            cache namespace)
+        """
+        namespaces: Dict[str, Dict[str, int]] = {}
+        for (cache, _), (size, _) in self._entries.items():
+            usage = namespaces.setdefault(cache.namespace, {'size': 0, 'memory_bytes': 0})
+            usage['size'] += 1
+            usage['memory_bytes'] += size
+        return {
+            'size': len(self._entries),
+            'memory_bytes': self._bytes,
+            'max_bytes': self._max_bytes,
+            'max_entry_bytes': self._max_entry_bytes,
+            'max_size': self._max_size,
+            'evictions': self._evictions,
+            'namespaces': namespaces
+        }
+    
+    def reset_stats(self) -> None:
+        """Reset pool statistics."""
+        self._evictions = 0
+
+
 class QueryCache:
     """LRU cache for query results.
     
-    Provides automatic cache invalidation and size management.
+    Provides dependency-tracked invalidation and size management: entries
+    are bounded by count and by approximate size in bytes (a global budget
+    with LRU eviction and a per-entry maximum), and may expire after a TTL.
     Cache keys are generated from filter hashes for consistent lookup.
+    Each entry may record the field paths its filter reads and its match
+    predicate: updates then drop only entries reading a modified path, and
+    inserts and deletes only entries whose predicate matches the document.
+    Entries without dependencies are dropped by every write.
+    
+    A cache attached to a CachePool is a namespace of it: the pool's limits
+    and eviction order replace the cache's own.
     """
     
-    def __init__(self, max_size: int = 100):
+    def __init__(self, max_size: int = 100, max_bytes: int = _CACHE_MAX_BYTES,
+                 ttl: Optional[float] = None, max_entry_bytes: Optional[int] = None,
+                 pool: Optional[CachePool] = None, namespace: Optional[str] = None):
         """Initialize cache with maximum size.
         
         Args:
             max_size: Maximum number of cached query results (default: 100)
+            max_bytes: Memory budget for all entries, in approximate bytes
+                (default: 32 MiB)
+            ttl: Seconds an entry stays valid, None for no expiry
+            max_entry_bytes: Largest entry admitted, so one huge result
+                cannot flush everything (default: max_bytes // 8)
+            pool: Shared pool holding the entries; its limits replace
+                max_size, max_bytes and max_entry_bytes
+            namespace: Name of the cache in the pool statistics
         """
         self._cache: OrderedDict = OrderedDict()
+        self._pool = pool
+        self.namespace = namespace
+        if pool is not None:
+            max_size, max_bytes, max_entry_bytes = pool._max_size, pool._max_bytes, pool._max_entry_bytes
         self._max_size = max_size
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        self._bytes = 0
         self._hits = 0
         self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rejections = 0
     
-    def _serialize_for_hash(self, obj: Any) -> Any:
-        """Convert object to hashable representation.
-        
-        Handles callable keys, nested dicts/lists, and special types.
-        
-        Args:
-            obj: Object to serialize
+    def key_for(self, filter: Dict) -> Any:
+        """Build the cache key of a filter.
         
-        Returns:
-            Hashable representation
-        """
-        if callable(obj):
-            # For callable keys, use function name and id for uniqueness
-            return f"<callable:{obj.__name__}:{id(obj)}>"
-        elif isinstance(obj, dict):
-            # Sort keys and recursively serialize values
-            return {k if not callable(k) else f"<callable:{k.__name__}:{id(k)}>": self._serialize_for_hash(v) 
-                    for k, v in sorted(obj.items(), key=lambda x: str(x[0]))}
-        elif isinstance(obj, (list, tuple)):
-            return [self._serialize_for_hash(item) for item in obj]
-        elif isinstance(obj, (datetime, Decimal)):
-            return str(obj)
-        else:
-            return obj
-    
-    def _hash_filter(self, filter: Dict) -> str:
-        """Generate consistent hash for a filter dict.
+        Flat filters with hashable values (the common {field: value, ...}
+        equality) are keyed by the frozenset of their items. Other filters
+        reuse the plan cache's shape key (see _filter_shape) with their
+        values frozen into tuples; filters without a shape ($near, callable
+        keys) are frozen whole. Callables are part of the key as objects.
         
         Args:
             filter: Query filter dict
         
         Returns:
-            Hex string hash of the filter
+            Hashable key
         """
-        # Convert to hashable representation (handles callable keys)
-        serializable = self._serialize_for_hash(filter)
-        filter_str = _fast_dumps(serializable, sort_keys=True, default=str)
-        return hashlib.md5(filter_str.encode()).hexdigest()
-    
-    def get(self, filter: Dict) -> Optional[List[Dict]]:
+        try:
+            return ('eq', frozenset(filter.items()))
+        except TypeError:
+            pass
+        params: List[Any] = []
+        shape = _filter_shape(filter, params)
+        if shape is not None:
+            return ('shape', shape, _freeze(params))
+        return ('filter', _freeze(filter))
+    
+    def get(self, filter: Dict, key: Any = None) -> Optional[List[Dict]]:
         """Get cached query result.
         
         Args:
             filter: Query filter dict
+            key: Key from key_for(filter), if the caller already built it
         
         Returns:
             Cached results or None if not found
         """
-        key = self._hash_filter(filter)
-        if key in self._cache:
-            self._hits += 1
-            # Move to end (most recently used)
-            self._cache.move_to_end(key)
-            return deepcopy(self._cache[key])
+        if key is None:
+            key = self.key_for(filter)
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry['expires'] is not None and entry['expires'] <= self._now():
+                self._remove(key)
+                self._expirations += 1
+            else:
+                self._hits += 1
+                # Move to end (most recently used)
+                self._cache.move_to_end(key)
+                if self._pool is not None:
+                    self._pool.touch(self, key)
+                return list(entry['results'])
         self._misses += 1
         return None
     
-    def set(self, filter: Dict, results: List[Dict]) -> None:
+    def set(self, filter: Dict, results: List[Any],
+            fields: Optional[FrozenSet[str]] = None,
+            match: Optional[Callable[[Dict], bool]] = None, key: Any = None,
+            cost: float = 0.0) -> None:
         """Cache query results.
         
+        Results larger than the per-entry maximum are not cached.
+        
         Args:
             filter: Query filter dict
             results: Query results to cache
+            fields: Field paths the filter reads (None: unknown, so any
+                update invalidates the entry)
+            match: Predicate of the filter (None: any insert or delete
+                invalidates the entry)
+            key: Key from key_for(filter), if the caller already built it
+            cost: Milliseconds it took to compute the results (weighs
+                eviction in a shared pool)
         """
-        key = self._hash_filter(filter)
-        # Remove old entry if exists (to update position)
+        if key is None:
+            key = self.key_for(filter)
+        # Drop the old entry (its results are replaced)
         if key in self._cache:
-            self._cache.move_to_end(key)
+            self._remove(key)
+        results = list(results)
+        size = _approximate_size(results)
+        if self._pool is not None:
+            if not self._pool.admit(self, key, size, cost):
+                self._rejections += 1
+                return
+        elif size > self._max_entry_bytes:
+            self._rejections += 1
+            return
         else:
-            # Evict oldest if at capacity
-            if len(self._cache) >= self._max_size:
-                self._cache.popitem(last=False)
-        self._cache[key] = deepcopy(results)
+            # Evict least recently used entries until the new one fits
+            while self._cache and (len(self._cache) >= self._max_size
+                                   or self._bytes + size > self._max_bytes):
+                self._evict(next(iter(self._cache)))
+        expires = self._now() + self._ttl if self._ttl is not None else None
+        self._cache[key] = {'results': results, 'fields': fields, 'match': match,
+                            'bytes': size, 'expires': expires}
+        self._bytes += size
+    
+    @staticmethod
+    def _now() -> float:
+        import time
+        return time.monotonic()
+    
+    def _remove(self, key: Any) -> None:
+        """Remove an entry and release its bytes."""
+        self._bytes -= self._cache.pop(key)['bytes']
+        if self._pool is not None:
+            self._pool.release(self, key)
+    
+    def _evict(self, key: Any) -> None:
+        """Remove an entry to stay within the limits."""
+        self._remove(key)
+        self._evictions += 1
+    
+    def invalidate_fields(self, paths: Iterable[str]) -> int:
+        """Drop the entries whose filter reads any of the modified paths.
+        
+        Args:
+            paths: Dotted paths modified by an update
+        
+        Returns:
+            Number of entries dropped
+        """
+        paths = list(paths)
+        doomed = [key for key, entry in self._cache.items()
+                  if entry['fields'] is None
+                  or any(_paths_overlap(field, path) for field in entry['fields'] for path in paths)]
+        return self._drop(doomed)
+    
+    def invalidate_document(self, doc: Dict) -> int:
+        """Drop the entries whose filter matches an inserted or deleted document.
+        
+        Args:
+            doc: The inserted or deleted document
+        
+        Returns:
+            Number of entries dropped
+        """
+        doomed = []
+        for key, entry in self._cache.items():
+            match = entry['match']
+            try:
+                if match is None or match(doc):
+                    doomed.append(key)
+            except Exception:
+                doomed.append(key)  # Cannot tell, so assume it matches
+        return self._drop(doomed)
+    
+    def _drop(self, keys: List[Any]) -> int:
+        """Remove entries by key, counting them as invalidations."""
+        for key in keys:
+            self._remove(key)
+        self._invalidations += len(keys)
+        return len(keys)
     
     def invalidate(self, filter: Optional[Dict] = None) -> None:
         """Invalidate cache entries.
@@ -750,20 +1181,121 @@ class QueryCache:
                    If None, clear entire cache.
         """
         if filter is None:
-            self._cache.clear()
+            self.clear()
         else:
-            key = self._hash_filter(filter)
+            key = self.key_for(filter)
             if key in self._cache:
-                del self._cache[key]
+                self._remove(key)
     
     def clear(self) -> None:
         """Clear entire cache."""
+        if self._pool is not None:
+            for key in self._cache:
+                self._pool.release(self, key)
         self._cache.clear()
+        self._bytes = 0
     
     @property
     def stats(self) -> Dict:
         """Get cache statistics.
         
+        Returns:
+            Dict with hits, misses, size, max_size, hit_rate, invalidations
+            (entries dropped by writes), memory_bytes, max_bytes,
+            max_entry_bytes, ttl, evictions (to stay within the limits),
+            expirations, and rejected (results over max_entry_bytes)
+        """
+        total = self._hits + self._misses
+        hit_rate = (self._hits / total * 100) if total > 0 else 0
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'size': len(self._cache),
+            'max_size': self._max_size,
+            'hit_rate': round(hit_rate, 2),
+            'invalidations': self._invalidations,
+            'memory_bytes': self._bytes,
+            'max_bytes': self._max_bytes,
+            'max_entry_bytes': self._max_entry_bytes,
+            'ttl': self._ttl,
+            'evictions': self._evictions,
+            'expirations': self._expirations,
+            'rejected': self._rejections
+        }
+    
+    def reset_stats(self) -> None:
+        """Reset cache statistics."""
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rejections = 0
+
+
+class PlanCache:
+    """LRU cache of query plans keyed by filter shape.
+    
+    A shape is the structure of a filter with its values stripped (see
+    _filter_shape), so {"age": 30} and {"age": 45} share one entry. Entries
+    hold the compiled predicate and the access plans chosen for the shape.
+    """
+    
+    def __init__(self, max_size: int = 256):
+        """Initialize plan cache with maximum size.
+        
+        Args:
+            max_size: Maximum number of cached shapes (default: 256)
+        """
+        self._cache: OrderedDict = OrderedDict()
+        self._max_size = max_size
+        self._hits = 0
+        self._misses = 0
+    
+    def get(self, shape: Tuple) -> Optional[Dict]:
+        """Get the cached plan for a filter shape.
+        
+        Args:
+            shape: Filter shape
+        
+        Returns:
+            Cached plan entry or None if not found
+        """
+        entry = self._cache.get(shape)
+        if entry is not None:
+            self._hits += 1
+            self._cache.move_to_end(shape)
+            return entry
+        self._misses += 1
+        return None
+    
+    def set(self, shape: Tuple, entry: Dict) -> None:
+        """Cache a plan entry for a filter shape.
+        
+        Args:
+            shape: Filter shape
+            entry: Plan entry
+        """
+        if shape in self._cache:
+            self._cache.move_to_end(shape)
+        elif len(self._cache) >= self._max_size:
+            self._cache.popitem(last=False)
+        self._cache[shape] = entry
+    
+    def clear(self) -> None:
+        """Clear all cached plans."""
+        self._cache.clear()
+    
+    def __contains__(self, shape: Tuple) -> bool:
+        return shape in self._cache
+    
+    def __len__(self) -> int:
+        return len(self._cache)
+    
+    @property
+    def stats(self) -> Dict:
+        """Get plan cache statistics.
+        
         Returns:
             Dict with hits, misses, size, and hit_rate
         """
@@ -778,7 +1310,7 @@ class QueryCache:
         }
     
     def reset_stats(self) -> None:
-        """Reset cache statistics."""
+        """Reset plan cache statistics."""
         self._hits = 0
         self._misses = 0
 
@@ -804,6 +1336,16 @@ class QueryPlanner:
         self._slow_queries: List[Dict] = []
         self._total_queries = 0
         self._optimized_queries = 0
+        self._hinted_queries = 0
+        self._listeners: List[Any] = []  # callables notified of each recorded query
+    
+    def add_listener(self, callback: Any) -> None:
+        """Call ``callback(query_record)`` for every recorded query.
+        
+        Args:
+            callback: Callable receiving the query record dict
+        """
+        self._listeners.append(callback)
     
     def analyze_filter(self, filter: Dict) -> Dict[str, Any]:
         """Analyze a filter and extract field usage information.
@@ -852,7 +1394,8 @@ class QueryPlanner:
         }
     
     def record_query(self, filter: Dict, execution_time_ms: float, 
-                     result_count: int, used_index: Optional[str] = None) -> None:
+                     result_count: int, used_index: Optional[str] = None,
+                     docs_examined: Optional[int] = None, hint: Optional[str] = None) -> None:
         """Record a query for pattern analysis.
         
         Args:
@@ -860,8 +1403,13 @@ class QueryPlanner:
             execution_time_ms: Query execution time in milliseconds
             result_count: Number of results returned
             used_index: Name of index used (if any)
+            docs_examined: Number of documents matched against the filter
+                (if known)
+            hint: Index name (or "$natural") the query was pinned to, if any
         """
         self._total_queries += 1
+        if hint is not None:
+            self._hinted_queries += 1
         analysis = self.analyze_filter(filter)
         
         # Create pattern signature
@@ -877,11 +1425,15 @@ class QueryPlanner:
             "execution_time_ms": execution_time_ms,
             "result_count": result_count,
             "used_index": used_index,
+            "docs_examined": docs_examined,
+            "hint": hint,
             "pattern": pattern_hash,
             "timestamp": datetime.now().isoformat()
         }
         
         self._query_history.append(query_record)
+        for listener in self._listeners:
+            listener(query_record)
         
         # Track slow queries (> 100ms)
         if execution_time_ms > 100:
@@ -1014,6 +1566,7 @@ class QueryPlanner:
         return {
             "total_queries": self._total_queries,
             "optimized_queries": self._optimized_queries,
+            "hinted_queries": self._hinted_queries,
             "slow_queries": len(self._slow_queries),
             "unique_patterns": len(self._filter_patterns),
             "average_execution_time_ms": round(avg_execution_time, 2),
@@ -1032,6 +1585,96 @@ class QueryPlanner:
         self._slow_queries = []
         self._total_queries = 0
         self._optimized_queries = 0
+        self._hinted_queries = 0
+
+
+@dataclass
+class AutoIndexPolicy:
+    """Thresholds for automatic index creation (see JSONlite ``auto_index``).
+    
+    Attributes:
+        min_queries: Unindexed queries filtering on a field, within one
+            evaluation window, before it is indexed
+        min_docs_examined: Average documents those queries examined
+        min_collection_size: Smallest collection worth indexing
+        max_index_memory: Estimated bytes all auto indexes may use together
+        unused_window: Seconds an auto index may go unused before it is
+            dropped; also how long a rejected field is left alone
+        check_interval: Queries between policy evaluations
+    """
+    min_queries: int = 20
+    min_docs_examined: float = 500
+    min_collection_size: int = 1000
+    max_index_memory: int = 64 * 1024 * 1024
+    unused_window: float = 3600.0
+    check_interval: int = 100
+
+
+class AutoIndexer:
+    """Tracks unindexed query load and the indexes built from it.
+    
+    Observes every query recorded by the QueryPlanner. JSONlite evaluates
+    the policy every ``check_interval`` queries (see
+    JSONlite._auto_index_step) and records each decision in ``log``.
+    """
+    
+    def __init__(self, policy: AutoIndexPolicy):
+        """Initialize the indexer.
+        
+        Args:
+            policy: Thresholds to apply
+        """
+        self.policy = policy
+        self.indexes: Dict[str, Dict] = {}  # auto index name -> field, created, last_used, memory
+        self.rejected: Dict[str, float] = {}  # field -> time of last rejection
+        self.log: List[Dict] = []
+        self._window: Dict[str, List] = {}  # field -> [unindexed queries, docs examined]
+        self._observed = 0
+    
+    def observe(self, query: Dict) -> None:
+        """Account one recorded query (a QueryPlanner listener)."""
+        import time
+        used_index = query.get('used_index')
+        if used_index:
+            for name in used_index.split('+'):
+                if name in self.indexes:
+                    self.indexes[name]['last_used'] = time.time()
+        elif query.get('docs_examined'):
+            for field in query['filter']:
+                if isinstance(field, str) and not field.startswith('$'):
+                    counts = self._window.setdefault(field, [0, 0])
+                    counts[0] += 1
+                    counts[1] += query['docs_examined']
+        self._observed += 1
+    
+    def due(self) -> bool:
+        """Whether enough queries were observed to evaluate the policy."""
+        return self._observed >= self.policy.check_interval
+    
+    def take_window(self) -> Dict[str, List]:
+        """Return the per-field load of the current window and start a new one."""
+        window, self._window = self._window, {}
+        self._observed = 0
+        return window
+    
+    def record(self, action: str, field: str, reason: str, index: Optional[str] = None) -> None:
+        """Append a decision to the log (keeps the last 1000).
+        
+        Args:
+            action: "create", "drop" or "skip"
+            field: Field the decision is about
+            reason: Human-readable explanation
+            index: Index name, if one was created or dropped
+        """
+        self.log.append({
+            "action": action,
+            "field": field,
+            "index": index,
+            "reason": reason,
+            "timestamp": datetime.now().isoformat()
+        })
+        if len(self.log) > 1000:
+            self.log = self.log[-1000:]
 
 
 @dataclass
@@ -1057,15 +1700,43 @@ class DeleteResult:
 
 
 class Cursor:
-    """Chainable cursor for query operations (sort, limit, skip, projection)."""
+    """Chainable cursor for query operations (sort, limit, skip, projection).
+    
+    Results are copy-on-write views of the stored documents (see
+    _CopyOnWriteDict) rather than deep copies.
+    
+    Operations are recorded and applied lazily. The query runs when the
+    cursor is first iterated and streams scan -> filter -> sort/limit ->
+    project, fetching ``batch_size`` documents at a time, so breaking out of
+    a loop early stops the scan. Sort, skip and limit are combined into a
+    single top-k selection, and only the documents that are finally returned
+    get wrapped and projected. Fetched documents are kept, so iterating the
+    cursor again (or calling len()/all()) does not re-run the query.
+    """
     
-    def __init__(self, data: List[Dict], db_instance: 'JSONlite'):
-        self._data = deepcopy(data)
+    def __init__(self, data: Optional[List[Dict]], db_instance: 'JSONlite',
+                 filter: Optional[Dict] = None):
+        # Documents are shared with the engine (and the query cache), never
+        # mutated here; only the selected ones are copied in _execute().
+        # With data=None the filter is run on first use, which lets a sorted
+        # and limited query be answered in index order instead.
+        self._data = data
+        self._filter = filter if filter is not None else {}
         self._db = db_instance
         self._sort_keys: List[tuple] = []  # [(key, direction), ...]
         self._skip_count: int = 0
         self._limit_count: Optional[int] = None
         self._projection: Optional[Dict] = None
+        self._batch_size: int = 0
+        self._hint: Any = None  # Index name, index keys or "$natural"
+        self._buffer: Optional[List[Dict]] = None  # Documents fetched so far
+        self._pending: Optional[Iterator[List[Dict]]] = None  # Remaining batches
+        self._stats: Optional[Dict] = None  # Execution statistics for explain()
+    
+    def _reset(self) -> None:
+        """Discard fetched results after the query specification changed."""
+        self._buffer = None
+        self._pending = None
     
     def sort(self, key: Union[str, List[tuple]], direction: int = 1) -> 'Cursor':
         """Sort results by field(s).
@@ -1081,6 +1752,7 @@ class Cursor:
             self._sort_keys = key
         else:
             self._sort_keys.append((key, direction))
+        self._reset()
         return self
     
     def skip(self, count: int) -> 'Cursor':
@@ -1093,6 +1765,7 @@ class Cursor:
             Self for chaining
         """
         self._skip_count = count
+        self._reset()
         return self
     
     def limit(self, count: int) -> 'Cursor':
@@ -1105,6 +1778,7 @@ class Cursor:
             Self for chaining
         """
         self._limit_count = count
+        self._reset()
         return self
     
     def projection(self, fields: Dict) -> 'Cursor':
@@ -1117,6 +1791,47 @@ class Cursor:
             Self for chaining
         """
         self._projection = fields
+        self._reset()
+        return self
+    
+    def hint(self, index: Union[str, List[tuple], Dict]) -> 'Cursor':
+        """Force the query to use an index, or a collection scan.
+        
+        Bypasses plan selection (and the query cache). A hinted index with
+        no condition on its fields is scanned completely, so hinting a
+        sparse index can leave out documents that lack the field, as in
+        MongoDB.
+        
+        Args:
+            index: Index name, index keys as [(field, direction), ...], or
+                "$natural" for a collection scan
+        
+        Returns:
+            Self for chaining
+        
+        Raises:
+            ValueError: When the cursor runs, if the hint does not
+                correspond to an existing index
+        """
+        self._hint = index
+        self._reset()
+        return self
+    
+    def batch_size(self, count: int) -> 'Cursor':
+        """Set how many documents are fetched and copied per batch.
+        
+        Args:
+            count: Documents per batch (0 fetches one at a time)
+        
+        Returns:
+            Self for chaining
+        """
+        if not isinstance(count, int):
+            raise TypeError("batch_size must be an integer")
+        if count < 0:
+            raise ValueError("batch_size must be >= 0")
+        self._batch_size = count
+        self._reset()
         return self
     
     def near(self, field: str, point: Union[List[float], Tuple[float, float]], 
@@ -1145,12 +1860,14 @@ class Cursor:
         
         # Calculate distances and filter by max/min distance
         filtered_data = []
-        for record in self._data:
+        for record in self._documents():
             record_point = _extract_coordinates(record.get(field))
             if record_point:
                 distance = _haversine_distance(point_coords, record_point)
                 if min_distance <= distance <= (max_distance if max_distance is not None else float('inf')):
-                    # Store distance for sorting
+                    # Store distance for sorting on a shallow copy, so the
+                    # engine's documents are left untouched
+                    record = dict(record)
                     record['_geo_distance_' + field] = distance
                     filtered_data.append(record)
         
@@ -1158,56 +1875,118 @@ class Cursor:
         
         # Sort by distance (ascending - nearest first)
         self._sort_keys = [('_geo_distance_' + field, 1)]
+        self._reset()
         
         return self
     
-    def _apply_sort(self) -> 'Cursor':
-        """Apply sorting to internal data."""
-        if not self._sort_keys:
-            return self
+    def _sort_key(self):
+        """Build the key function for the current sort specification."""
+        getters = [(_path_getter(key), direction) for key, direction in self._sort_keys]
         
         def sort_key(record):
             values = []
-            for key, direction in self._sort_keys:
-                val = record.get(key)
+            for get_value, direction in getters:
+                val = get_value(record)
                 # Handle None values (sort them last)
                 if val is None:
                     val = (1, None)  # Sort None last
+                elif direction == -1:
+                    # Reverse for DESC
+                    val = (0, self._negate(val))
                 else:
                     val = (0, val)
-                # Reverse for DESC
-                if direction == -1:
-                    if isinstance(val[1], (int, float, str)):
-                        val = (val[0], self._negate(val[1]))
-                    else:
-                        val = (val[0], val[1])
                 values.append(val)
             return tuple(values)
         
-        self._data.sort(key=sort_key)
-        return self
+        return sort_key
     
     def _negate(self, val):
         """Negate value for DESC sorting."""
-        if isinstance(val, (int, float)):
+        if isinstance(val, (int, float)) and not isinstance(val, bool):
             return -val
-        elif isinstance(val, str):
-            # For strings, we can't simply negate, so we use a different approach
-            # This is a workaround - in production, use locale-aware sorting
-            return val
-        return val
+        # Strings, datetimes, etc. can't be negated, so invert their comparison
+        return _Descending(val)
+    
+    def _documents(self) -> List[Dict]:
+        """Run the query if it hasn't been run yet and return the matches."""
+        if self._data is None:
+            if self._hint is not None:
+                self._data = list(self._db._iter_find(self._filter, hint=self._hint))
+            else:
+                self._data = self._db._find(self._filter, find_all=True)
+        return self._data
     
-    def _apply_skip_limit(self) -> 'Cursor':
-        """Apply skip and limit to internal data."""
-        start = self._skip_count
-        end = start + self._limit_count if self._limit_count else None
-        self._data = self._data[start:end]
-        return self
+    def _source(self) -> Iterator[Dict]:
+        """Stream the matching documents in collection order."""
+        if self._data is not None:
+            source = iter(self._data)
+        else:
+            source = self._db._iter_find(self._filter, None if self._stats is None else self._stats['access'],
+                                         self._hint)
+        if self._stats is not None:
+            return self._timed(source, self._stats['access'])
+        return source
+    
+    @staticmethod
+    def _timed(source: Iterator[Dict], stats: Dict) -> Iterator[Dict]:
+        """Accumulate the time spent producing documents into stats."""
+        import time
+        stats.setdefault('executionTimeMillis', 0.0)
+        while True:
+            start = time.perf_counter()
+            record = next(source, None)
+            stats['executionTimeMillis'] += (time.perf_counter() - start) * 1000
+            if record is None:
+                return
+            yield record
     
-    def _apply_projection(self) -> 'Cursor':
-        """Apply field projection to internal data."""
+    def _select(self, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Stream the documents left after sort, skip and limit (not copied).
+        
+        Without a sort, matches are sliced off the scan as they are found.
+        With a limit, sorting is pushed into a top-k selection of
+        skip + limit documents (heapq.nsmallest, equivalent to sorting and
+        slicing) instead of sorting every match.
+        
+        Args:
+            limit: Maximum number of documents to select (None for all)
+        """
+        import time
+        start = self._skip_count
+        end = start + limit if limit else None
+        
+        # Sorted and limited on a single field: walk an ordered index and
+        # stop after skip + limit matches, without a sort
+        stats = self._stats
+        if self._data is None and end is not None and len(self._sort_keys) == 1:
+            field, direction = self._sort_keys[0]
+            ordered = self._db._find_in_index_order(
+                self._filter, field, direction, end, None if stats is None else stats['access'],
+                self._hint)
+            if ordered is not None:
+                if stats is not None:
+                    stats['path'] = 'index_order'
+                return iter(ordered[start:end])
+        
+        if stats is not None:
+            stats['path'] = 'scan'
+        if not self._sort_keys:
+            return islice(self._source(), start, end)
+        sort_start = time.perf_counter()
+        if end is None:
+            ordered = sorted(self._source(), key=self._sort_key())
+        else:
+            ordered = heapq.nsmallest(end, self._source(), key=self._sort_key())
+        if stats is not None:
+            # Exclusive of the time spent producing the input documents
+            stats['sort_ms'] = ((time.perf_counter() - sort_start) * 1000
+                                - stats['access'].get('executionTimeMillis', 0.0))
+        return iter(ordered[start:end])
+    
+    def _project(self, record: Dict) -> Dict:
+        """Apply field projection to a single document."""
         if not self._projection:
-            return self
+            return record
         
         # Determine if we're including or excluding fields
         include_mode = None
@@ -1224,35 +2003,92 @@ class Cursor:
                 include_mode = False
                 fields_to_exclude.add(field)
         
-        new_data = []
-        for record in self._data:
-            new_record = {}
-            if include_mode is True:
-                # Include mode: only include specified fields (+ _id by default)
-                if self._projection.get('_id', 1) != 0:
-                    if '_id' in record:
-                        new_record['_id'] = record['_id']
-                for field in fields_to_include:
-                    if field in record:
-                        new_record[field] = record[field]
-            else:
-                # Exclude mode: include all except specified fields
-                for key, value in record.items():
-                    if key not in fields_to_exclude:
-                        new_record[key] = value
-                if self._projection.get('_id', 1) == 0:
-                    new_record.pop('_id', None)
-            new_data.append(new_record)
+        new_record = {}
+        if include_mode is True:
+            # Include mode: only include specified fields (+ _id by default)
+            if self._projection.get('_id', 1) != 0:
+                if '_id' in record:
+                    new_record['_id'] = record['_id']
+            for field in fields_to_include:
+                if field in record:
+                    new_record[field] = record[field]
+        else:
+            # Exclude mode: include all except specified fields
+            for key, value in record.items():
+                if key not in fields_to_exclude:
+                    new_record[key] = value
+            if self._projection.get('_id', 1) == 0:
+                new_record.pop('_id', None)
+        return new_record
+    
+    def _select_covered(self) -> Optional[List[Dict]]:
+        """Answer the query from index data when it is covered.
+        
+        A query is covered when it has no sort, its filter is equality-only
+        on the fields of one index and the projection includes only those
+        fields (and _id). Documents are then built from the postings without
+        being read.
         
-        self._data = new_data
-        return self
-    
-    def _execute(self) -> List[Dict]:
-        """Execute all pending operations and return results."""
-        self._apply_sort()._apply_skip_limit()._apply_projection()
-        return self._data
-    
-    def all(self) -> List[Dict]:
+        Returns:
+            Projected documents after skip and limit, or None
+        """
+        if self._data is not None or self._sort_keys or not self._projection or self._hint is not None:
+            return None
+        fields = []
+        for field, mode in self._projection.items():
+            if field == '_id':
+                continue
+            if mode not in [1, True] or '.' in field:
+                return None
+            fields.append(field)
+        if not fields:
+            return None
+        
+        stats = self._stats
+        results = self._db._find_covered(self._filter, fields, self._projection.get('_id', 1) != 0,
+                                         None if stats is None else stats['access'])
+        if results is None:
+            return None
+        if stats is not None:
+            stats['path'] = 'covered'
+        start = self._skip_count
+        end = start + self._limit_count if self._limit_count else None
+        return results[start:end]
+    
+    def _batches(self) -> Iterator[List[Dict]]:
+        """Yield result batches of projected, copied documents."""
+        covered = self._select_covered()
+        if covered is not None:
+            yield covered  # Built from index keys, nothing to copy
+            return
+        
+        selected = self._select(self._limit_count)
+        size = self._batch_size or 1
+        while True:
+            # Project first so only the returned fields are copied
+            batch = [_CopyOnWriteDict(self._project(record)) for record in islice(selected, size)]
+            if not batch:
+                return
+            yield batch
+    
+    def _fetch(self, count: Optional[int] = None) -> List[Dict]:
+        """Fetch batches until ``count`` documents are buffered (None for all)."""
+        if self._buffer is None:
+            self._buffer = []
+            self._pending = self._batches()
+        while self._pending is not None and (count is None or len(self._buffer) < count):
+            batch = next(self._pending, None)
+            if batch is None:
+                self._pending = None
+            else:
+                self._buffer.extend(batch)
+        return self._buffer
+    
+    def _execute(self) -> List[Dict]:
+        """Execute all pending operations and return results."""
+        return self._fetch()
+    
+    def all(self) -> List[Dict]:
         """Return all matching documents after applying operations."""
         return self._execute()
     
@@ -1262,16 +2098,170 @@ class Cursor:
     
     def first(self) -> Optional[Dict]:
         """Return first matching document after applying operations."""
-        results = self._execute()
-        return results[0] if results else None
+        if self._buffer is not None:
+            results = self._fetch(1)
+            return results[0] if results else None
+        selected = next(self._select(1), None)
+        return _CopyOnWriteDict(self._project(selected)) if selected is not None else None
     
     def count(self) -> int:
         """Return count of matching documents (before skip/limit)."""
-        return len(self._data)
+        return len(self._documents())
+    
+    def explain(self) -> Dict[str, Any]:
+        """Explain how the query is planned and executed, MongoDB style.
+        
+        The query runs on an instrumented copy of this cursor, so the cursor
+        itself is left unexecuted. Updates and deletes locate their targets
+        with the same access path as find, so explaining find(filter) also
+        describes update_*/delete_* with that filter.
+        
+        Returns:
+            Dict with ``queryPlanner`` (winning plan tree, indexes considered)
+            and ``executionStats`` (documents returned, documents and keys
+            examined, estimated documents examined, per-stage timings and
+            whether the query cache was hit)
+        
+        Example:
+            >>> db.find({"age": 30}).sort("name").limit(5).explain()
+        """
+        import time
+        clone = Cursor(self._data, self._db, self._filter)
+        clone._sort_keys = list(self._sort_keys)
+        clone._skip_count = self._skip_count
+        clone._limit_count = self._limit_count
+        clone._projection = self._projection
+        clone._batch_size = self._batch_size
+        clone._hint = self._hint
+        clone._stats = stats = {'access': {}, 'path': None, 'sort_ms': 0.0}
+        
+        start = time.perf_counter()
+        results = clone._fetch()
+        total_ms = (time.perf_counter() - start) * 1000
+        
+        if self._data is not None:
+            # Documents were already materialized (e.g. by near())
+            geo = any(key.startswith('_geo_distance_') for key, _ in self._sort_keys)
+            plan = {'stage': 'GEO' if geo else 'COLLSCAN', 'indexName': None,
+                    'estimatedDocsExamined': len(self._data), 'indexesConsidered': []}
+            stats['access'].update(stage=plan['stage'], docsExamined=len(self._data),
+                                   keysExamined=0, cacheHit=False)
+        else:
+            plan = self._db._plan_query(self._filter, self._hint)
+        access = stats['access']
+        access.setdefault('stage', plan['stage'])
+        access.setdefault('indexName', plan['indexName'])
+        
+        considered = list(plan['indexesConsidered'])
+        for field, _ in self._sort_keys:
+            considered.extend(name for name in self._db._index_manager.indexes_on_field(field, self._filter)
+                              if name not in considered)
+        rejected = []
+        if stats['path'] in ('covered', 'index_order'):
+            # The filter's own access path lost to an index-only or index-order plan
+            rejected.append({'stage': plan['stage'], 'indexName': plan['indexName']})
+        
+        query_planner = {
+            'namespace': self._db._filename,
+            'parsedQuery': self._filter,
+            'indexesConsidered': considered,
+            'winningPlan': self._plan_tree(stats, len(results), total_ms, with_stats=False),
+            'rejectedPlans': rejected,
+        }
+        if self._hint is not None:
+            query_planner['hint'] = plan['hint']
+        return {
+            'queryPlanner': query_planner,
+            'executionStats': {
+                'nReturned': len(results),
+                'executionTimeMillis': round(total_ms, 3),
+                'totalKeysExamined': access.get('keysExamined', 0),
+                'totalDocsExamined': access.get('docsExamined', 0),
+                'estimatedDocsExamined': 0 if stats['path'] == 'covered' else plan['estimatedDocsExamined'],
+                'cacheHit': access.get('cacheHit', False),
+                'executionStages': self._plan_tree(stats, len(results), total_ms, with_stats=True),
+            },
+        }
+    
+    def _plan_tree(self, stats: Dict, returned: int, total_ms: float, with_stats: bool) -> Dict[str, Any]:
+        """Build the explain() stage tree from recorded execution statistics."""
+        access = stats['access']
+        path = stats['path']
+        access_ms = access.get('executionTimeMillis', 0.0)
+        
+        def stage(name: str, input_stage: Optional[Dict] = None, extra: Optional[Dict] = None,
+                  exec_stats: Optional[Dict] = None) -> Dict[str, Any]:
+            node = {'stage': name}
+            node.update(extra or {})
+            if with_stats and exec_stats:
+                node.update(exec_stats)
+            if input_stage is not None:
+                node['inputStage'] = input_stage
+            return node
+        
+        def rounded(ms: float) -> float:
+            return round(max(ms, 0.0), 3)
+        
+        scan_stats = {'nReturned': access.get('nReturned', 0), 'executionTimeMillis': rounded(access_ms)}
+        index_name = access.get('indexName')
+        if path == 'covered':
+            node = stage('IXSCAN', extra={'indexName': index_name},
+                         exec_stats={'keysExamined': access.get('keysExamined', 0),
+                                     'executionTimeMillis': rounded(access_ms)})
+            return stage('PROJECTION_COVERED', node, {'transformBy': self._projection},
+                         {'nReturned': returned})
+        
+        if path == 'index_order':
+            field, direction = self._sort_keys[0]
+            node = stage('IXSCAN', extra={'indexName': index_name,
+                                          'direction': 'forward' if direction == 1 else 'backward'},
+                         exec_stats={'keysExamined': access.get('keysExamined', 0)})
+            node = stage('FETCH', node, {'filter': self._filter},
+                         dict(scan_stats, docsExamined=access.get('docsExamined', 0)))
+        elif access.get('stage') in ('IXSCAN', 'ID_LOOKUP'):
+            node = stage(access['stage'], extra={'indexName': index_name},
+                         exec_stats={'keysExamined': access.get('keysExamined', 0)})
+            node = stage('FETCH', node, {'filter': self._filter},
+                         dict(scan_stats, docsExamined=access.get('docsExamined', 0)))
+        elif access.get('stage') == 'AND_HASH':
+            node = {'stage': 'AND_HASH',
+                    'inputStages': [{'stage': 'IXSCAN', 'indexName': name}
+                                    for name in index_name.split('+')]}
+            node = stage('FETCH', node, {'filter': self._filter},
+                         dict(scan_stats, docsExamined=access.get('docsExamined', 0)))
+        else:
+            extra = {'filter': self._filter}
+            if index_name:
+                extra['indexName'] = index_name
+            node = stage(access.get('stage', 'COLLSCAN'), extra=extra,
+                         exec_stats=dict(scan_stats, docsExamined=access.get('docsExamined', 0)))
+        
+        end = self._skip_count + self._limit_count if self._limit_count else None
+        if self._sort_keys and path != 'index_order':
+            extra = {'sortPattern': dict(self._sort_keys)}
+            if end is not None:
+                extra['limitAmount'] = end  # Top-k selection
+            node = stage('SORT', node, extra, {'executionTimeMillis': rounded(stats['sort_ms'])})
+        if self._skip_count:
+            node = stage('SKIP', node, {'skipAmount': self._skip_count})
+        if self._limit_count:
+            node = stage('LIMIT', node, {'limitAmount': self._limit_count})
+        if self._projection:
+            node = stage('PROJECTION_SIMPLE', node, {'transformBy': self._projection},
+                         {'executionTimeMillis': rounded(total_ms - access_ms - stats['sort_ms'])})
+        if with_stats:
+            node['nReturned'] = returned
+        return node
     
     def __iter__(self):
-        """Allow iteration over results."""
-        return iter(self._execute())
+        """Allow iteration over results, fetching batches on demand."""
+        position = 0
+        while True:
+            results = self._fetch(position + 1)
+            if position >= len(results):
+                return
+            yield results[position]
+            position += 1
     
     def __len__(self):
         """Return length of results."""
@@ -1279,15 +2269,23 @@ class Cursor:
     
     def __getitem__(self, index):
         """Support indexing."""
-        results = self._execute()
+        if isinstance(index, int) and index >= 0:
+            results = self._fetch(index + 1)
+        else:
+            results = self._execute()
         return results[index]
 
 
 class AggregationCursor:
-    """Cursor for aggregation pipeline operations."""
+    """Cursor for aggregation pipeline operations.
+    
+    Stages never modify their input documents: they build new (shallow)
+    documents instead, so the pipeline can start from the stored documents
+    without copying them. Final results are copy-on-write views.
+    """
     
     def __init__(self, data: List[Dict], db_instance: 'JSONlite'):
-        self._data = deepcopy(data)
+        self._data = list(data)
         self._db = db_instance
         self._stages: List[Dict] = []
         self._result: Optional[List[Dict]] = None
@@ -1304,10 +2302,10 @@ class AggregationCursor:
         
         # Handle simple field grouping (_id: "$field")
         if isinstance(_id_expr, str) and _id_expr.startswith('$'):
-            group_field = _id_expr[1:]
+            get_key = _path_getter(_id_expr[1:])
             groups = {}
             for doc in self._data:
-                key = doc.get(group_field)
+                key = get_key(doc)
                 if key not in groups:
                     groups[key] = []
                 groups[key].append(doc)
@@ -1321,32 +2319,33 @@ class AggregationCursor:
                         continue
                     if isinstance(expr, dict):
                         for op, val in expr.items():
+                            get = _path_getter(val[1:]) if isinstance(val, str) and val.startswith('$') else None
                             if op == '$sum':
                                 if isinstance(val, str) and val.startswith('$'):
-                                    grouped_doc[field] = sum(d.get(val[1:], 0) for d in docs if isinstance(d.get(val[1:]), (int, float)))
+                                    grouped_doc[field] = sum(get(d) for d in docs if isinstance(get(d), (int, float)))
                                 else:
                                     grouped_doc[field] = sum(val for d in docs)
                             elif op == '$avg':
                                 if isinstance(val, str) and val.startswith('$'):
-                                    vals = [d.get(val[1:]) for d in docs if isinstance(d.get(val[1:]), (int, float))]
+                                    vals = [get(d) for d in docs if isinstance(get(d), (int, float))]
                                     grouped_doc[field] = sum(vals) / len(vals) if vals else 0
                             elif op == '$count':
                                 grouped_doc[field] = len(docs)
                             elif op == '$min':
                                 if isinstance(val, str) and val.startswith('$'):
-                                    vals = [d.get(val[1:]) for d in docs if d.get(val[1:]) is not None]
+                                    vals = [get(d) for d in docs if get(d) is not None]
                                     grouped_doc[field] = min(vals) if vals else None
                             elif op == '$max':
                                 if isinstance(val, str) and val.startswith('$'):
-                                    vals = [d.get(val[1:]) for d in docs if d.get(val[1:]) is not None]
+                                    vals = [get(d) for d in docs if get(d) is not None]
                                     grouped_doc[field] = max(vals) if vals else None
                             elif op == '$first':
-                                grouped_doc[field] = docs[0].get(val[1:]) if val.startswith('$') else val
+                                grouped_doc[field] = get(docs[0]) if val.startswith('$') else val
                             elif op == '$last':
-                                grouped_doc[field] = docs[-1].get(val[1:]) if val.startswith('$') else val
+                                grouped_doc[field] = get(docs[-1]) if val.startswith('$') else val
                             elif op == '$push':
                                 if isinstance(val, str) and val.startswith('$'):
-                                    grouped_doc[field] = [d.get(val[1:]) for d in docs]
+                                    grouped_doc[field] = [get(d) for d in docs]
                                 else:
                                     grouped_doc[field] = [val] * len(docs)
                 result.append(grouped_doc)
@@ -1362,32 +2361,33 @@ class AggregationCursor:
                     continue
                 if isinstance(expr, dict):
                     for op, val in expr.items():
+                        get = _path_getter(val[1:]) if isinstance(val, str) and val.startswith('$') else None
                         if op == '$sum':
                             if isinstance(val, str) and val.startswith('$'):
-                                grouped_doc[field] = sum(d.get(val[1:], 0) for d in docs if isinstance(d.get(val[1:]), (int, float)))
+                                grouped_doc[field] = sum(get(d) for d in docs if isinstance(get(d), (int, float)))
                             else:
                                 grouped_doc[field] = sum(val for d in docs)
                         elif op == '$avg':
                             if isinstance(val, str) and val.startswith('$'):
-                                vals = [d.get(val[1:]) for d in docs if isinstance(d.get(val[1:]), (int, float))]
+                                vals = [get(d) for d in docs if isinstance(get(d), (int, float))]
                                 grouped_doc[field] = sum(vals) / len(vals) if vals else 0
                         elif op == '$count':
                             grouped_doc[field] = len(docs)
                         elif op == '$min':
                             if isinstance(val, str) and val.startswith('$'):
-                                vals = [d.get(val[1:]) for d in docs if d.get(val[1:]) is not None]
+                                vals = [get(d) for d in docs if get(d) is not None]
                                 grouped_doc[field] = min(vals) if vals else None
                         elif op == '$max':
                             if isinstance(val, str) and val.startswith('$'):
-                                vals = [d.get(val[1:]) for d in docs if d.get(val[1:]) is not None]
+                                vals = [get(d) for d in docs if get(d) is not None]
                                 grouped_doc[field] = max(vals) if vals else None
                         elif op == '$first':
-                            grouped_doc[field] = docs[0].get(val[1:]) if val.startswith('$') else val
+                            grouped_doc[field] = get(docs[0]) if val.startswith('$') else val
                         elif op == '$last':
-                            grouped_doc[field] = docs[-1].get(val[1:]) if val.startswith('$') else val
+                            grouped_doc[field] = get(docs[-1]) if val.startswith('$') else val
                         elif op == '$push':
                             if isinstance(val, str) and val.startswith('$'):
-                                grouped_doc[field] = [d.get(val[1:]) for d in docs]
+                                grouped_doc[field] = [get(d) for d in docs]
                             else:
                                 grouped_doc[field] = [val] * len(docs)
             
@@ -1848,7 +2848,7 @@ class AggregationCursor:
         new_data = []
         
         for doc in self._data:
-            new_doc = deepcopy(doc)  # Start with all existing fields
+            new_doc = dict(doc)  # Start with all existing fields
             
             # Add/compute new fields
             for field_name, expression in field_spec.items():
@@ -2177,10 +3177,12 @@ class AggregationCursor:
         for field, direction in sort_spec.items():
             sort_keys.append((field, direction if direction in [1, -1] else 1))
         
+        getters = [(_path_getter(field), direction) for field, direction in sort_keys]
+        
         def sort_key(record):
             values = []
-            for key, direction in sort_keys:
-                val = record.get(key)
+            for get_value, direction in getters:
+                val = get_value(record)
                 if val is None:
                     val = (1, None)
                 else:
@@ -2226,11 +3228,11 @@ class AggregationCursor:
             arr = _get_nested_value(doc, field_path)
             if isinstance(arr, list) and len(arr) > 0:
                 for item in arr:
-                    new_doc = deepcopy(doc)
+                    new_doc = _copy_path(doc, field_path)
                     _set_nested_value(new_doc, field_path, item)
                     new_data.append(new_doc)
             elif preserve_nulls:
-                new_data.append(deepcopy(doc))
+                new_data.append(doc)
         
         self._data = new_data
         return self
@@ -2305,8 +3307,7 @@ class AggregationCursor:
         
         if foreign_collection is None:
             # Foreign collection not found - set empty arrays
-            for doc in self._data:
-                doc[output_field] = []
+            self._data = [dict(doc, **{output_field: []}) for doc in self._data]
             return self
         
         # Fetch all foreign documents
@@ -2362,7 +3363,7 @@ class AggregationCursor:
                     if pipeline_match:
                         matched_docs.append(foreign_doc)
                 
-                result_doc = deepcopy(doc)
+                result_doc = dict(doc)
                 result_doc[output_field] = matched_docs
                 new_data.append(result_doc)
             
@@ -2372,12 +3373,27 @@ class AggregationCursor:
             local_field = lookup_spec.get('localField')
             foreign_field = lookup_spec.get('foreignField')
             
+            # Hash join: bucket foreign docs by foreignField once, so each
+            # local document (e.g. joining on _id) is matched in O(1)
+            buckets: Optional[Dict[Any, List[Dict]]] = {}
+            for d in foreign_docs:
+                try:
+                    buckets.setdefault(d.get(foreign_field), []).append(d)
+                except TypeError:
+                    buckets = None  # Unhashable foreign values: nested loop
+                    break
+            
             # Perform join
             new_data = []
             for doc in self._data:
                 local_value = doc.get(local_field)
-                matched = [d for d in foreign_docs if d.get(foreign_field) == local_value]
-                result_doc = deepcopy(doc)
+                try:
+                    if buckets is None:
+                        raise TypeError
+                    matched = list(buckets.get(local_value, ()))
+                except TypeError:
+                    matched = [d for d in foreign_docs if d.get(foreign_field) == local_value]
+                result_doc = dict(doc)
                 result_doc[output_field] = matched
                 new_data.append(result_doc)
             
@@ -2527,8 +3543,7 @@ class AggregationCursor:
         
         if foreign_collection is None:
             # Foreign collection not found - set empty arrays
-            for doc in self._data:
-                doc[output_field] = []
+            self._data = [dict(doc, **{output_field: []}) for doc in self._data]
             return self
         
         # Fetch all foreign documents (apply restrictSearchWithMatch if provided)
@@ -2539,7 +3554,7 @@ class AggregationCursor:
         
         new_data = []
         for doc in self._data:
-            result_doc = deepcopy(doc)
+            result_doc = dict(doc)
             
             # Evaluate startWith expression for this document
             if isinstance(start_with, str) and start_with.startswith('$'):
@@ -2599,7 +3614,7 @@ class AggregationCursor:
                         
                         # Add depth field if requested
                         if depth_field:
-                            match_doc = deepcopy(foreign_doc)
+                            match_doc = dict(foreign_doc)
                             match_doc[depth_field] = depth
                             graph_results.append(match_doc)
                         else:
@@ -2677,17 +3692,15 @@ class AggregationCursor:
             #   "by_price": [{"expensive_count": 42}]
             # }]
         """
-        from copy import deepcopy
-        
-        # Store original input data
-        original_data = deepcopy(self._data)
+        # Store original input data (stages never modify input documents)
+        original_data = self._data
         
         # Process each facet pipeline independently
         facet_results = {}
         
         for facet_name, pipeline in facet_spec.items():
             # Create a fresh cursor with the original data for this facet
-            facet_cursor = AggregationCursor(deepcopy(original_data), self._db)
+            facet_cursor = AggregationCursor(original_data, self._db)
             
             # Execute each stage in this facet's pipeline
             for stage in pipeline:
@@ -2724,10 +3737,19 @@ class AggregationCursor:
         self._data = [facet_results]
         return self
     
-    def aggregate(self, pipeline: List[Dict]) -> 'AggregationCursor':
-        """Execute aggregation pipeline stages."""
+    def aggregate(self, pipeline: List[Dict],
+                  profile: Optional[List[Dict]] = None) -> 'AggregationCursor':
+        """Execute aggregation pipeline stages.
+        
+        Args:
+            pipeline: Aggregation stages
+            profile: Optional list that receives one entry per stage with
+                its spec, output document count and execution time
+        """
+        import time
         for stage in pipeline:
             for op, spec in stage.items():
+                stage_start = time.perf_counter()
                 if op == '$match':
                     self._match(spec)
                 elif op == '$group':
@@ -2756,6 +3778,10 @@ class AggregationCursor:
                     self._bucket_auto(spec)
                 elif op == '$addFields':
                     self._add_fields(spec)
+                if profile is not None:
+                    profile.append({op: spec, 'nReturned': len(self._data),
+                                    'executionTimeMillis': round((time.perf_counter() - stage_start) * 1000, 3)})
+        self._data = [_CopyOnWriteDict(doc) for doc in self._data]
         return self
     
     def all(self) -> List[Dict]:
@@ -2787,40 +3813,643 @@ class AggregationCursor:
         return self._data[index]
 
 
+class _EmptyArrayKey:
+    """Index key of arrays without indexable elements ([] or only sub-documents).
+    
+    MongoDB indexes an empty array as undefined; the key keeps such
+    documents in non-sparse multikey indexes, so a full index scan still
+    sees every document. No query value equals it. A singleton, also
+    across copies (transaction backups deep-copy the indexes).
+    """
+    __slots__ = ()
+    
+    def __repr__(self) -> str:
+        return '_EMPTY_ARRAY'
+    
+    def __copy__(self) -> '_EmptyArrayKey':
+        return self
+    
+    def __deepcopy__(self, memo: Dict) -> '_EmptyArrayKey':
+        return self
+    
+    def __reduce__(self) -> str:
+        return '_EMPTY_ARRAY'
+
+
+_EMPTY_ARRAY = _EmptyArrayKey()
+
+
+def _index_order_key(value: Any) -> Optional[Tuple]:
+    """Map an index key to a totally ordered (type rank, value) pair.
+    
+    Values of different types never compare directly: the empty array key
+    sorts first, then None, numbers, strings, binary and datetimes. Returns
+    None for types without a natural order, which makes the index
+    hash-only.
+    """
+    if value is _EMPTY_ARRAY:
+        return (-1, value)  # Below every range bound
+    if value is None:
+        return (0, None)
+    if isinstance(value, (int, float, Decimal)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, bytes):
+        return (3, value)
+    if isinstance(value, datetime):
+        return (4, value)
+    return None
+
+
+def _hash_key(value: Any) -> int:
+    """Map a value to the 64-bit key stored by hashed indexes.
+    
+    Uses the built-in hash, which is consistent with equality (1, 1.0 and
+    True share a key) and only has to be stable for the process lifetime,
+    since indexes are rebuilt from the data on load. Sub-documents and arrays
+    are frozen first. Distinct values may collide, so matches found through
+    a hashed key are always verified against the document.
+    """
+    try:
+        return hash(value)
+    except TypeError:
+        return hash(_freeze(value))
+
+
+def _collation_strength(collation: Any) -> int:
+    """Validate a collation document and return its comparison strength.
+    
+    Like MongoDB, strength 1 ignores case and diacritics, 2 ignores case
+    and 3 (the default) compares strings as they are.
+    
+    Raises:
+        ValueError: If the collation has no locale or an unsupported strength
+    """
+    if not isinstance(collation, dict) or not isinstance(collation.get('locale'), str):
+        raise ValueError(f"collation needs a locale: {collation!r}")
+    strength = collation.get('strength', 3)
+    if strength not in (1, 2, 3) or isinstance(strength, bool):
+        raise ValueError(f"unsupported collation strength: {strength!r}")
+    return strength
+
+
+def _collation_key(value: Any, strength: int) -> Any:
+    """Map a value to its key in an index with a collation.
+    
+    Strings are case-folded below strength 3, and stripped of combining
+    marks at strength 1; other values are unchanged. Folding works
+    character by character, so a string starting with a prefix folds to a
+    string starting with the folded prefix -- though re.IGNORECASE may
+    match a character whose folded form is different (see _regex_prefix).
+    """
+    if not isinstance(value, str) or strength >= 3:
+        return value
+    value = value.casefold()
+    if strength == 1:
+        value = ''.join(char for char in unicodedata.normalize('NFD', value)
+                        if not unicodedata.combining(char))
+    return value
+
+
+# $options letters and their re flags
+_REGEX_FLAGS = {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'x': re.VERBOSE}
+
+# Characters that end the literal part of a pattern
+_REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+
+
+def _regex_with_options(condition: Dict) -> Dict:
+    """Fold $options into a compiled $regex, keeping the other operators.
+    
+    Raises:
+        ValueError: If $options comes without $regex or has unknown letters
+    """
+    if '$regex' not in condition:
+        raise ValueError("$options needs a $regex")
+    options = condition['$options'] or ''
+    flags = 0
+    for option in options:
+        if option not in _REGEX_FLAGS:
+            raise ValueError(f"unsupported $options: {options!r}")
+        flags |= _REGEX_FLAGS[option]
+    pattern = condition['$regex']
+    if isinstance(pattern, re.Pattern):
+        pattern, flags = pattern.pattern, flags | pattern.flags
+    folded = {operator: operand for operator, operand in condition.items() if operator != '$options'}
+    folded['$regex'] = re.compile(pattern, flags)
+    return folded
+
+
+def _regex_prefix(pattern: Any) -> Optional[Tuple[str, bool]]:
+    """Extract the literal prefix of a regular expression anchored with ^.
+    
+    Every string the pattern matches starts with the prefix (ignoring case
+    if the pattern does), so an ordered index can narrow the search to a
+    key range. Case-insensitive prefixes stop before the first character
+    that case-folds to several, since its folded form does not prefix the
+    folded forms of everything it matches.
+    
+    Args:
+        pattern: Pattern string or compiled pattern
+    
+    Returns:
+        Tuple of (prefix, ignore_case), or None for unanchored patterns,
+        patterns without a literal prefix, alternations and multiline or
+        verbose patterns
+    """
+    try:
+        compiled = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern)
+    except (TypeError, re.error):
+        return None
+    source, flags = compiled.pattern, compiled.flags  # Includes inline flags
+    if not isinstance(source, str) or flags & (re.MULTILINE | re.VERBOSE) or '|' in source:
+        return None
+    if source.startswith('^'):
+        pos = 1
+    elif source.startswith('\\A'):
+        pos = 2
+    else:
+        return None
+    prefix = []
+    while pos < len(source):
+        char, step = source[pos], 1
+        if char == '\\':
+            char, step = source[pos + 1:pos + 2], 2
+            if not char or char.isalnum():
+                break  # Character classes, anchors and backreferences
+        elif char in _REGEX_SPECIAL:
+            break
+        if source[pos + step:pos + step + 1] in ('*', '?', '{'):
+            break  # The character may be absent
+        if flags & re.IGNORECASE and len(char.casefold()) != 1:
+            break  # "İ" folds to "i̇" yet matches "i": no single folded range
+        prefix.append(char)
+        pos += step
+    if not prefix:
+        return None
+    return ''.join(prefix), bool(flags & re.IGNORECASE)
+
+
+def _prefix_upper(prefix: str) -> Optional[str]:
+    """Return the least string above every string starting with a prefix.
+    
+    Returns None when there is no such string (prefixes of the highest code
+    point only).
+    """
+    stripped = prefix.rstrip(chr(sys.maxunicode))
+    if not stripped:
+        return None
+    return stripped[:-1] + chr(ord(stripped[-1]) + 1)
+
+
+# Posting lists of integer ids are sorted array('q'): 8 bytes per id
+_POSTING_TYPECODE = 'q'
+_POSTING_MIN = -(1 << 63)
+_POSTING_MAX = (1 << 63) - 1
+
+
+def _new_postings(doc_id: Any) -> Any:
+    """Create the posting list of a new index key holding one document id."""
+    if type(doc_id) is int and _POSTING_MIN <= doc_id <= _POSTING_MAX:
+        return array(_POSTING_TYPECODE, (doc_id,))
+    return {doc_id}
+
+
+def _posting_add(postings: Any, doc_id: Any) -> Any:
+    """Add a document id to a posting list.
+    
+    Integer ids are kept in a sorted array, located by binary search (ids
+    mostly arrive in increasing order and are appended). Another id turns
+    the array into a set, which holds ids of any hashable type.
+    
+    Returns:
+        The posting list to store (a new set after a conversion), or None
+        if the id was already present
+    """
+    if isinstance(postings, array):
+        if type(doc_id) is int and _POSTING_MIN <= doc_id <= _POSTING_MAX:
+            if not postings or doc_id > postings[-1]:
+                postings.append(doc_id)
+                return postings
+            pos = bisect_left(postings, doc_id)
+            if postings[pos] == doc_id:
+                return None
+            postings.insert(pos, doc_id)
+            return postings
+        postings = set(postings)
+    elif doc_id in postings:
+        return None
+    postings.add(doc_id)
+    return postings
+
+
+def _posting_discard(postings: Any, doc_id: Any) -> bool:
+    """Remove a document id from a posting list; True if it was present."""
+    if isinstance(postings, array):
+        if type(doc_id) is not int:
+            return False
+        pos = bisect_left(postings, doc_id)
+        if pos < len(postings) and postings[pos] == doc_id:
+            del postings[pos]
+            return True
+        return False
+    if doc_id in postings:
+        postings.discard(doc_id)
+        return True
+    return False
+
+
+def _merge_postings(postings: Iterable[Any]) -> List[Any]:
+    """Union posting lists into one list of ids, sorted when the ids order.
+    
+    Arrays are sorted runs, so sorting their concatenation only merges them.
+    A document under several keys (multikey indexes) is listed once per key.
+    """
+    ids: List[Any] = []
+    runs = 0
+    for run in postings:
+        ids.extend(run)
+        runs += 1
+    if runs > 1:
+        try:
+            ids.sort()
+        except TypeError:
+            pass  # Ids of mixed types keep key order
+    return ids
+
+
+def _intersect_postings(id_lists: List[Any]) -> List[Any]:
+    """Intersect id lists, shortest first.
+    
+    The lists are sorted (linear for posting arrays, which already are) and
+    each id of the shortest is looked up in the others by binary search
+    from the previous position, so long lists are never fully walked or
+    hashed. Ids that do not order fall back to set lookups.
+    
+    Args:
+        id_lists: Id lists ordered by length
+    
+    Returns:
+        Ids present in every list, sorted when the ids order
+    """
+    try:
+        shortest = sorted(id_lists[0])
+        others = [sorted(ids) for ids in id_lists[1:]]
+    except TypeError:
+        sets = [set(ids) for ids in id_lists[1:]]
+        return [doc_id for doc_id in id_lists[0] if all(doc_id in other for other in sets)]
+    result = []
+    positions = [0] * len(others)
+    for doc_id in shortest:
+        for i, other in enumerate(others):
+            pos = positions[i] = bisect_left(other, doc_id, positions[i])
+            if pos == len(other) or other[pos] != doc_id:
+                break
+        else:
+            result.append(doc_id)
+    return result
+
+
+# Bit positions set in each byte value, for turning bitmaps back into ids
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256))
+
+
+def _bit_positions(bits: int) -> List[int]:
+    """List the positions of the set bits of an integer, in increasing order."""
+    positions: List[int] = []
+    raw = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(raw):
+        if byte:
+            base = index << 3
+            positions.extend(base + bit for bit in _BYTE_BITS[byte])
+    return positions
+
+
+def _popcount(bits: int) -> int:
+    """Count the set bits of a non-negative integer."""
+    if hasattr(bits, 'bit_count'):
+        return bits.bit_count()  # Python 3.10+
+    return bin(bits).count('1')
+
+
+_BOUND_OPERATORS = {'$gt': 'gt', '$gte': 'gte', '$lt': 'lt', '$lte': 'lte'}
+
+
+def _condition_atoms(filter: Dict, strict: bool = False) -> Optional[List[Tuple[str, str, Any]]]:
+    """Split a filter into single-field conjuncts, for implication checks.
+    
+    Conjuncts are (field, kind, operand): "eq" with a list of values (from
+    equality, $eq and $in), "gt", "gte", "lt" or "lte" with a bound, and
+    "exists" (for {"$exists": True}). Top-level $and is flattened. Other
+    conditions are dropped, which is sound on the implying side (dropping a
+    conjunct only widens a filter); with ``strict`` they make the result
+    None instead, since a partial filter expression must be understood
+    completely.
+    
+    Args:
+        filter: Query filter or partial filter expression
+        strict: Reject conditions that cannot be represented
+    
+    Returns:
+        List of conjuncts, or None if ``strict`` and some condition is
+        not supported
+    """
+    atoms: List[Tuple[str, str, Any]] = []
+    items = list(filter.items())
+    while items:
+        field, condition = items.pop(0)
+        if field == '$and' and isinstance(condition, list) and all(isinstance(c, dict) for c in condition):
+            for sub in condition:
+                items.extend(sub.items())
+            continue
+        if not isinstance(field, str) or field.startswith('$'):
+            if strict:
+                return None
+            continue
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for operator, operand in condition.items():
+            if operator == '$eq':
+                atom = (field, 'eq', [operand])
+            elif operator == '$in' and isinstance(operand, (list, tuple)):
+                atom = (field, 'eq', list(operand))
+            elif operator in _BOUND_OPERATORS and _index_order_key(operand) not in (None, (0, None)):
+                atom = (field, _BOUND_OPERATORS[operator], operand)
+            elif operator == '$exists' and operand is True:
+                atom = (field, 'exists', None)
+            elif strict:
+                return None
+            else:
+                continue
+            if strict and atom[1] == 'eq' and any(isinstance(v, (dict, list)) for v in atom[2]):
+                return None
+            atoms.append(atom)
+    return atoms
+
+
+def _satisfies_bound(value: Any, kind: str, bound: Any) -> bool:
+    """Check value against a gt/gte/lt/lte bound, with type bracketing."""
+    value_key, bound_key = _index_order_key(value), _index_order_key(bound)
+    if value_key is None or bound_key is None or value_key[0] != bound_key[0]:
+        return False
+    try:
+        if kind == 'gt':
+            return value > bound
+        if kind == 'gte':
+            return value >= bound
+        if kind == 'lt':
+            return value < bound
+        return value <= bound
+    except TypeError:
+        return False
+
+
+def _atom_implies(kind: str, operand: Any, expected_kind: str, expected: Any) -> bool:
+    """Check whether a filter conjunct implies an expression conjunct on the same field."""
+    if expected_kind == 'exists':
+        if kind == 'eq':
+            return all(value is not None for value in operand)
+        return True  # Bounds and $exists all require the field
+    if kind == 'exists':
+        return False
+    if expected_kind == 'eq':
+        return kind == 'eq' and all(value in expected for value in operand)
+    if kind == 'eq':
+        return all(_satisfies_bound(value, expected_kind, expected) for value in operand)
+    if kind[0] != expected_kind[0]:
+        return False  # A lower bound never implies an upper bound
+    if kind == expected_kind or kind in ('gt', 'lt'):
+        # As strict as the expected bound: must be at least as tight
+        return _satisfies_bound(operand, expected_kind[0] + 'te', expected)
+    # Inclusive bound against a strict one: must be strictly tighter
+    return _satisfies_bound(operand, expected_kind, expected)
+
+
+def _filter_implies(filter: Dict, expression: Dict) -> bool:
+    """Check whether every document matching a filter matches an expression.
+    
+    A conservative test: each conjunct of the expression must follow from a
+    single top-level conjunct of the filter on the same field. Used to
+    decide whether a partial index holds every match of a query.
+    
+    Args:
+        filter: Query filter
+        expression: Partial filter expression
+    
+    Returns:
+        True if the implication is proven
+    """
+    expected = _condition_atoms(expression, strict=True)
+    if not expected or not isinstance(filter, dict):
+        return False
+    given = _condition_atoms(filter)
+    return all(any(field == expected_field and _atom_implies(kind, operand, expected_kind, operand_expected)
+                   for field, kind, operand in given)
+               for expected_field, expected_kind, operand_expected in expected)
+
+
+def _filter_shape(filter: Dict, params: List[Any]) -> Optional[Tuple]:
+    """Normalize a filter to its shape, collecting its values in order.
+    
+    The shape keeps field paths, operators and whether operands are
+    sequences, and replaces values with positions in ``params``. Filters
+    using callables, $near or unknown top-level operators have no shape.
+    
+    Args:
+        filter: Query filter
+        params: List the filter values are appended to
+    
+    Returns:
+        Hashable shape, or None if the filter cannot be normalized
+    """
+    def condition_shape(condition: Any) -> Any:
+        if not isinstance(condition, dict):
+            params.append(condition)
+            return 'eq'
+        if not condition or '$near' in condition:
+            raise TypeError
+        if '$options' in condition:
+            try:
+                condition = _regex_with_options(condition)
+            except (ValueError, re.error):
+                raise TypeError  # Left to _match_filter, which reports it
+        operators = []
+        for operator, operand in condition.items():
+            if not isinstance(operator, str):
+                raise TypeError
+            if operator == '$not':
+                operators.append((operator, condition_shape(operand)))
+            else:
+                params.append(operand)
+                operators.append((operator, 'seq' if isinstance(operand, (list, tuple)) else 'val'))
+        return ('ops', tuple(operators))
+    
+    def shape_of(sub_filter: Any) -> Tuple:
+        if not isinstance(sub_filter, dict):
+            raise TypeError
+        items = []
+        for key, condition in sub_filter.items():
+            if key in ('$or', '$and', '$nor'):
+                if not isinstance(condition, (list, tuple)):
+                    raise TypeError
+                items.append((key, tuple(shape_of(sub) for sub in condition)))
+            elif key == '$not':
+                items.append((key, shape_of(condition)))
+            elif isinstance(key, str) and not key.startswith('$'):
+                items.append((key, condition_shape(condition)))
+            else:
+                raise TypeError
+        return tuple(items)
+    
+    try:
+        return shape_of(filter)
+    except TypeError:
+        return None
+
+
+_MISSING = object()  # Absent field marker for document comparisons
+
+
+def _filter_fields(filter: Dict) -> Optional[FrozenSet[str]]:
+    """Collect the field paths a filter reads, for cache invalidation.
+    
+    Returns:
+        Frozen set of dotted paths, or None if the filter has callable or
+        unknown top-level keys and may read anything
+    """
+    fields = set()
+    
+    def collect(sub_filter: Any) -> bool:
+        if not isinstance(sub_filter, dict):
+            return False
+        for key, condition in sub_filter.items():
+            if key in ('$or', '$and', '$nor'):
+                if not isinstance(condition, (list, tuple)) or not all(collect(sub) for sub in condition):
+                    return False
+            elif key == '$not':
+                if not collect(condition):
+                    return False
+            elif not isinstance(key, str) or key.startswith('$'):
+                return False
+            else:
+                fields.add(key)
+        return True
+    
+    return frozenset(fields) if collect(filter) else None
+
+
+def _paths_overlap(a: str, b: str) -> bool:
+    """Check whether one dotted path equals or contains the other."""
+    if a == b:
+        return True
+    if len(a) < len(b):
+        return b.startswith(a) and b[len(a)] == '.'
+    return a.startswith(b) and a[len(b)] == '.'
+
+
+def _changed_paths(old: Dict, new: Dict, prefix: str = '') -> List[str]:
+    """List the dotted paths whose values differ between two documents.
+    
+    Sub-documents present on both sides are compared field by field, so
+    {"$set": {"address.zip": ...}} reports "address.zip", not "address".
+    """
+    paths = []
+    for key in old.keys() | new.keys():
+        if not isinstance(key, str):
+            continue
+        old_value, new_value = old.get(key, _MISSING), new.get(key, _MISSING)
+        if old_value is new_value or old_value == new_value and type(old_value) is type(new_value):
+            continue
+        path = prefix + key
+        if isinstance(old_value, dict) and isinstance(new_value, dict):
+            paths.extend(_changed_paths(old_value, new_value, path + '.'))
+        else:
+            paths.append(path)
+    return paths
+
+
+class _Descending:
+    """Sort key wrapper that inverts the order of any comparable value."""
+    
+    __slots__ = ('value',)
+    
+    def __init__(self, value: Any):
+        self.value = value
+    
+    def __lt__(self, other: '_Descending') -> bool:
+        return other.value < self.value
+    
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Descending) and self.value == other.value
+
+
 class IndexManager:
     """Manages indexes for JSONlite database.
     
     Supports:
     - Single-field indexes
     - Compound indexes (multi-field)
+    - Multikey indexes (one key per array element)
     - Unique indexes
     - Sparse indexes (only index documents with the field)
+    - Hashed indexes (a 64-bit hash per key, for equality on large values)
+    - Partial indexes (only index documents matching a filter expression)
+    - Bitmap indexes (a bitset of _ids per value, for low-cardinality fields)
+    - Collations (case-folded keys, for case-insensitive prefix searches)
     - Automatic index maintenance on insert/update/delete
     """
     
-    def __init__(self):
+    def __init__(self, compile_filter: Optional[Callable[[Dict], Callable[[Dict], bool]]] = None):
+        """Initialize the index manager.
+        
+        Args:
+            compile_filter: Turns a filter into a document predicate; needed
+                for partial indexes
+        """
         self._indexes: Dict[str, Dict] = {}  # index_name -> {keys, unique, sparse, data}
+        self._compile_filter = compile_filter
     
     def create_index(self, keys: Union[str, List[Tuple[str, int]]], 
                      unique: bool = False, 
                      sparse: bool = False,
-                     name: Optional[str] = None) -> str:
+                     name: Optional[str] = None,
+                     partial_filter_expression: Optional[Dict] = None,
+                     collation: Optional[Dict] = None, auto: bool = False) -> str:
         """Create an index on specified field(s).
         
         Args:
-            keys: Field name (str) or list of (field, direction) tuples
+            keys: Field name (str) or list of (field, direction) tuples;
+                direction "hashed" makes a hashed index, "bitmap" a bitmap
+                index
             unique: If True, enforce uniqueness
             sparse: If True, only index documents with the field
             name: Optional index name (auto-generated if not provided)
+            partial_filter_expression: Only index documents matching this
+                filter (equality, $in, $gt/$gte/$lt/$lte, $exists: True and
+                $and); queries use the index only when they imply it
+            collation: {"locale": ..., "strength": 1, 2 or 3}; string keys
+                are folded per _collation_key, and the index only serves
+                anchored $regex prefixes (ignoring case below strength 3)
+            auto: Whether the auto_index policy built the index (listed and
+                persisted, so the policy may drop it again after a reopen)
         
         Returns:
             Index name
         
+        Raises:
+            ValueError: If the index exists, a hashed or bitmap index is
+                compound, unique or has a collation, or the partial filter
+                expression or collation is not supported
+        
         Examples:
             create_index("age")  # Single field
             create_index([("age", 1), ("name", -1)])  # Compound index
             create_index("email", unique=True)  # Unique index
             create_index("optional_field", sparse=True)  # Sparse index
+            create_index([("url", "hashed")])  # Hashed index
+            create_index([("status", "bitmap")])  # Bitmap index
+            create_index("name", collation={"locale": "en", "strength": 2})
         """
         # Normalize keys to list of tuples
         if isinstance(keys, str):
@@ -2828,6 +4457,32 @@ class IndexManager:
         else:
             keys_list = keys
         
+        # Hashed indexes store _hash_key(value) instead of the value: keys
+        # have a fixed size but no order, so they only serve equality
+        hashed = any(direction == 'hashed' for _, direction in keys_list)
+        if hashed and len(keys_list) > 1:
+            raise ValueError("hashed indexes must have a single field")
+        if hashed and unique:
+            raise ValueError("hashed indexes cannot be unique")
+        # Bitmap indexes keep a bitset per value, bit n standing for _id n
+        # (auto-generated _ids are dense integers)
+        bitmap = any(direction == 'bitmap' for _, direction in keys_list)
+        if bitmap and (len(keys_list) > 1 or unique):
+            raise ValueError("bitmap indexes must have a single field and cannot be unique")
+        strength = None
+        if collation is not None:
+            strength = _collation_strength(collation)
+            if hashed or bitmap:
+                raise ValueError("hashed and bitmap indexes cannot have a collation")
+        if partial_filter_expression is not None:
+            if sparse:
+                raise ValueError("cannot mix sparse and partialFilterExpression")
+            if (not isinstance(partial_filter_expression, dict)
+                    or not _condition_atoms(partial_filter_expression, strict=True)):
+                raise ValueError(f"unsupported partialFilterExpression: {partial_filter_expression!r}")
+            if self._compile_filter is None:
+                raise ValueError("partial indexes need a filter compiler")
+        
         # Generate index name if not provided
         if name is None:
             name_parts = []
@@ -2838,11 +4493,52 @@ class IndexManager:
         if name in self._indexes:
             raise ValueError(f"Index '{name}' already exists")
         
+        partial_match = None
+        if partial_filter_expression is not None:
+            partial_match = self._compile_filter(partial_filter_expression)
+        
+        if bitmap:
+            self._indexes[name] = {
+                'keys': keys_list,
+                'unique': False,
+                'sparse': sparse,
+                'bitmap': True,
+                'partial': partial_filter_expression,
+                'partial_match': partial_match,
+                'bitmaps': {},  # value -> bytearray, bit n set for _id n
+                'counts': {},  # value -> number of set bits
+                'sorted_keys': None,
+                'multikey': False,
+                'auto': auto
+            }
+            return name
+        
         self._indexes[name] = {
             'keys': keys_list,
             'unique': unique,
             'sparse': sparse,
-            'data': {}  # value -> list of _id
+            'data': {},  # value (or its hash) -> list of _id
+            'hashed': hashed,
+            # Filter documents must match to be indexed, and its predicate
+            'partial': partial_filter_expression,
+            'partial_match': partial_match,
+            # Collation document and its strength; keys are folded with
+            # _collation_key, so they no longer compare like the values
+            'collation': collation,
+            'strength': strength,
+            # Ordered keys of single-field indexes, for range scans and sorts
+            'sorted_keys': [] if len(keys_list) == 1 and not hashed else None,
+            # Statistics for the cost model: total postings and a histogram
+            # of posting list lengths (bucket = length.bit_length())
+            'entries': 0,
+            'histogram': {},
+            # Set once a document has an array value: keys are elements, so
+            # a document may have several keys (one, _EMPTY_ARRAY, for [])
+            'multikey': False,
+            # Numeric types stored per key field: 1, 1.0, True and Decimal(1)
+            # share a key, which names the stored value only for one type
+            'numeric_types': None if hashed else [set() for _ in keys_list],
+            'auto': auto
         }
         
         return name
@@ -2887,12 +4583,19 @@ class IndexManager:
                     'precision': info['precision']
                 })
             else:
-                result.append({
+                entry = {
                     'name': name,
                     'keys': info['keys'],
                     'unique': info['unique'],
                     'sparse': info['sparse']
-                })
+                }
+                if info.get('partial') is not None:
+                    entry['partialFilterExpression'] = info['partial']
+                if info.get('collation') is not None:
+                    entry['collation'] = info['collation']
+                if info.get('auto'):
+                    entry['auto'] = True
+                result.append(entry)
         return result
     
     def get_index(self, name: str) -> Optional[Dict]:
@@ -2906,32 +4609,402 @@ class IndexManager:
         """
         if name in self._indexes:
             info = self._indexes[name]
-            return {
+            entry = {
                 'name': name,
                 'keys': info['keys'],
                 'unique': info['unique'],
                 'sparse': info['sparse']
             }
+            if info.get('partial') is not None:
+                entry['partialFilterExpression'] = info['partial']
+            if info.get('collation') is not None:
+                entry['collation'] = info['collation']
+            if info.get('auto'):
+                entry['auto'] = True
+            return entry
         return None
     
-    def _get_key_value(self, doc: Dict, keys: List[Tuple[str, int]]) -> Optional[Tuple]:
-        """Extract index key value from document.
+    def _get_key_values(self, info: Dict, doc: Dict) -> List[Any]:
+        """Extract the index keys of a document.
+        
+        Array values (also those reached through dotted paths) contribute
+        one key per distinct element and flag the index as multikey; an
+        array with no indexable element (sub-documents are not indexed,
+        so also [] alone) contributes the _EMPTY_ARRAY key. As in MongoDB, a compound index may hold at most one array
+        field per document.
         
         Args:
-            doc: Document to extract key from
-            keys: List of (field, direction) tuples
+            info: Index info
+            doc: Document to extract keys from
         
         Returns:
-            Tuple of values or None if any field is missing (for sparse indexes)
+            List of keys (a tuple per key for compound indexes, hashes for
+            hashed indexes); [None] if a field is missing (skipped by sparse
+            indexes)
+        
+        Raises:
+            ValueError: If two fields of a compound index hold arrays
         """
-        values = []
-        for field, direction in keys:
-            value = _get_nested_value(doc, field)
+        choices = []
+        array_field = None
+        for field, direction in info['keys']:
+            value = _path_getter(field, True)(doc)
             if value is None:
-                return None  # Missing field, skip for sparse index
-            values.append(value)
-        return tuple(values) if len(values) > 1 else values[0]
-    
+                return [None]  # Missing field, skip for sparse index
+            if not isinstance(value, list):
+                choices.append((value,))
+                continue
+            if array_field is not None:
+                raise ValueError(f"cannot index parallel arrays [{array_field}] [{field}]")
+            array_field = field
+            info['multikey'] = True
+            elements = {}
+            for item in value:
+                if not isinstance(item, (dict, list)):
+                    elements[item] = None
+            choices.append(tuple(elements) or (_EMPTY_ARRAY,))
+        strength = info.get('strength')
+        if strength is not None:
+            choices = [tuple(dict.fromkeys(_collation_key(value, strength) for value in options))
+                       for options in choices]
+        if len(choices) == 1:
+            if info.get('hashed'):
+                return [_hash_key(value) for value in choices[0]]
+            return list(choices[0])
+        return list(product(*choices))
+    
+    def _document_keys(self, info: Dict, doc: Dict) -> List[Any]:
+        """Extract the index keys of a document, none if a partial index excludes it."""
+        partial_match = info.get('partial_match')
+        if partial_match is not None and not partial_match(doc):
+            return []
+        return self._get_key_values(info, doc)
+    
+    @staticmethod
+    def _usable(info: Dict, filter: Optional[Dict]) -> bool:
+        """Check whether an index holds every match of a filter.
+        
+        Partial indexes only do for filters implying their expression.
+        """
+        partial = info.get('partial')
+        return partial is None or (filter is not None and _filter_implies(filter, partial))
+    
+    def is_usable(self, name: str, filter: Optional[Dict]) -> bool:
+        """Check whether a named index may serve a filter.
+        
+        Args:
+            name: Index name
+            filter: Query filter
+        
+        Returns:
+            False for unknown indexes and for partial indexes whose
+            expression the filter does not imply
+        """
+        info = self._indexes.get(name)
+        return info is not None and self._usable(info, filter)
+    
+    def _add_posting(self, name: str, info: Dict, key: Any, doc_id: Any) -> None:
+        """Add a document id under a key, enforcing uniqueness."""
+        if info.get('bitmap'):
+            self._set_bit(info, key, doc_id)
+            return
+        numeric_types = info.get('numeric_types')
+        if numeric_types is not None:
+            for types, value in zip(numeric_types, key if len(numeric_types) > 1 else (key,)):
+                if isinstance(value, (int, float, Decimal)):
+                    types.add(type(value))
+        data = info['data']
+        postings = data.get(key)
+        if postings is None:
+            data[key] = _new_postings(doc_id)
+            self._insert_sorted_key(info, key)
+            self._note_posting_size(info, 0, 1)
+            return
+        if info['unique'] and doc_id not in postings:
+            raise ValueError(f"Duplicate key error for index '{name}': {key}")
+        updated = _posting_add(postings, doc_id)
+        if updated is None:
+            return
+        if updated is not postings:
+            data[key] = updated
+        self._note_posting_size(info, len(updated) - 1, len(updated))
+    
+    def _remove_posting(self, info: Dict, key: Any, doc_id: Any) -> None:
+        """Remove a document id from a key, dropping the key once empty."""
+        if info.get('bitmap'):
+            self._clear_bit(info, key, doc_id)
+            return
+        postings = info['data'].get(key)
+        if postings is None:
+            return
+        if _posting_discard(postings, doc_id):
+            self._note_posting_size(info, len(postings) + 1, len(postings))
+        if not postings:
+            del info['data'][key]
+            self._discard_sorted_key(info, key)
+    
+    def _set_bit(self, info: Dict, key: Any, doc_id: Any) -> None:
+        """Set the bit of a document id in the bitset of a key."""
+        if type(doc_id) is not int or doc_id < 0:
+            raise ValueError(f"bitmap indexes need non-negative integer _ids, got {doc_id!r}")
+        bits = info['bitmaps'].get(key)
+        if bits is None:
+            bits = info['bitmaps'][key] = bytearray()
+        byte, mask = doc_id >> 3, 1 << (doc_id & 7)
+        if byte >= len(bits):
+            bits.extend(bytes(byte + 1 - len(bits)))
+        if not bits[byte] & mask:
+            bits[byte] |= mask
+            info['counts'][key] = info['counts'].get(key, 0) + 1
+    
+    def _clear_bit(self, info: Dict, key: Any, doc_id: Any) -> None:
+        """Clear the bit of a document id, dropping the key once empty."""
+        bits = info['bitmaps'].get(key)
+        if bits is None or type(doc_id) is not int or doc_id < 0:
+            return
+        byte, mask = doc_id >> 3, 1 << (doc_id & 7)
+        if byte < len(bits) and bits[byte] & mask:
+            bits[byte] &= ~mask
+            info['counts'][key] -= 1
+            if not info['counts'][key]:
+                del info['bitmaps'][key]
+                del info['counts'][key]
+    
+    def bitmap_index_for_field(self, field: str, filter: Optional[Dict] = None) -> Optional[str]:
+        """Find a bitmap index on a field.
+        
+        Args:
+            field: Field name
+            filter: Query filter; partial indexes are only returned when it
+                implies their expression
+        
+        Returns:
+            Index name or None
+        """
+        for name, info in self._indexes.items():
+            if info.get('bitmap') and info['keys'][0][0] == field and self._usable(info, filter):
+                return name
+        return None
+    
+    def bitmap_match(self, name: str, values: List[Any]) -> int:
+        """OR the bitsets of some values of a bitmap index.
+        
+        Args:
+            name: Bitmap index name
+            values: Values to match (hashable)
+        
+        Returns:
+            Integer whose bit n is set when the document with _id n has
+            one of the values
+        """
+        bitmaps = self._indexes[name]['bitmaps']
+        bits = 0
+        for value in dict.fromkeys(values):
+            raw = bitmaps.get(value)
+            if raw:
+                bits |= int.from_bytes(raw, 'little')
+        return bits
+    
+    def _note_posting_size(self, info: Dict, old_len: int, new_len: int) -> None:
+        """Update index statistics after a posting list changed length."""
+        if 'histogram' not in info:
+            return
+        info['entries'] += new_len - old_len
+        histogram = info['histogram']
+        old_bucket, new_bucket = old_len.bit_length(), new_len.bit_length()
+        if old_bucket == new_bucket:
+            return
+        if old_bucket:
+            histogram[old_bucket] -= 1
+            if not histogram[old_bucket]:
+                del histogram[old_bucket]
+        if new_bucket:
+            histogram[new_bucket] = histogram.get(new_bucket, 0) + 1
+    
+    def index_stats(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return cost-model statistics for a regular index.
+        
+        Args:
+            name: Index name
+        
+        Returns:
+            Dict with entries (total postings), distinct_keys, null_count,
+            histogram ({"lo-hi": number of keys whose posting list length
+            is in that range}), expected_postings (the posting length of
+            the key holding a randomly picked non-null entry) and multikey,
+            or None for unknown, geospatial and bitmap indexes
+        """
+        info = self._indexes.get(name)
+        if info is None or 'histogram' not in info:
+            return None
+        data = info['data']
+        null_count = len(data.get(None, ()))
+        non_null_keys = len(data) - (None in data)
+        non_null_entries = info['entries'] - null_count
+        
+        # Size-biased mean from the histogram: lookups tend to hit values that
+        # many documents have, so long posting lists weigh more. Bucket
+        # midpoints are rescaled so they add up to the real entry count.
+        weighted = total = 0.0
+        for bucket, keys in info['histogram'].items():
+            length = (1 << (bucket - 1)) * 1.5 if bucket > 1 else 1.0
+            weighted += keys * length * length
+            total += keys * length
+        expected = weighted / total * info['entries'] / total if total else 0.0
+        if non_null_keys:
+            expected = min(expected, float(non_null_entries))
+        
+        return {
+            'entries': info['entries'],
+            'distinct_keys': len(data),
+            'null_count': null_count,
+            'histogram': {f"{1 << (b - 1)}-{(1 << b) - 1}": keys
+                          for b, keys in sorted(info['histogram'].items())},
+            'expected_postings': expected,
+            'multikey': info.get('multikey', False),
+        }
+    
+    def index_memory(self, name: str) -> int:
+        """Estimate the memory held by an index in bytes.
+        
+        Counts the key dict, keys, posting lists (8 bytes per integer id in
+        their arrays) and ordered keys (keys are counted even though they
+        may be shared with documents).
+        
+        Args:
+            name: Index name
+        
+        Returns:
+            Estimated bytes, 0 for unknown indexes
+        """
+        info = self._indexes.get(name)
+        if info is None:
+            return 0
+        if info.get('bitmap'):
+            size = sys.getsizeof(info['bitmaps']) + sys.getsizeof(info['counts'])
+            for key, bits in info['bitmaps'].items():
+                size += sys.getsizeof(key) + sys.getsizeof(bits)
+            return size
+        data = info['data']
+        size = sys.getsizeof(data)
+        for key, ids in data.items():
+            size += sys.getsizeof(key) + sys.getsizeof(ids)
+        order = info.get('sorted_keys')
+        if order:
+            size += sys.getsizeof(order) + len(order) * sys.getsizeof((0, None))
+        return size
+    
+    def estimate_index_memory(self, field: str, documents: List[Dict],
+                              sample_size: int = 1000) -> int:
+        """Estimate the memory a single-field index would hold, without building it.
+        
+        Reads the keys of an evenly spaced sample of the documents. Postings
+        scale with the collection; keys seen once in the sample are taken
+        to be unique in the collection and keys seen more often to have no
+        other values, which is exact for unique and low-cardinality fields.
+        Costs per key and per posting follow index_memory().
+        
+        Args:
+            field: Field to index
+            documents: All documents in the collection
+            sample_size: Largest number of documents read
+        
+        Returns:
+            Estimated bytes, 0 for an empty collection
+        """
+        total = len(documents)
+        if not total:
+            return 0
+        sample = documents[::max(1, total // sample_size)]
+        getter = _path_getter(field, True)
+        counts: Dict[Any, int] = {}
+        key_bytes = 0
+        for doc in sample:
+            value = getter(doc)
+            if isinstance(value, list):
+                keys = [item for item in value if not isinstance(item, (dict, list))] or [_EMPTY_ARRAY]
+            else:
+                keys = [value]
+            for key in keys:
+                try:
+                    seen = counts.get(key, 0)
+                except TypeError:
+                    continue  # Sub-documents fail the build anyway
+                counts[key] = seen + 1
+                if not seen:
+                    key_bytes += sys.getsizeof(key)
+        if not counts:
+            return 0
+        scale = total / len(sample)
+        singles = sum(1 for seen in counts.values() if seen == 1)
+        distinct = scale * singles + len(counts) - singles
+        postings = sum(counts.values()) * scale
+        per_key = (key_bytes / len(counts) + sys.getsizeof(_new_postings(0))
+                   + sys.getsizeof((0, None)) + 8)
+        return int(sys.getsizeof({}) + distinct * (per_key + 24)
+                   + (postings - distinct) * array(_POSTING_TYPECODE).itemsize)
+    
+    def estimate_range(self, field: str, min_value: Any = None, max_value: Any = None,
+                       min_inclusive: bool = True, max_inclusive: bool = True,
+                       filter: Optional[Dict] = None) -> Optional[float]:
+        """Estimate the postings in a key range from the ordered keys.
+        
+        Returns:
+            Estimated number of ids, or None without an ordered index
+        """
+        name = self.find_index_for_field(field, filter)
+        if name is None:
+            return None
+        info = self._indexes[name]
+        order = info.get('sorted_keys')
+        if order is None:
+            return None
+        if info.get('multikey') and min_value is not None:
+            max_value = None  # See _scan_sorted_keys
+        bounds = self._range_bounds(order, min_value, max_value, min_inclusive, max_inclusive)
+        if bounds is None:
+            return 0.0
+        lo, hi = bounds
+        keys = max(hi - lo, 0)
+        return keys * info['entries'] / max(len(order), 1)
+    
+    def _insert_sorted_key(self, info: Dict, key: Any) -> None:
+        """Record a new key in the index's ordered key list."""
+        order = info.get('sorted_keys')
+        if order is None:
+            return
+        order_key = _index_order_key(key)
+        if order_key is None:
+            info['sorted_keys'] = None  # Key type has no order: index becomes hash-only
+            return
+        try:
+            insort_left(order, order_key)
+        except TypeError:
+            info['sorted_keys'] = None
+    
+    def _discard_sorted_key(self, info: Dict, key: Any) -> None:
+        """Remove a key from the index's ordered key list."""
+        order = info.get('sorted_keys')
+        if not order:
+            return
+        order_key = _index_order_key(key)
+        pos = bisect_left(order, order_key)
+        if pos < len(order) and order[pos] == order_key:
+            del order[pos]
+    
+    def _index_document(self, name: str, info: Dict, doc: Dict, doc_id: Any) -> None:
+        """Add a document to a single index."""
+        # Handle geospatial indexes
+        if info.get('type') == 'geospatial':
+            self._index_geospatial_document(info, doc, doc_id, add=True)
+            return
+        
+        # Handle regular indexes (None is indexed unless sparse)
+        for key_value in self._document_keys(info, doc):
+            if key_value is None and info['sparse']:
+                continue  # Skip sparse index for missing field
+            self._add_posting(name, info, key_value, doc_id)
+    
     def add_document(self, doc: Dict) -> None:
         """Add a document to all indexes.
         
@@ -2943,31 +5016,7 @@ class IndexManager:
             return
         
         for name, info in self._indexes.items():
-            # Handle geospatial indexes
-            if info.get('type') == 'geospatial':
-                self._index_geospatial_document(info, doc, doc_id, add=True)
-                continue
-            
-            # Handle regular indexes
-            if info['sparse']:
-                key_value = self._get_key_value(doc, info['keys'])
-                if key_value is None:
-                    continue  # Skip sparse index for missing field
-            else:
-                key_value = self._get_key_value(doc, info['keys'])
-                if key_value is None:
-                    key_value = None  # Include None values for non-sparse
-            
-            if key_value not in info['data']:
-                info['data'][key_value] = []
-            
-            # Check uniqueness
-            if info['unique'] and doc_id not in info['data'][key_value]:
-                if len(info['data'][key_value]) > 0:
-                    raise ValueError(f"Duplicate key error for index '{name}': {key_value}")
-            
-            if doc_id not in info['data'][key_value]:
-                info['data'][key_value].append(doc_id)
+            self._index_document(name, info, doc, doc_id)
     
     def remove_document(self, doc: Dict) -> None:
         """Remove a document from all indexes.
@@ -2986,12 +5035,8 @@ class IndexManager:
                 continue
             
             # Handle regular indexes
-            key_value = self._get_key_value(doc, info['keys'])
-            if key_value in info['data']:
-                if doc_id in info['data'][key_value]:
-                    info['data'][key_value].remove(doc_id)
-                if len(info['data'][key_value]) == 0:
-                    del info['data'][key_value]
+            for key_value in self._document_keys(info, doc):
+                self._remove_posting(info, key_value, doc_id)
     
     def update_document(self, old_doc: Dict, new_doc: Dict) -> None:
         """Update a document in all indexes.
@@ -3011,53 +5056,317 @@ class IndexManager:
                 continue
             
             # Handle regular indexes
-            old_key = self._get_key_value(old_doc, info['keys'])
-            new_key = self._get_key_value(new_doc, info['keys'])
+            old_keys = self._document_keys(info, old_doc)
+            new_keys = self._document_keys(info, new_doc)
             
-            if old_key == new_key:
-                continue  # Index key unchanged
+            if old_keys == new_keys:
+                continue  # Index keys unchanged
             
-            # Remove from old position
-            if old_key is not None and old_key in info['data']:
-                if doc_id in info['data'][old_key]:
-                    info['data'][old_key].remove(doc_id)
-                if len(info['data'][old_key]) == 0:
-                    del info['data'][old_key]
-            
-            # Add to new position
-            if new_key is not None or not info['sparse']:
-                if new_key not in info['data']:
-                    info['data'][new_key] = []
-                
-                if info['unique'] and len(info['data'][new_key]) > 0:
-                    raise ValueError(f"Duplicate key error for index '{name}': {new_key}")
-                
-                if doc_id not in info['data'][new_key]:
-                    info['data'][new_key].append(doc_id)
-    
-    def query_index(self, field: str, value: Any) -> Optional[List[int]]:
+            # Move from old positions to new positions
+            for old_key in old_keys:
+                if old_key not in new_keys:
+                    self._remove_posting(info, old_key, doc_id)
+            for new_key in new_keys:
+                if new_key is not None or not info['sparse']:
+                    self._add_posting(name, info, new_key, doc_id)
+    
+    def query_index(self, field: str, value: Any, filter: Optional[Dict] = None) -> Optional[List[int]]:
         """Query an index for documents matching a field value.
         
         Args:
             field: Field name to query
             value: Value to match
+            filter: Query filter, which makes partial indexes it implies usable
         
         Returns:
             List of document _ids or None if no suitable index exists
         """
-        # Find a suitable index
+        name = self.find_index_for_field(field, filter)
+        if name is None:
+            return None  # No suitable index
+        info = self._indexes[name]
+        data = info['data']
+        if info.get('hashed'):
+            value = _hash_key(value)  # Ids of colliding values come along
+        if value in data:
+            return list(data[value])
+        return []  # Empty list means no matches
+    
+    def find_index_for_field(self, field: str, filter: Optional[Dict] = None) -> Optional[str]:
+        """Find a single-field (non-geospatial) index on a field.
+        
+        Args:
+            field: Field name
+            filter: Query filter; partial indexes are only returned when it
+                implies their expression
+        
+        Returns:
+            Index name or None if the field is not indexed
+        """
         for name, info in self._indexes.items():
-            if len(info['keys']) == 1 and info['keys'][0][0] == field:
-                if value in info['data']:
-                    return info['data'][value].copy()
-                return []  # Empty list means no matches
-        return None  # No suitable index
+            if info.get('type') == 'geospatial' or info.get('bitmap') or info.get('collation') is not None:
+                continue
+            if len(info['keys']) == 1 and info['keys'][0][0] == field and self._usable(info, filter):
+                return name
+        return None
+    
+    def indexes_on_field(self, field: str, filter: Optional[Dict] = None) -> List[str]:
+        """Return the names of all indexes that include a field.
+        
+        Partial indexes are only listed when ``filter`` implies their
+        expression.
+        """
+        names = []
+        for name, info in self._indexes.items():
+            if info.get('type') == 'geospatial':
+                if info['field'] == field:
+                    names.append(name)
+            elif any(key == field for key, _ in info['keys']) and self._usable(info, filter):
+                names.append(name)
+        return names
+    
+    def index_keys(self, field: str) -> Optional[Tuple[str, List[Any]]]:
+        """Return the distinct keys of a non-sparse single-field index.
+        
+        Args:
+            field: Field name
+        
+        Returns:
+            Tuple of (index name, keys in index order) or None if the field
+            has no index covering every document
+        """
+        for name, info in self._indexes.items():
+            if (info.get('type') == 'geospatial' or info['sparse'] or info.get('multikey')
+                    or info.get('hashed') or info.get('partial') is not None
+                    or info.get('collation') is not None):
+                continue
+            if len(info['keys']) != 1 or info['keys'][0][0] != field:
+                continue
+            if info.get('bitmap'):
+                return name, list(info['bitmaps'])
+            order = info.get('sorted_keys')
+            if order is not None:
+                return name, [key for _, key in order]
+            return name, list(info['data'])
+        return None
+    
+    def lookup_equal(self, values: Dict[str, List[Any]],
+                     filter: Optional[Dict] = None) -> Optional[Tuple[str, List[str], List[Tuple[Any, List[Any]]]]]:
+        """Resolve equality conditions on exactly the fields of one index.
+        
+        Every combination of the candidate values is looked up as a key, so
+        the postings found are exactly the documents matching the conditions
+        and no document has to be read.
+        
+        Args:
+            values: Field name -> candidate values (non-None scalars)
+            filter: The filter the values come from; partial indexes are
+                only used when it implies their expression
+        
+        Multikey indexes are skipped: their keys are array elements, not
+        field values, and a document may sit under several of them. So are
+        hashed indexes, whose postings include colliding values.
+        
+        Returns:
+            Tuple of (index name, index fields, [(key, ids), ...]) or None if
+            no index has exactly these fields
+        """
+        for name, info in self._indexes.items():
+            if (info.get('type') == 'geospatial' or info.get('multikey') or info.get('hashed')
+                    or info.get('bitmap') or info.get('collation') is not None):
+                continue
+            if not self._usable(info, filter):
+                continue
+            fields = [field for field, _ in info['keys']]
+            if len(fields) != len(values) or set(fields) != set(values):
+                continue
+            
+            data = info['data']
+            postings = []
+            try:
+                # dict.fromkeys drops values that collide as keys (1 and 1.0)
+                choices = [list(dict.fromkeys(values[field])) for field in fields]
+                combos = [(value,) for value in choices[0]]
+                for options in choices[1:]:
+                    combos = [combo + (value,) for combo in combos for value in options]
+                for combo in combos:
+                    key = combo if len(combo) > 1 else combo[0]
+                    ids = data.get(key)
+                    if ids:
+                        postings.append((key, ids))
+            except TypeError:
+                return None  # Unhashable value: let the caller scan
+            return name, fields, postings
+        return None
+    
+    def stored_value(self, name: str, position: int, value: Any) -> Any:
+        """Return the value documents store under a component of an index key.
+        
+        Numbers and booleans share keys across types (1, 1.0, True and
+        Decimal(1)), so a key found by a value may hold another type. It is
+        known only while the field has stored a single numeric type.
+        
+        Args:
+            name: Index name
+            position: Position of the field in the index keys
+            value: Key component the lookup used
+        
+        Returns:
+            The stored value, or _MISSING when documents under the key may
+            store different types
+        """
+        info = self._indexes.get(name)
+        if info is None or not isinstance(value, (int, float, Decimal)):
+            return value
+        types = info['numeric_types'][position]
+        if not types:
+            return value
+        if len(types) > 1:
+            return _MISSING
+        stored_type, = types
+        return stored_type(value)
+    
+    def hinted_ids(self, name: str, conditions: Dict[str, Tuple[str, Any]]) -> Optional[List[Any]]:
+        """Collect candidate ids from a named index, for hinted queries.
+        
+        Args:
+            name: Regular index name
+            conditions: Indexable conditions, field -> ("eq", values),
+                ("range", (min, max, min_inclusive, max_inclusive)) or
+                ("prefix" / "iprefix", prefix)
+        
+        Returns:
+            Ids under the keys matching the condition on a single-field
+            index's field, or every id in the index otherwise. None when
+            the whole of a multikey index would be scanned: its keys are
+            elements, so it is only trusted for conditions on them and
+            the caller scans the collection instead.
+        """
+        info = self._indexes[name]
+        fields = [field for field, _ in info['keys']]
+        condition = conditions.get(fields[0]) if len(fields) == 1 else None
+        if info.get('bitmap'):
+            if condition is not None and condition[0] == 'eq':
+                return _bit_positions(self.bitmap_match(name, condition[1]))
+            return _bit_positions(self.bitmap_match(name, list(info['bitmaps'])))
+        data = info['data']
+        strength = info.get('strength')
+        if condition is not None:
+            kind, operand = condition
+            if kind == 'eq':
+                ids = []
+                for value in operand:
+                    if info.get('hashed'):
+                        value = _hash_key(value)
+                    elif strength is not None:
+                        value = _collation_key(value, strength)  # Also finds other cases
+                    ids.extend(data.get(value, ()))
+                return ids
+            if kind in ('prefix', 'iprefix'):
+                if self._prefix_servable(info, kind == 'iprefix'):
+                    return self._scan_prefix(info, operand)
+            else:
+                order = info.get('sorted_keys')
+                if order is not None and strength is None:
+                    return self._scan_sorted_keys(info, order, *operand)
+        if info.get('multikey'):
+            return None
+        ids = []
+        for postings in data.values():
+            ids.extend(postings)
+        return ids
+    
+    @staticmethod
+    def _prefix_servable(info: Dict, ignore_case: bool) -> bool:
+        """Check whether an index's key order can serve a string prefix.
+        
+        Case-insensitive prefixes need keys folded by a collation of
+        strength 1 or 2.
+        """
+        if info.get('sorted_keys') is None or len(info['keys']) != 1:
+            return False
+        return not ignore_case or (info.get('strength') or 3) < 3
+    
+    def prefix_index_for_field(self, field: str, ignore_case: bool = False,
+                               filter: Optional[Dict] = None) -> Optional[str]:
+        """Find an ordered single-field index that can serve a string prefix.
+        
+        Case-sensitive prefixes prefer an index without a collation; a
+        folding collation still narrows them to a superset of the matches.
+        
+        Args:
+            field: Field name
+            ignore_case: Whether the prefix matches regardless of case
+            filter: Query filter; partial indexes are only returned when it
+                implies their expression
+        
+        Returns:
+            Index name or None
+        """
+        fallback = None
+        for name, info in self._indexes.items():
+            if info.get('type') == 'geospatial' or info['keys'][0][0] != field:
+                continue
+            if not self._prefix_servable(info, ignore_case) or not self._usable(info, filter):
+                continue
+            if ignore_case or info.get('collation') is None:
+                return name
+            fallback = fallback or name
+        return fallback
+    
+    def _prefix_bounds(self, info: Dict, prefix: str) -> Optional[Tuple[int, int]]:
+        """Locate the keys starting with a prefix as [lo, hi) positions."""
+        strength = info.get('strength')
+        if strength is not None:
+            prefix = _collation_key(prefix, strength)
+        return self._range_bounds(info['sorted_keys'], prefix, _prefix_upper(prefix), True, False)
+    
+    def _scan_prefix(self, info: Dict, prefix: str) -> List[Any]:
+        """Collect the ids under the keys starting with a prefix, sorted."""
+        bounds = self._prefix_bounds(info, prefix)
+        if bounds is None:
+            return []
+        order, data = info['sorted_keys'], info['data']
+        # Unlike ranges, one element must hold the whole prefix, so multikey
+        # indexes need no widening
+        return _merge_postings(data[order[pos][1]] for pos in range(*bounds))
+    
+    def query_index_prefix(self, name: str, prefix: str) -> List[Any]:
+        """Query an ordered index for string keys starting with a prefix.
+        
+        Args:
+            name: Index name (see prefix_index_for_field)
+            prefix: Prefix, folded with the index's collation if it has one
+        
+        Returns:
+            Sorted document _ids, a superset of the matches when the
+            index's collation folds keys
+        """
+        return self._scan_prefix(self._indexes[name], prefix)
+    
+    def estimate_prefix(self, name: str, prefix: str) -> float:
+        """Estimate the postings under the keys starting with a prefix.
+        
+        Args:
+            name: Index name
+            prefix: Prefix
+        
+        Returns:
+            Estimated number of ids
+        """
+        info = self._indexes[name]
+        bounds = self._prefix_bounds(info, prefix)
+        if bounds is None:
+            return 0.0
+        lo, hi = bounds
+        return max(hi - lo, 0) * info['entries'] / max(len(info['sorted_keys']), 1)
     
     def query_index_range(self, field: str, 
                           min_value: Any = None, 
                           max_value: Any = None,
                           min_inclusive: bool = True,
-                          max_inclusive: bool = True) -> Optional[List[int]]:
+                          max_inclusive: bool = True,
+                          filter: Optional[Dict] = None) -> Optional[List[int]]:
         """Query an index for documents in a value range.
         
         Args:
@@ -3066,15 +5375,27 @@ class IndexManager:
             max_value: Maximum value (None for no upper bound)
             min_inclusive: If True, include min_value
             max_inclusive: If True, include max_value
+            filter: Query filter, which makes partial indexes it implies usable
         
         Returns:
             List of document _ids or None if no suitable index exists
         """
         # Find a suitable index
         for name, info in self._indexes.items():
+            if info.get('type') == 'geospatial':
+                continue
             if len(info['keys']) == 1 and info['keys'][0][0] == field:
+                if (info.get('hashed') or info.get('bitmap') or info.get('collation') is not None
+                        or not self._usable(info, filter)):
+                    continue  # Hashes and bitsets have no order, folded keys another one
+                order = info.get('sorted_keys')
+                if order is not None:
+                    return self._scan_sorted_keys(info, order, min_value, max_value,
+                                                  min_inclusive, max_inclusive)
                 result = []
-                sorted_keys = sorted(info['data'].keys())
+                sorted_keys = sorted(k for k in info['data'].keys() if k is not None)
+                if info.get('multikey') and min_value is not None:
+                    max_value = None  # See _scan_sorted_keys
                 
                 for key in sorted_keys:
                     if key is None:
@@ -3100,6 +5421,92 @@ class IndexManager:
         
         return None  # No suitable index
     
+    def _scan_sorted_keys(self, info: Dict, order: List[Tuple],
+                          min_value: Any, max_value: Any,
+                          min_inclusive: bool, max_inclusive: bool) -> List[Any]:
+        """Collect ids for a key range with binary search over the ordered keys.
+        
+        On multikey indexes only the lower bound of a two-sided range is
+        used: each bound may be met by a different array element.
+        """
+        if info.get('multikey') and min_value is not None:
+            max_value = None
+        bounds = self._range_bounds(order, min_value, max_value, min_inclusive, max_inclusive)
+        if bounds is None:
+            return []
+        lo, hi = bounds
+        data = info['data']
+        return _merge_postings(data[order[pos][1]] for pos in range(lo, hi))
+    
+    def _range_bounds(self, order: List[Tuple], min_value: Any, max_value: Any,
+                      min_inclusive: bool, max_inclusive: bool) -> Optional[Tuple[int, int]]:
+        """Locate a key range in the ordered keys as [lo, hi) positions.
+        
+        Bounds only match keys of their own type class (numbers, strings, ...),
+        like MongoDB's type bracketing. Returns None for unordered bounds.
+        """
+        min_key = _index_order_key(min_value) if min_value is not None else None
+        max_key = _index_order_key(max_value) if max_value is not None else None
+        if (min_value is not None and min_key is None) or (max_value is not None and max_key is None):
+            return None
+        
+        if min_key is not None:
+            lo = bisect_left(order, min_key) if min_inclusive else bisect_right(order, min_key)
+        elif max_key is not None:
+            lo = bisect_left(order, (max_key[0],))
+        else:
+            lo = bisect_left(order, (1,))  # Skip the None key
+        
+        if max_key is not None:
+            hi = bisect_right(order, max_key) if max_inclusive else bisect_left(order, max_key)
+        elif min_key is not None:
+            hi = bisect_left(order, (min_key[0] + 1,))
+        else:
+            hi = len(order)
+        return lo, hi
+    
+    def iter_index_order(self, field: str, direction: int = 1) -> Optional[Tuple[str, Any]]:
+        """Stream document ids in the order of an index on a field.
+        
+        Ids come out sorted by key (ascending or descending), with documents
+        whose key is None last and ties in _id order -- the same order
+        Cursor.sort produces. Sparse, partial and multikey indexes are
+        skipped since they do not hold exactly one key per document.
+        
+        Args:
+            field: Field name to order by
+            direction: 1 for ascending, -1 for descending
+        
+        Returns:
+            Tuple of (index name, iterator of ids) or None if no ordered index exists
+        """
+        for name, info in self._indexes.items():
+            if (info.get('type') == 'geospatial' or info['sparse'] or info.get('multikey')
+                    or info.get('partial') is not None or info.get('collation') is not None):
+                continue
+            if len(info['keys']) != 1 or info['keys'][0][0] != field:
+                continue
+            order = info.get('sorted_keys')
+            if order is None:
+                continue
+            return name, self._walk_sorted_keys(info, order, direction)
+        return None
+    
+    def _walk_sorted_keys(self, info: Dict, order: List[Tuple], direction: int):
+        """Yield ids key by key in index order, None key last."""
+        data = info['data']
+        start = 1 if order and order[0][0] == 0 else 0
+        if direction == -1:
+            positions = range(len(order) - 1, start - 1, -1)
+        else:
+            positions = range(start, len(order))
+        for pos in positions:
+            postings = data[order[pos][1]]
+            yield from postings if isinstance(postings, array) else sorted(postings)
+        if None in data:
+            postings = data[None]
+            yield from postings if isinstance(postings, array) else sorted(postings)
+    
     def create_geospatial_index(self, field: str, name: Optional[str] = None,
                                  precision: int = 12) -> str:
         """Create a geospatial index using Geohash encoding.
@@ -3288,25 +5695,105 @@ class IndexManager:
             raise ValueError(f"Index '{name}' does not exist")
         
         info = self._indexes[name]
-        info['data'] = {}
+        if info.get('bitmap'):
+            info['bitmaps'] = {}
+            info['counts'] = {}
+        else:
+            info['data'] = {}
+        if 'sorted_keys' in info:
+            info['sorted_keys'] = [] if len(info['keys']) == 1 and not (info.get('hashed') or info.get('bitmap')) else None
+        if 'histogram' in info:
+            info['entries'] = 0
+            info['histogram'] = {}
+        if 'multikey' in info:
+            info['multikey'] = False
+        if info.get('numeric_types') is not None:
+            info['numeric_types'] = [set() for _ in info['keys']]
         
         for doc in documents:
-            try:
-                self.add_document(doc)
-            except ValueError:
-                # Re-raise with context
-                raise
+            doc_id = doc.get('_id')
+            if doc_id is not None:
+                self._index_document(name, info, doc, doc_id)
+
+
+# Compiled dotted-path getters, shared by matching, indexing, sorting and
+# aggregation: path -> getter (see _path_getter)
+_PATH_GETTERS: Dict[str, Any] = {}
+_ARRAY_PATH_GETTERS: Dict[str, Any] = {}
+_PATH_CACHE_LIMIT = 4096
+
+
+def _path_getter(path: str, expand_arrays: bool = False) -> Any:
+    """Return a getter compiled once per dotted path.
+    
+    The plain getter walks nested dicts and returns None when the path is
+    missing (_get_nested_value semantics). With ``expand_arrays``, an array
+    met along the path contributes the values found in each of its
+    sub-documents, flattened into a list (JSONlite._get_value_by_path
+    semantics).
+    
+    Args:
+        path: Field path in dot notation
+        expand_arrays: Whether to fan out over arrays along the path
+    
+    Returns:
+        Callable taking a document and returning the value (or None)
+    """
+    cache = _ARRAY_PATH_GETTERS if expand_arrays else _PATH_GETTERS
+    getter = cache.get(path)
+    if getter is not None:
+        return getter
+    if len(cache) >= _PATH_CACHE_LIMIT:
+        cache.clear()  # Paths built from data; don't grow without bound
+    
+    parts = tuple(path.split('.'))
+    if len(parts) == 1 and not expand_arrays:
+        key = parts[0]
+        
+        def getter(doc):
+            return doc.get(key) if isinstance(doc, dict) else None
+    elif not expand_arrays:
+        def getter(doc):
+            current = doc
+            for part in parts:
+                if not isinstance(current, dict):
+                    return None
+                current = current.get(part)
+            return current
+    else:
+        # Remaining sub-paths, so arrays don't rebuild path strings per element
+        suffixes = tuple('.'.join(parts[i:]) for i in range(len(parts)))
+        
+        def getter(doc):
+            current = doc
+            for i, part in enumerate(parts):
+                if isinstance(current, dict):
+                    if part not in current:
+                        return None
+                    current = current[part]
+                elif isinstance(current, list):
+                    rest = _path_getter(suffixes[i], True)
+                    results = []
+                    for item in current:
+                        if isinstance(item, dict):
+                            value = rest(item)
+                            if value is not None:
+                                if isinstance(value, list):
+                                    results.extend(value)
+                                else:
+                                    results.append(value)
+                    return results if results else None
+                else:
+                    return None
+            return current
+    
+    cache[path] = getter
+    return getter
 
 
 def _get_nested_value(doc: Dict, path: str) -> Any:
     """Get value from nested document using dot notation."""
-    parts = path.split('.')
-    current = doc
-    for part in parts:
-        if not isinstance(current, dict) or part not in current:
-            return None
-        current = current[part]
-    return current
+    return _path_getter(path)(doc)
 
 
 def _set_nested_value(doc: Dict, path: str, value: Any) -> None:
@@ -3464,6 +5951,21 @@ def _apply_update_operators(record: Dict, update_values: Dict) -> Dict:
     return new_record
 
 
+# Operators that match an array field when any element satisfies them
+_ELEMENT_OPERATORS = frozenset(['$eq', '$in', '$gt', '$gte', '$lt', '$lte', '$regex'])
+
+
+def _match_array_elements(function: Any, value: List[Any], cond_value: Any) -> bool:
+    """Check whether any element of an array satisfies an operator."""
+    for item in value:
+        try:
+            if function(item, cond_value):
+                return True
+        except Exception:
+            pass
+    return False
+
+
 def _matches_pull_condition(item: Any, condition: Dict) -> bool:
     """Check if an item matches a pull condition (operator dict).
     
@@ -3569,7 +6071,7 @@ class FullTextIndex:
         """
         texts = []
         for field in self.fields:
-            value = _get_nested_value(doc, field)
+            value = _path_getter(field)(doc)
             if value is not None:
                 texts.append(str(value))
         return ' '.join(texts)
@@ -3741,7 +6243,11 @@ def _deep_equals(a: Any, b: Any) -> bool:
 class JSONlite:
     def __init__(self, filename: str, cache_enabled: bool = True, cache_size: int = 100,
                  compression_enabled: bool = False, compression_level: int = 6,
-                 encryption_enabled: bool = False, encryption_password: Optional[str] = None):
+                 encryption_enabled: bool = False, encryption_password: Optional[str] = None,
+                 auto_index: Union[bool, AutoIndexPolicy] = False,
+                 cache_max_bytes: int = _CACHE_MAX_BYTES, cache_ttl: Optional[float] = None,
+                 cache_max_entry_bytes: Optional[int] = None,
+                 cache_pool: Optional[CachePool] = None, cache_namespace: Optional[str] = None):
         """Initialize JSONlite database.
         
         Args:
@@ -3753,15 +6259,35 @@ class JSONlite:
                               1 = fastest, 9 = best compression
             encryption_enabled: Enable AES-256-GCM encryption for data storage (default: False)
             encryption_password: Password for encryption/decryption (required if encryption_enabled=True)
+            auto_index: Build indexes suggested by the query planner once the
+                thresholds of an AutoIndexPolicy are met, and drop them again
+                when unused (default: False; True uses the default policy)
+            cache_max_bytes: Memory budget of the query cache in approximate
+                bytes (default: 32 MiB)
+            cache_ttl: Seconds a cached result stays valid (default: None,
+                no expiry)
+            cache_max_entry_bytes: Largest cached result in approximate bytes
+                (default: cache_max_bytes // 8)
+            cache_pool: CachePool shared with other databases; its limits
+                replace cache_size, cache_max_bytes and cache_max_entry_bytes
+            cache_namespace: Name of this database in the pool statistics
+                (default: filename)
         """
         self._filename = filename
         self._cache_enabled = cache_enabled
-        self._cache = QueryCache(max_size=cache_size) if cache_enabled else None
+        self._cache = QueryCache(max_size=cache_size, max_bytes=cache_max_bytes, ttl=cache_ttl,
+                                 max_entry_bytes=cache_max_entry_bytes, pool=cache_pool,
+                                 namespace=cache_namespace or filename) if cache_enabled else None
         self._compression_enabled = compression_enabled
         self._compression_level = compression_level
         self._encryption_enabled = encryption_enabled
         self._encryption_password = encryption_password
         self._query_planner = QueryPlanner()
+        self._auto_indexer = None
+        if auto_index:
+            policy = auto_index if isinstance(auto_index, AutoIndexPolicy) else AutoIndexPolicy()
+            self._auto_indexer = AutoIndexer(policy)
+            self._query_planner.add_listener(self._auto_indexer.observe)
         
         if encryption_enabled and not encryption_password:
             raise ValueError("encryption_password is required when encryption_enabled=True")
@@ -3771,16 +6297,19 @@ class JSONlite:
             '$gte': lambda v, c: v is not None and v >= c,
             '$lte': lambda v, c: v is not None and v <= c,
             '$eq': lambda v, c: v == c,
-            '$regex': lambda v, c, o=None: re.search(c, v) is not None,
+            '$regex': lambda v, c: isinstance(v, str) and re.search(c, v) is not None,
             '$in': lambda v, c: v in c,
             '$all': lambda v, c: isinstance(v, (list, tuple)) and all(item in v for item in c),
             # Geospatial operators
             '$geoWithin': lambda v, c: _geometry_contains(_extract_geometry(c), _extract_coordinates(v)) if _extract_coordinates(v) and _extract_geometry(c) else False,
             '$geoIntersects': lambda v, c: _geo_intersects({'type': 'Point', 'coordinates': _extract_coordinates(v)}, _extract_geometry(c)) if _extract_coordinates(v) and _extract_geometry(c) else False,
         }
-        self._index_manager = IndexManager()
+        self._index_manager = IndexManager(lambda expression: self._prepare_filter(expression)[0])
         self._fulltext_indexes: Dict[str, FullTextIndex] = {}  # name -> FullTextIndex
+        self._id_map: Dict[Any, Dict] = {}  # primary index: _id -> document
+        self._plan_cache = PlanCache()  # filter shape -> compiled predicate and access plans
         self._index_metadata = []
+        self._file_signature = None  # _file_signature() at the last load or save
         self._transaction_manager = TransactionManager(self)
         if not os.path.exists(filename):
             self._touch_database()
@@ -3790,6 +6319,8 @@ class JSONlite:
                 self._load_database(file)
             # Rebuild indexes from metadata
             self._rebuild_indexes_from_metadata()
+        if self._auto_indexer is not None:
+            self._track_auto_indexes()
 
     def _default_serializer(self, obj):
         if isinstance(obj, datetime):
@@ -3811,6 +6342,13 @@ class JSONlite:
         return dct
 
     def _load_database(self, file):
+        signature = _file_signature(file)
+        if signature != self._file_signature:
+            # Written by another instance or process: cached results (and
+            # the _ids they hold) may no longer match their filters
+            self._file_signature = signature
+            if self._cache is not None:
+                self._cache.clear()
         file.seek(0)
         content_bytes = file.read()
         
@@ -3844,9 +6382,31 @@ class JSONlite:
             self._database = json.loads(content, object_hook=self._object_hook)
         
         self._data = self._database["data"]
+        self._rebuild_id_map()
         # Load index metadata (but rebuild from data)
         self._index_metadata = self._database.get("_indexes", [])
 
+    def _rebuild_id_map(self) -> None:
+        """Rebuild the primary _id -> document map from the loaded data.
+
+        The map is rebuilt whenever ``_data`` is replaced (load from disk,
+        transaction rollback) and kept in sync by every write path, so
+        primary key lookups never have to scan the collection.
+        """
+        self._id_map = {doc['_id']: doc for doc in self._data if '_id' in doc}
+
+    def _rebuild_index_data(self) -> None:
+        """Rebuild the _id map and every index's postings from ``_data``.
+
+        Used when ``_data`` is swapped wholesale (transaction rollback), since
+        covered queries answer straight from postings and need them exact.
+        """
+        self._rebuild_id_map()
+        for info in self._index_manager.list_indexes():
+            self._index_manager.rebuild_index(info['name'], self._data)
+        if self._cache_enabled and self._cache:
+            self._cache.clear()
+
     def _save_database(self, file):
         # Save index metadata
         self._database["_indexes"] = self._index_manager.list_indexes()
@@ -3868,6 +6428,7 @@ class JSONlite:
         
         file.flush()
         os.fsync(file.fileno())
+        self._file_signature = _file_signature(file)
 
     def _synchronized_write(method):
         @wraps(method)
@@ -3931,46 +6492,17 @@ class JSONlite:
         E.g., if record = {'customer': [{'name': 'Alice'}, {'name': 'Bob'}]}
         Then _get_value_by_path(record, 'customer.name') returns ['Alice', 'Bob']
         
-        For non-array fields, returns the single value.
+        For non-array fields, returns the single value. The path is compiled
+        once and cached (see _path_getter).
         """
-        parts = path.split('.')
-        current = record
-        
-        for i, part in enumerate(parts):
-            if isinstance(current, dict):
-                if part not in current:
-                    return None
-                current = current[part]
-            elif isinstance(current, list):
-                # Array - collect values from all elements
-                results = []
-                for item in current:
-                    if isinstance(item, dict):
-                        sub_path = '.'.join(parts[i:])
-                        val = self._get_value_by_path(item, sub_path)
-                        if val is not None:
-                            if isinstance(val, list):
-                                results.extend(val)
-                            else:
-                                results.append(val)
-                return results if results else None
-            else:
-                return None
-        
-        return current
+        return _path_getter(path, True)(record)
     
     def _match_filter(self, filter: Dict, record: Dict, deep: int = 0) -> bool:
-        # fuck regex
-        # convert {"$regex": "a", "$options": "i"} to {new_regex_op: "a"}
-        if "$regex" in filter and "$options" in filter:
-            options = filter.pop("$options")
-
-            def new_regex_op( v, c): 
-                return self.operators["$regex"](
-                v, c, options)
-            filter[new_regex_op] = filter.pop("$regex")
-        
         for key, condition in filter.items():
+            # {"$regex": "a", "$options": "i"} -> {"$regex": re.compile("a", re.I)}
+            if isinstance(condition, dict) and '$options' in condition:
+                condition = _regex_with_options(condition)
+
             # Handle $near with optional $maxDistance/$minDistance
             # Format: {field: {$near: [lng, lat], $maxDistance: 1000, $minDistance: 100}}
             if isinstance(condition, dict) and '$near' in condition:
@@ -4082,15 +6614,24 @@ class JSONlite:
                         else:
                             if key not in record:
                                 return False
+                            value = record[key]
+                            # Arrays match when any element does (or, for
+                            # $eq and $in, the array as a whole)
+                            elements = isinstance(value, list) and operator in _ELEMENT_OPERATORS
                             if isinstance(cond_value, (list, tuple)):
                                 if operator in ['$in', '$all']:
-                                    if not function(record.get(key), cond_value):
+                                    if not function(value, cond_value) and not (
+                                            elements and _match_array_elements(function, value, cond_value)):
                                         return False
                                 else:
-                                    if not function(record.get(key), *cond_value):
+                                    if not function(value, *cond_value):
                                         return False
+                            elif elements:
+                                if not ((operator == '$eq' and function(value, cond_value))
+                                        or _match_array_elements(function, value, cond_value)):
+                                    return False
                             else:
-                                if not function(record.get(key), cond_value):
+                                if not function(value, cond_value):
                                     return False
                 else:
                     # Handle dot notation for nested/array fields
@@ -4106,7 +6647,10 @@ class JSONlite:
                             if value != condition:
                                 return False
                     else:
-                        if key not in record or record[key] != condition:
+                        if key not in record:
+                            return False
+                        value = record[key]
+                        if value != condition and not (isinstance(value, list) and condition in value):
                             return False
         return True
 
@@ -4117,6 +6661,7 @@ class JSONlite:
         record = record.copy()
         record["_id"] = self._generate_id()
         self._data.append(record)
+        self._id_map[record["_id"]] = record
         return record["_id"]
 
     @_synchronized_write
@@ -4131,22 +6676,23 @@ class JSONlite:
     @_synchronized_write
     def _insert_many(self, records: List[Dict]) -> List[int]:
         """Internal batch insert - single read/write cycle for all records."""
-        # Invalidate cache on write
-        if self._cache_enabled and self._cache:
-            self._cache.clear()
         inserted_ids = []
+        inserted = []
         for record in records:
             if "_id" in record:
                 raise ValueError("ID should not be specified. It is auto-generated.")
             record = record.copy()
             record["_id"] = self._generate_id()
             self._data.append(record)
+            self._id_map[record["_id"]] = record
             inserted_ids.append(record["_id"])
+            inserted.append(record)
             # Add to indexes
             self._index_manager.add_document(record)
             # Add to full-text indexes
             for ft_index in self._fulltext_indexes.values():
                 ft_index.add_document(record)
+        self._invalidate_cache(documents=inserted)
         return inserted_ids
     
     def insert_many(self, records: List[Dict]) -> InsertManyResult:
@@ -4196,6 +6742,7 @@ class JSONlite:
                 if record != new_record:
                     modified_count += 1
                     self._data[idx] = new_record
+                    self._id_map[new_record['_id']] = new_record
                 if not update_all:
                     break
         if matched_count == 0 and upsert:
@@ -4215,8 +6762,9 @@ class JSONlite:
     def update_many(self, filter: Dict, update_values: Dict, upsert: bool = False) -> UpdateResult:
         return self._update(filter, update_values, update_all=True, upsert=upsert)
     
-    def replace_one(self, filter: Dict, replacement: Dict, upsert: bool = False) -> UpdateResult:
-        return self._update(filter, replacement, update_all=False, upsert=upsert)
+    def replace_one(self, filter: Dict, replacement: Dict, upsert: bool = False,
+                    hint: Any = None) -> UpdateResult:
+        return self._update_with_index(filter, replacement, update_all=False, upsert=upsert, hint=hint)
 
     @_synchronized_read
     def _find(self, filter: Dict, find_all: bool = False) -> List[Dict]:
@@ -4271,8 +6819,9 @@ class JSONlite:
         return found_records
 
     def find_one(self, filter: Dict = {}) -> Union[Dict, None]:
+        self._auto_index_step()
         records = self._find(filter, find_all=False)
-        return records[0] if records else None
+        return _CopyOnWriteDict(records[0]) if records else None
 
     def find(self, filter: Dict = {}) -> Union[Cursor, List[Dict]]:
         """Find documents with optional chainable operations.
@@ -4287,18 +6836,29 @@ class JSONlite:
             # Backward compatible - returns list directly
             db.find({"age": {"$gt": 18}})  # Returns list for backward compat
         """
-        results = self._find(filter, find_all=True)
-        return Cursor(results, self)
+        self._auto_index_step()
+        return Cursor(None, self, filter)
 
     @_synchronized_read
-    def aggregate(self, pipeline: List[Dict]) -> AggregationCursor:
+    def aggregate(self, pipeline: List[Dict], explain: bool = False,
+                  cache: bool = True) -> Union[AggregationCursor, Dict[str, Any]]:
         """Execute an aggregation pipeline.
         
+        A leading $match is answered by the query planner (indexes, _id map)
+        instead of filtering every document inside the pipeline. Results are
+        kept in the query cache, keyed by the pipeline: inserts and deletes
+        the leading $match rejects leave them valid, any update drops them.
+        Pipelines reading other collections ($lookup, ...) or using $sample
+        are not cached.
+        
         Args:
             pipeline: List of aggregation stages ($match, $group, $project, $sort, $skip, $limit, $count, $unwind)
+            explain: Return the execution plan and per-stage statistics
+                instead of a cursor
+            cache: Use the query cache (default: True)
         
         Returns:
-            AggregationCursor with results
+            AggregationCursor with results, or the explain dict
         
         Examples:
             # Match and sort
@@ -4319,15 +6879,74 @@ class JSONlite:
                 {"$project": {"name": 1, "email": 1}}
             ]).all()
         """
-        results = self._find({}, find_all=True)
+        import time
+        start_time = time.perf_counter()
+        self._auto_index_step()
+        
+        cache_key = None
+        if not explain and self._use_cache(cache) and _pipeline_cacheable(pipeline):
+            cache_key = ('aggregate', _freeze(pipeline, ordered=True))
+            cached = self._cache.get(None, cache_key)
+            if cached is not None:
+                exec_time_ms = (time.perf_counter() - start_time) * 1000
+                self._query_planner.record_query({}, exec_time_ms, len(cached), "cache")
+                return AggregationCursor([_CopyOnWriteDict(doc) for doc in cached], self)
+        
+        match: Dict = {}
+        if pipeline and set(pipeline[0]) == {'$match'} and not any(
+                isinstance(c, dict) and {'$near', '$geoWithin', '$geoIntersects'} & set(c)
+                for c in pipeline[0]['$match'].values()):
+            match, pipeline = pipeline[0]['$match'], pipeline[1:]
+        access: Dict[str, Any] = {}
+        results = list(self._iter_matches(match, stats=access if explain else None, cache=cache))
         cursor = AggregationCursor(results, self)
-        return cursor.aggregate(pipeline)
+        if not explain:
+            cursor.aggregate(pipeline)
+            if cache_key is not None:
+                # Later stages may read any field, so any update invalidates
+                _, predicate = self._cache_dependencies(match)
+                self._cache.set(None, [dict(dict.items(doc)) for doc in cursor._data],
+                                None, predicate, cache_key,
+                                (time.perf_counter() - start_time) * 1000)
+            return cursor
+        
+        access_ms = (time.perf_counter() - start_time) * 1000
+        plan = self._plan_query(match)
+        stages: List[Dict] = []
+        cursor.aggregate(pipeline, profile=stages)
+        return {
+            'stages': [{
+                '$cursor': {
+                    'queryPlanner': {
+                        'namespace': self._filename,
+                        'parsedQuery': match,
+                        'indexesConsidered': plan['indexesConsidered'],
+                        'winningPlan': {'stage': access.get('stage', plan['stage']),
+                                        'indexName': access.get('indexName', plan['indexName'])},
+                    },
+                    'executionStats': {
+                        'nReturned': len(results),
+                        'executionTimeMillis': round(access_ms, 3),
+                        'totalKeysExamined': access.get('keysExamined', 0),
+                        'totalDocsExamined': access.get('docsExamined', 0),
+                        'estimatedDocsExamined': plan['estimatedDocsExamined'],
+                        'cacheHit': access.get('cacheHit', False),
+                    },
+                }
+            }] + stages,
+            'nReturned': len(cursor),
+            'executionTimeMillis': round((time.perf_counter() - start_time) * 1000, 3),
+        }
 
     @_synchronized_write
     def find_one_and_delete(self, filter: Dict) -> Optional[Dict]:
-        for idx, record in enumerate(self._data):
-            if self._match_filter(filter, record):
-                return self._data.pop(idx)
+        match, access = self._prepare_filter(filter)
+        candidates, _ = self._index_candidates(filter, access)
+        for record in (self._data if candidates is None else candidates):
+            if match(record):
+                self._remove_records([record])
+                self._invalidate_cache(documents=[record])
+                return record
         return None
 
     def find_one_and_replace(self, filter: Dict, replacement: Dict) -> Optional[Dict]:
@@ -4357,10 +6976,12 @@ class JSONlite:
             # fastpath
             deleted_count = len(self._data)
             self._data.clear()  # _data是一个引用，不能直接_data = []
+            self._id_map.clear()
         else:
             idx = 0
             while idx < len(self._data):
                 if self._match_filter(filter, self._data[idx]):
+                    self._id_map.pop(self._data[idx].get('_id'), None)
                     del self._data[idx]
                     deleted_count += 1
                     if not delete_all:
@@ -4376,24 +6997,178 @@ class JSONlite:
         return self._delete(filter, delete_all=True)
 
     @_synchronized_read
-    def count_documents(self, filter: Dict) -> int:
-        return len(self._find(filter, find_all=True))
+    def count_documents(self, filter: Dict, hint: Any = None, cache: bool = True) -> int:
+        """Count the documents matching a filter.
+        
+        Counts are kept in the query cache (unless hinted), with the same
+        invalidation as find results.
+        
+        Args:
+            filter: Query filter
+            hint: Optional index name, index keys or "$natural" to force the
+                access path (see Cursor.hint)
+            cache: Use the query cache (default: True)
+        
+        Returns:
+            Number of matching documents
+        """
+        import time
+        start_time = time.perf_counter()
+        self._auto_index_step()
+        
+        if hint is not None:
+            return sum(1 for _ in self._iter_matches(filter, hint=hint))
+        if not filter:
+            return len(self._data)
+        
+        cache_key = None
+        if self._use_cache(cache):
+            cache_key = ('count', self._cache.key_for(filter))
+            cached = self._cache.get(filter, cache_key)
+            if cached is not None:
+                exec_time_ms = (time.perf_counter() - start_time) * 1000
+                self._query_planner.record_query(filter, exec_time_ms, cached[0], "cache")
+                return cached[0]
+        
+        # Equality on indexed fields: the answer is the size of the postings,
+        # or the popcount of the ANDed bitsets of bitmap indexes
+        counted = None
+        bitmap = self._bitmap_filter(filter)
+        if bitmap is not None and bitmap[2]:
+            counted = '+'.join(bitmap[1]), _popcount(bitmap[0])
+        else:
+            covered = self._equality_postings(filter)
+            if covered is not None:
+                counted = covered[0], sum(len(ids) for _, ids in covered[2])
+        if counted is not None:
+            index_name, count = counted
+            exec_time_ms = (time.perf_counter() - start_time) * 1000
+            self._query_planner.record_query(filter, exec_time_ms, count, index_name)
+        else:
+            # Count matches as they stream by instead of building the result list
+            count = sum(1 for _ in self._iter_matches(filter, cache=False))
+        
+        if cache_key is not None:
+            fields, predicate = self._cache_dependencies(filter)
+            self._cache.set(filter, [count], fields, predicate, cache_key,
+                            (time.perf_counter() - start_time) * 1000)
+        return count
+    
+    def _use_cache(self, cache: bool = True) -> bool:
+        """Check whether a call should go through the query cache."""
+        return bool(cache) and self._cache_enabled and self._cache is not None
+    
+    def _cache_dependencies(self, filter: Optional[Dict]) -> Tuple[Optional[FrozenSet[str]], Any]:
+        """Return the invalidation dependencies of a result derived from a filter.
+        
+        Returns:
+            Tuple of (field paths the filter reads, match predicate); the
+            predicate is None when every insert or delete must invalidate
+            (empty filters, $near)
+        """
+        if not filter:
+            return frozenset(), None
+        if any(isinstance(c, dict) and '$near' in c for c in filter.values()):
+            return _filter_fields(filter), None
+        return _filter_fields(filter), self._prepare_filter(filter)[0]
 
     @_synchronized_read
     def estimated_document_count(self) -> int:
         return len(self._data)
 
     @_synchronized_read
-    def distinct(self, key: str, filter: Optional[Dict] = None) -> List[Any]:
+    def distinct(self, key: str, filter: Optional[Dict] = None, cache: bool = True) -> List[Any]:
+        """Return the distinct values of a field.
+        
+        Dotted paths are supported and array values contribute their
+        elements. Without a filter, a non-sparse index on ``key`` answers
+        directly from its key set (in index order). A filter is narrowed by
+        the query planner; when it is covered by an index that includes
+        ``key``, the values come from the index keys alone. Results are kept
+        in the query cache until a write touches ``key``, the filter's
+        fields or a matching document.
+        
+        Args:
+            key: Field name (dot notation allowed)
+            filter: Optional query filter
+            cache: Use the query cache (default: True)
+        
+        Returns:
+            List of distinct values (None included when some document lacks
+            the field)
+        """
+        import time
+        start_time = time.perf_counter()
+        self._auto_index_step()
+        used_index = None
+        values: List[Any] = []
+        
+        cache_key = None
+        if self._use_cache(cache):
+            cache_key = ('distinct', key, self._cache.key_for(filter or {}))
+            cached = self._cache.get(filter, cache_key)
+            if cached is not None:
+                exec_time_ms = (time.perf_counter() - start_time) * 1000
+                self._query_planner.record_query(filter or {}, exec_time_ms, len(cached), "cache")
+                return cached
+        
+        if not filter:
+            indexed = self._index_manager.index_keys(key)
+            if indexed is not None:
+                used_index, values = indexed
+                records = ()
+            else:
+                records = self._data
+        else:
+            records = None
+            covered = self._equality_postings(filter)
+            if covered is not None and key in covered[1]:
+                # Index-only: the key is a component of the matched index keys,
+                # read back as the stored values
+                used_index, index_fields, postings = covered
+                position = index_fields.index(key)
+                keys = [self._index_manager.stored_value(
+                            used_index, position, index_key[position] if len(index_fields) > 1 else index_key)
+                        for index_key, _ in postings]
+                if _MISSING not in keys:
+                    values = list(dict.fromkeys(keys))
+                    records = ()
+            if records is not None:
+                pass  # Answered from the keys
+            elif covered is not None:
+                # Key 2 may hold both 2 and 2.0: read the documents, in
+                # collection order
+                used_index, _, postings = covered
+                id_map = self._id_map
+                records = [id_map[doc_id] for doc_id in sorted(doc_id for _, ids in postings for doc_id in ids)]
+            else:
+                records = self._iter_matches(filter, cache=False)
+        
         seen = set()
-        distinct_values = []
-        for record in self._data:
-            if filter is None or self._match_filter(filter, record):
-                value = record.get(key)
-                if value not in seen:
-                    seen.add(value)
-                    distinct_values.append(value)
-        return distinct_values
+        get_value = _path_getter(key, True)
+        for record in records:
+            value = get_value(record)
+            for item in (value if isinstance(value, list) else (value,)):
+                try:
+                    if item in seen:
+                        continue
+                    seen.add(item)
+                except TypeError:
+                    # Unhashable values (sub-documents) are compared by equality
+                    if item in values:
+                        continue
+                values.append(item)
+        
+        if used_index is not None:
+            exec_time_ms = (time.perf_counter() - start_time) * 1000
+            self._query_planner.record_query(filter or {}, exec_time_ms, len(values), used_index)
+        if cache_key is not None:
+            fields, predicate = self._cache_dependencies(filter)
+            if fields is not None:
+                fields = fields | {key}
+            self._cache.set(filter, values, fields, predicate, cache_key,
+                            (time.perf_counter() - start_time) * 1000)
+        return values
 
     @_synchronized_read
     def full_text_search(self, query: str, limit: Optional[int] = None) -> List[Dict]:
@@ -4425,12 +7200,11 @@ class JSONlite:
             # Build a mapping of doc_id to score
             score_map = {doc_id: score for doc_id, score in search_results}
             
-            # Get documents by ID
-            id_to_doc = {doc.get('_id'): doc for doc in self._data}
+            # Resolve documents through the primary _id map
             results = []
             for doc_id, score in search_results:
-                if doc_id in id_to_doc:
-                    results.append(id_to_doc[doc_id])
+                if doc_id in self._id_map:
+                    results.append(self._id_map[doc_id])
             
             return results
         
@@ -4449,8 +7223,10 @@ class JSONlite:
         """Get query cache statistics.
         
         Returns:
-            Dict with hits, misses, size, max_size, and hit_rate.
-            None if cache is disabled.
+            Dict with hits, misses, size, max_size, hit_rate, memory usage
+            (memory_bytes, max_bytes) and eviction counters (see
+            QueryCache.stats), plus the plan cache statistics under
+            ``plan_cache``. None if cache is disabled.
         
         Example:
             >>> stats = db.get_cache_stats()
@@ -4458,12 +7234,25 @@ class JSONlite:
         """
         if not self._cache_enabled or not self._cache:
             return None
-        return self._cache.stats
+        stats = self._cache.stats
+        stats['plan_cache'] = self._plan_cache.stats
+        return stats
+    
+    def get_plan_cache_stats(self) -> Dict:
+        """Get plan cache statistics.
+        
+        Plans are cached per filter shape even when the query cache is
+        disabled.
+        
+        Returns:
+            Dict with hits, misses, size, max_size, and hit_rate
+        """
+        return self._plan_cache.stats
     
     def clear_cache(self) -> None:
         """Clear the query cache.
         
-        Note: Cache is automatically cleared on write operations.
+        Note: Writes invalidate the affected entries automatically.
         """
         if self._cache_enabled and self._cache:
             self._cache.clear()
@@ -4472,6 +7261,7 @@ class JSONlite:
         """Reset cache statistics (hits/misses counters)."""
         if self._cache_enabled and self._cache:
             self._cache.reset_stats()
+        self._plan_cache.reset_stats()
     
     # ==================== Query Planner ====================
     
@@ -4510,27 +7300,163 @@ class JSONlite:
         """Reset query planner statistics."""
         self._query_planner.reset()
     
+    def get_auto_index_log(self) -> List[Dict]:
+        """Get the decisions taken by the auto_index policy.
+        
+        Returns:
+            List of dicts with action ("create", "drop" or "skip"), field,
+            index, reason and timestamp, oldest first. Empty if auto_index
+            is disabled.
+        
+        Example:
+            >>> for entry in db.get_auto_index_log():
+            ...     print(entry['action'], entry['field'], entry['reason'])
+        """
+        if self._auto_indexer is None:
+            return []
+        return list(self._auto_indexer.log)
+    
+    def _track_auto_indexes(self) -> None:
+        """Sync AutoIndexer.indexes with the indexes flagged ``auto``.
+        
+        Persisted auto indexes this instance did not build (after a reopen,
+        or built by another instance) are tracked from now on; indexes
+        dropped or replaced by hand are forgotten.
+        """
+        import time
+        indexer = self._auto_indexer
+        auto = {info['name']: info for info in self._index_manager.list_indexes() if info.get('auto')}
+        for name in list(indexer.indexes):
+            if name not in auto:
+                del indexer.indexes[name]
+        now = time.time()
+        for name, info in auto.items():
+            if name not in indexer.indexes:
+                indexer.indexes[name] = {'field': info['keys'][0][0], 'created': now, 'last_used': now,
+                                         'memory': self._index_manager.index_memory(name)}
+    
+    def _auto_index_step(self) -> None:
+        """Evaluate the auto_index policy once enough queries were observed.
+        
+        Runs between queries (never inside a transaction), so index builds
+        are amortized over ``check_interval`` queries.
+        """
+        indexer = self._auto_indexer
+        if indexer is None or not indexer.due() or self._transaction_manager.is_active():
+            return
+        self._auto_index_evaluate(indexer.take_window())
+    
+    @_synchronized_read
+    def _auto_index_evaluate(self, window: Dict[str, List]) -> None:
+        """Apply the auto_index policy to the load of one window.
+        
+        Drops auto indexes unused for ``unused_window`` seconds, then builds
+        the suggest_indexes() fields whose unindexed queries in the window
+        meet the query count and scan cost thresholds, as long as the
+        collection is large enough and the auto indexes stay within the
+        memory budget. The cost of an index is estimated from a sample of
+        the collection before it is built, and measured again afterwards.
+        
+        Args:
+            window: Field -> [unindexed queries, docs examined], from
+                AutoIndexer.take_window()
+        """
+        import time
+        indexer = self._auto_indexer
+        policy = indexer.policy
+        now = time.time()
+        self._track_auto_indexes()
+        
+        for name, info in list(indexer.indexes.items()):
+            idle = now - info['last_used']
+            if idle > policy.unused_window:
+                self.drop_index(name)
+                del indexer.indexes[name]
+                indexer.record('drop', info['field'], f"Unused for {idle:.0f}s", name)
+        
+        size = len(self._data)
+        used_memory = sum(info['memory'] for info in indexer.indexes.values())
+        for suggestion in self.suggest_indexes():
+            field = suggestion['fields'][0]
+            queries, examined = window.get(field, (0, 0))
+            if (queries < policy.min_queries or examined / queries < policy.min_docs_examined
+                    or now - indexer.rejected.get(field, now - policy.unused_window) < policy.unused_window
+                    or self._index_manager.find_index_for_field(field) is not None):
+                continue
+            
+            if size < policy.min_collection_size:
+                indexer.rejected[field] = now
+                indexer.record('skip', field, f"Collection has {size} documents, "
+                                              f"below min_collection_size={policy.min_collection_size}")
+                continue
+            
+            estimate = self._index_manager.estimate_index_memory(field, self._data)
+            if used_memory + estimate > policy.max_index_memory:
+                indexer.rejected[field] = now
+                indexer.record('skip', field, f"Index needs an estimated ~{estimate} bytes, over the "
+                                              f"{policy.max_index_memory} byte auto index budget")
+                continue
+            
+            name = f"{field}_1"
+            try:
+                self._create_index_internal(field, False, False, name, auto=True)
+            except (TypeError, ValueError) as e:
+                self._index_manager.drop_index(name)
+                indexer.rejected[field] = now
+                indexer.record('skip', field, f"Index build failed: {e}")
+                continue
+            memory = self._index_manager.index_memory(name)
+            if used_memory + memory > policy.max_index_memory:
+                self.drop_index(name)
+                indexer.rejected[field] = now
+                indexer.record('skip', field, f"Index needs ~{memory} bytes, over the "
+                                              f"{policy.max_index_memory} byte auto index budget")
+                continue
+            
+            used_memory += memory
+            indexer.indexes[name] = {'field': field, 'created': now, 'last_used': now, 'memory': memory}
+            indexer.record('create', field, f"{queries} unindexed queries examining "
+                                            f"{examined / queries:.0f} documents on average", name)
+    
     # ==================== Index Management ====================
     
     @_synchronized_write
     def _create_index_internal(self, keys: Union[str, List[Tuple[str, int]]], 
-                               unique: bool, sparse: bool, name: Optional[str]) -> str:
+                               unique: bool, sparse: bool, name: Optional[str],
+                               partial_filter_expression: Optional[Dict] = None,
+                               collation: Optional[Dict] = None, auto: bool = False) -> str:
         """Internal index creation (with write lock)."""
-        index_name = self._index_manager.create_index(keys, unique, sparse, name)
+        index_name = self._index_manager.create_index(keys, unique, sparse, name,
+                                                      partial_filter_expression, collation, auto)
         self._index_manager.rebuild_index(index_name, self._data)
+        self._plan_cache.clear()
         return index_name
     
     def create_index(self, keys: Union[str, List[Tuple[str, int]]], 
                      unique: bool = False, 
                      sparse: bool = False,
-                     name: Optional[str] = None) -> str:
+                     name: Optional[str] = None,
+                     partial_filter_expression: Optional[Dict] = None,
+                     collation: Optional[Dict] = None) -> str:
         """Create an index on specified field(s).
         
         Args:
-            keys: Field name (str) or list of (field, direction) tuples
+            keys: Field name (str) or list of (field, direction) tuples;
+                direction "hashed" stores a 64-bit hash per key, which keeps
+                equality lookups on long values (URLs, digests) small;
+                direction "bitmap" keeps a bitset of _ids per value, so
+                equality filters on several low-cardinality fields combine
+                with bitwise AND/OR and count by popcount
             unique: If True, enforce uniqueness
             sparse: If True, only index documents with the field
             name: Optional index name (auto-generated if not provided)
+            partial_filter_expression: Only index documents matching this
+                filter; queries use the index only when their filter implies
+                it (e.g. contains the same equality)
+            collation: {"locale": ..., "strength": 1, 2 or 3}; strengths 1
+                and 2 case-fold the keys, so anchored case-insensitive
+                regexes ({"$regex": "^abc", "$options": "i"}, or "^abc$"
+                for equality) scan a key range instead of the collection
         
         Returns:
             Index name
@@ -4539,8 +7465,13 @@ class JSONlite:
             db.create_index("age")  # Single field
             db.create_index([("age", 1), ("name", -1)])  # Compound index
             db.create_index("email", unique=True)  # Unique index
+            db.create_index([("url", "hashed")])  # Hashed index
+            db.create_index([("status", "bitmap")])  # Bitmap index
+            db.create_index("created", partial_filter_expression={"status": "active"})
+            db.create_index("name", collation={"locale": "en", "strength": 2})
         """
-        return self._create_index_internal(keys, unique, sparse, name)
+        return self._create_index_internal(keys, unique, sparse, name, partial_filter_expression,
+                                           collation)
     
     def drop_index(self, name: str) -> bool:
         """Drop an index by name.
@@ -4551,6 +7482,12 @@ class JSONlite:
         Returns:
             True if index was dropped, False if it didn't exist
         """
+        return self._drop_index_internal(name)
+    
+    @_synchronized_write
+    def _drop_index_internal(self, name: str) -> bool:
+        """Internal index removal (with write lock, so the drop is persisted)."""
+        self._plan_cache.clear()
         return self._index_manager.drop_index(name)
     
     def drop_indexes(self) -> int:
@@ -4559,6 +7496,12 @@ class JSONlite:
         Returns:
             Number of indexes dropped
         """
+        return self._drop_indexes_internal()
+    
+    @_synchronized_write
+    def _drop_indexes_internal(self) -> int:
+        """Internal removal of all indexes (with write lock)."""
+        self._plan_cache.clear()
         return self._index_manager.drop_all_indexes()
     
     def _rebuild_indexes_from_metadata(self) -> None:
@@ -4569,7 +7512,10 @@ class JSONlite:
                     idx_meta['keys'],
                     idx_meta.get('unique', False),
                     idx_meta.get('sparse', False),
-                    idx_meta['name']
+                    idx_meta['name'],
+                    idx_meta.get('partialFilterExpression'),
+                    idx_meta.get('collation'),
+                    idx_meta.get('auto', False)
                 )
                 self._index_manager.rebuild_index(idx_meta['name'], self._data)
             except Exception:
@@ -4692,14 +7638,13 @@ class JSONlite:
         record_with_id = record.copy()
         record_with_id["_id"] = self._generate_id()
         self._data.append(record_with_id)
+        self._id_map[record_with_id["_id"]] = record_with_id
         # Add to indexes
         self._index_manager.add_document(record_with_id)
         # Add to full-text indexes
         for ft_index in self._fulltext_indexes.values():
             ft_index.add_document(record_with_id)
-        # Invalidate cache on write
-        if self._cache_enabled and self._cache:
-            self._cache.clear()
+        self._invalidate_cache(documents=[record_with_id])
         return record_with_id["_id"]
     
     @_synchronized_write
@@ -4708,17 +7653,28 @@ class JSONlite:
     
     @_synchronized_write
     def _update_with_index(self, filter: Dict, update_values: Dict,
-                          update_all: bool = False, upsert: bool = False) -> UpdateResult:
-        """Update with index maintenance."""
+                          update_all: bool = False, upsert: bool = False,
+                          hint: Any = None) -> UpdateResult:
+        """Update with index maintenance (``hint`` forces the access path)."""
         matched_count = 0
         modified_count = 0
+        changes = []
         
         has_operators = any(key.startswith('$') for key in update_values.keys())
         
-        for idx, record in enumerate(self._data):
-            if self._match_filter(filter, record):
+        # Reuse the read planner to narrow the documents to visit
+        match, access = self._prepare_filter(filter)
+        candidates, _ = self._index_candidates(filter, access, hint)
+        if candidates is None:
+            targets = enumerate(self._data)
+        else:
+            targets = ((None, record) for record in candidates)
+        
+        for idx, record in targets:
+            if match(record):
                 matched_count += 1
-                old_record = deepcopy(record)
+                # The stored record is replaced by a new version, never modified
+                old_record = record
                 
                 if has_operators:
                     new_record = _apply_update_operators(record, update_values)
@@ -4734,7 +7690,11 @@ class JSONlite:
                     for ft_index in self._fulltext_indexes.values():
                         ft_index.remove_document(old_record)
                         ft_index.add_document(new_record)
+                    if idx is None:
+                        idx = self._locate(record)
                     self._data[idx] = new_record
+                    self._id_map[new_record['_id']] = new_record
+                    changes.append((old_record, new_record))
                 
                 if not update_all:
                     break
@@ -4748,21 +7708,21 @@ class JSONlite:
             upserted_id = self._insert_one_with_index(upserted_record)
             return UpdateResult(matched_count=0, modified_count=0, upserted_id=upserted_id)
         
-        # Invalidate cache on write
-        if self._cache_enabled and self._cache:
-            self._cache.clear()
+        self._invalidate_cache(changes=changes)
         
         return UpdateResult(matched_count=matched_count, modified_count=modified_count)
     
-    def update_one(self, filter: Dict, update_values: Dict, upsert: bool = False) -> UpdateResult:
-        return self._update_with_index(filter, update_values, update_all=False, upsert=upsert)
+    def update_one(self, filter: Dict, update_values: Dict, upsert: bool = False,
+                   hint: Any = None) -> UpdateResult:
+        return self._update_with_index(filter, update_values, update_all=False, upsert=upsert, hint=hint)
     
-    def update_many(self, filter: Dict, update_values: Dict, upsert: bool = False) -> UpdateResult:
-        return self._update_with_index(filter, update_values, update_all=True, upsert=upsert)
+    def update_many(self, filter: Dict, update_values: Dict, upsert: bool = False,
+                    hint: Any = None) -> UpdateResult:
+        return self._update_with_index(filter, update_values, update_all=True, upsert=upsert, hint=hint)
     
     @_synchronized_write
-    def _delete_with_index(self, filter: Dict, delete_all: bool = False) -> DeleteResult:
-        """Delete with index maintenance."""
+    def _delete_with_index(self, filter: Dict, delete_all: bool = False, hint: Any = None) -> DeleteResult:
+        """Delete with index maintenance (``hint`` forces the access path)."""
         deleted_count = 0
         if filter == {} and delete_all:
             # Remove all from indexes
@@ -4773,98 +7733,936 @@ class JSONlite:
                     ft_index.remove_document(record)
             deleted_count = len(self._data)
             self._data.clear()
+            self._id_map.clear()
+            if self._cache_enabled and self._cache:
+                self._cache.clear()
         else:
-            idx = 0
-            while idx < len(self._data):
-                if self._match_filter(filter, self._data[idx]):
-                    # Remove from indexes before deleting
-                    self._index_manager.remove_document(self._data[idx])
-                    # Remove from full-text indexes
-                    for ft_index in self._fulltext_indexes.values():
-                        ft_index.remove_document(self._data[idx])
-                    del self._data[idx]
-                    deleted_count += 1
+            # Reuse the read planner to narrow the documents to visit
+            match, access = self._prepare_filter(filter)
+            candidates, _ = self._index_candidates(filter, access, hint)
+            doomed = []
+            for record in (self._data if candidates is None else candidates):
+                if match(record):
+                    doomed.append(record)
                     if not delete_all:
                         break
-                else:
-                    idx += 1
-        # Invalidate cache on write
-        if self._cache_enabled and self._cache:
-            self._cache.clear()
+            self._remove_records(doomed)
+            self._invalidate_cache(documents=doomed)
+            deleted_count = len(doomed)
         return DeleteResult(deleted_count=deleted_count)
     
-    def delete_one(self, filter: Dict) -> DeleteResult:
-        return self._delete_with_index(filter, delete_all=False)
+    def _invalidate_cache(self, documents: Iterable[Dict] = (),
+                          changes: Iterable[Tuple[Dict, Dict]] = ()) -> None:
+        """Drop the cached queries a write can affect.
+        
+        Inserted and deleted documents drop the entries whose filter matches
+        them; updates drop the entries whose filter reads a modified path.
+        Other entries stay valid: they hold _ids, resolved to the current
+        document versions on every hit.
+        
+        Args:
+            documents: Inserted or deleted documents
+            changes: (old, new) versions of updated documents
+        """
+        if not (self._cache_enabled and self._cache):
+            return
+        for doc in documents:
+            self._cache.invalidate_document(doc)
+        paths = set()
+        for old_record, new_record in changes:
+            paths.update(_changed_paths(old_record, new_record))
+        if paths:
+            self._cache.invalidate_fields(paths)
+    
+    def _locate(self, record: Dict) -> int:
+        """Return the position of a stored document in ``_data``.
+        
+        Documents are appended with increasing generated ids, so ``_data`` is
+        ordered by _id and a binary search finds the slot. A plain list search
+        is the fallback for files whose order was changed by hand.
+        """
+        data = self._data
+        doc_id = record.get('_id')
+        lo, hi = 0, len(data)
+        try:
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if data[mid]['_id'] < doc_id:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < len(data) and data[lo] is record:
+                return lo
+        except (KeyError, TypeError):
+            pass
+        return data.index(record)
+    
+    def _remove_records(self, records: List[Dict]) -> None:
+        """Remove stored documents from the collection, its indexes and the _id map.
+        
+        Several documents are removed with a single compaction pass over
+        ``_data`` instead of one ``del`` per document.
+        """
+        if not records:
+            return
+        for record in records:
+            self._index_manager.remove_document(record)
+            for ft_index in self._fulltext_indexes.values():
+                ft_index.remove_document(record)
+            self._id_map.pop(record.get('_id'), None)
+        if len(records) == 1:
+            del self._data[self._locate(records[0])]
+        else:
+            doomed = {id(record) for record in records}
+            # Slice assignment keeps _database["data"] pointing at the same list
+            self._data[:] = [doc for doc in self._data if id(doc) not in doomed]
     
-    def delete_many(self, filter: Dict) -> DeleteResult:
-        return self._delete_with_index(filter, delete_all=True)
+    def delete_one(self, filter: Dict, hint: Any = None) -> DeleteResult:
+        return self._delete_with_index(filter, delete_all=False, hint=hint)
+    
+    def delete_many(self, filter: Dict, hint: Any = None) -> DeleteResult:
+        return self._delete_with_index(filter, delete_all=True, hint=hint)
     
     def _find_with_index(self, filter: Dict, find_all: bool = False) -> List[Dict]:
         """Find using indexes when possible for optimization."""
+        matches = self._iter_matches(filter, find_all)
+        if find_all:
+            return list(matches)
+        first = next(matches, None)
+        matches.close()
+        return [first] if first is not None else []
+    
+    @_synchronized_read
+    def _iter_find(self, filter: Dict, stats: Optional[Dict] = None, hint: Any = None) -> Iterator[Dict]:
+        """Stream all documents matching a filter; used by Cursor.
+        
+        The generator runs after the read lock is released, so the
+        collection is snapshotted here, while the freshly loaded data is
+        consistent.
+        """
+        return self._iter_matches(filter, find_all=True, stats=stats, hint=hint,
+                                  records=tuple(self._data))
+    
+    def _iter_matches(self, filter: Dict, find_all: bool = True,
+                      stats: Optional[Dict] = None, hint: Any = None,
+                      cache: bool = True,
+                      records: Optional[Tuple[Dict, ...]] = None) -> Iterator[Dict]:
+        """Yield the documents matching a filter as they are found.
+        
+        Serves the filter from the query cache, a geospatial index, the _id
+        map or a regular index when possible, otherwise scans the collection.
+        Matching stops as soon as the consumer stops pulling. The query is
+        recorded once the generator finishes or is closed, and the result is
+        cached only when it was consumed completely.
+        
+        Args:
+            filter: Query filter
+            find_all: Whether all matches are wanted (enables the query cache)
+            stats: Optional dict filled with execution statistics (stage,
+                indexName, docsExamined, keysExamined, nReturned, cacheHit)
+                once the generator finishes; used by explain()
+            hint: Optional index name, index keys or "$natural"; bypasses
+                the query cache, the geospatial index and plan selection
+            cache: Use the query cache (callers caching a derived result,
+                like a count, pass False)
+            records: Snapshot of the collection to scan; taken when the
+                generator starts if omitted. Scans never walk the live
+                list, which writes made while iterating (e.g. inside a
+                transaction, where nothing is reloaded) would shift.
+        """
         import time
         start_time = time.perf_counter()
         used_index = None
+        if records is None:
+            records = tuple(self._data)
+        if hint is not None:
+            hint = self._resolve_hint(hint)
+        use_cache = self._use_cache(cache) and find_all and hint is None
         
         # Try cache first (only for find_all queries)
-        if self._cache_enabled and find_all and self._cache:
-            cached = self._cache.get(filter)
+        if use_cache:
+            cache_key = self._cache.key_for(filter if filter is not None else {})
+            cached = self._cache.get(filter, cache_key)
             if cached is not None:
+                # Entries hold _ids: resolve them to the current versions
+                id_map = self._id_map
+                cached = [id_map[doc_id] for doc_id in cached if doc_id in id_map]
                 exec_time_ms = (time.perf_counter() - start_time) * 1000
                 self._query_planner.record_query(filter, exec_time_ms, len(cached), "cache")
-                return cached
+                if stats is not None:
+                    stats.update(cacheHit=True, docsExamined=0, keysExamined=0, nReturned=len(cached))
+                yield from cached
+                return
         
         # Check for geospatial queries and use geospatial index
-        geospatial_result = self._try_geospatial_index_query(filter, find_all)
+        geospatial_result = self._try_geospatial_index_query(filter, find_all) if hint is None else None
         if geospatial_result is not None:
             exec_time_ms = (time.perf_counter() - start_time) * 1000
             self._query_planner.record_query(filter, exec_time_ms, len(geospatial_result), "geospatial")
-            return geospatial_result
-        
-        # Try to use index for simple equality filters
-        if len(filter) == 1:
-            field, value = list(filter.items())[0]
-            if not isinstance(value, dict):  # Simple equality, not operator
-                indexed_ids = self._index_manager.query_index(field, value)
-                if indexed_ids is not None:
-                    # Build id -> record map
-                    id_map = {doc['_id']: doc for doc in self._data}
-                    results = [id_map[_id] for _id in indexed_ids if _id in id_map]
-                    result = results if find_all else results[:1]
-                    # Cache the result
-                    if self._cache_enabled and find_all and self._cache:
-                        self._cache.set(filter, result)
-                    exec_time_ms = (time.perf_counter() - start_time) * 1000
-                    self._query_planner.record_query(filter, exec_time_ms, len(result), f"idx_{field}")
-                    return result
-        
-        # Fall back to full scan
-        if filter == {}:
-            result = self._data if find_all else self._data[:1]
-            # Cache the result for empty filter queries
-            if self._cache_enabled and find_all and self._cache:
-                self._cache.set(filter, result)
-            exec_time_ms = (time.perf_counter() - start_time) * 1000
-            self._query_planner.record_query(filter, exec_time_ms, len(result), None)
-            return result
+            if stats is not None:
+                stats.update(stage='GEO', indexName='geospatial', cacheHit=False,
+                             docsExamined=len(geospatial_result), keysExamined=len(geospatial_result),
+                             nReturned=len(geospatial_result))
+            yield from geospatial_result
+            return
+        
+        # Narrow to candidates through the _id map or an index
+        match, access = self._prepare_filter(filter)
+        candidates, used_index = self._index_candidates(filter, access, hint)
+        if candidates is None:
+            # Fall back to full scan
+            candidates = records
+            if filter == {}:
+                filter = None
         
         found_records = []
-        for record in self._data:
-            if self._match_filter(filter, record):
-                found_records.append(record)
-                if not find_all:
-                    break
+        examined = 0
+        try:
+            if filter is not None and any(isinstance(c, dict) and '$near' in c for c in filter.values()):
+                # Sort by distance if $near was used, which needs every match
+                examined = len(candidates)
+                found_records = self._sort_by_near_distance(
+                    filter, [r for r in candidates if self._match_filter(filter, r)])
+                yield from found_records
+            else:
+                for examined, record in enumerate(candidates, 1):
+                    if filter is None or match(record):
+                        found_records.append(record)
+                        yield record
+            
+            # Cache the result with the dependencies used for invalidation
+            if use_cache:
+                near = filter is not None and any(isinstance(c, dict) and '$near' in c
+                                                  for c in filter.values())
+                self._cache.set(filter if filter is not None else {},
+                                [record['_id'] for record in found_records],
+                                _filter_fields(filter) if filter is not None else frozenset(),
+                                None if filter is None or near else match, cache_key,
+                                (time.perf_counter() - start_time) * 1000)
+        finally:
+            exec_time_ms = (time.perf_counter() - start_time) * 1000
+            self._query_planner.record_query(filter if filter is not None else {}, exec_time_ms,
+                                             len(found_records), used_index, examined, hint)
+            if stats is not None:
+                stats.update(stage=self._access_stage(used_index), indexName=used_index,
+                             cacheHit=False, docsExamined=examined,
+                             keysExamined=examined if used_index else 0,
+                             nReturned=len(found_records))
+    
+    @staticmethod
+    def _access_stage(index_name: Optional[str]) -> str:
+        """Name the access stage for the index a query used."""
+        if index_name is None:
+            return 'COLLSCAN'
+        if index_name == '_id_':
+            return 'ID_LOOKUP'
+        if index_name == 'geospatial':
+            return 'GEO'
+        if '+' in index_name:
+            return 'AND_HASH'
+        return 'IXSCAN'
+    
+    def _plan_query(self, filter: Dict, hint: Any = None) -> Dict[str, Any]:
+        """Describe the access path a filter would use, without running it.
+        
+        Mirrors the choices made by _iter_matches: geospatial index, then the
+        _id map or a regular index, then a collection scan. A hint replaces
+        the choice.
+        
+        Returns:
+            Dict with stage, indexName, estimatedDocsExamined and
+            indexesConsidered (plus the resolved hint, if any)
+        """
+        if hint is not None:
+            hint = self._resolve_hint(hint)
+            candidates, index_name = self._index_candidates(filter, hint=hint)
+            if candidates is None:
+                return {'stage': 'COLLSCAN', 'indexName': None, 'estimatedDocsExamined': len(self._data),
+                        'indexesConsidered': [], 'hint': hint}
+            return {'stage': self._access_stage(index_name), 'indexName': index_name,
+                    'estimatedDocsExamined': len(candidates), 'indexesConsidered': [index_name],
+                    'hint': hint}
+        
+        considered = []
+        for field in filter:
+            if not isinstance(field, str) or field.startswith('$'):
+                continue
+            if field == '_id':
+                considered.append('_id_')
+            considered.extend(name for name in self._index_manager.indexes_on_field(field, filter)
+                              if name not in considered)
         
-        # Sort by distance if $near was used
-        sorted_results = self._sort_by_near_distance(filter, found_records)
+        plan = {'stage': 'COLLSCAN', 'indexName': None,
+                'estimatedDocsExamined': len(self._data), 'indexesConsidered': considered}
+        geospatial_result = self._try_geospatial_index_query(filter, True)
+        if geospatial_result is not None:
+            plan.update(stage='GEO', indexName='geospatial',
+                        estimatedDocsExamined=len(geospatial_result))
+            return plan
+        candidates, index_name = self._index_candidates(filter)
+        if candidates is not None:
+            plan.update(stage=self._access_stage(index_name), indexName=index_name,
+                        estimatedDocsExamined=len(candidates))
+        return plan
+    
+    def _bitmap_filter(self, filter: Dict,
+                       conditions: Optional[Dict[str, Tuple[str, Any]]] = None) -> Optional[Tuple[int, List[str], bool]]:
+        """AND the bitsets of the equality conditions served by bitmap indexes.
+        
+        Each {field: value} or {field: {"$in": [...]}} condition on a field
+        with a bitmap index ORs the bitsets of its values; the conditions
+        are then ANDed together.
         
-        # Cache the result
-        if self._cache_enabled and find_all and self._cache:
-            self._cache.set(filter, sorted_results)
+        Args:
+            filter: Query filter
+            conditions: Indexable conditions of the filter, computed when
+                omitted
+        
+        Returns:
+            Tuple of (bits, index names, exact) or None if no condition has
+            a bitmap index. Bit n is set for candidate _id n; exact means
+            every condition of the filter was answered, so the bits are
+            precisely the matches.
+        """
+        if not isinstance(filter, dict):
+            return None
+        if conditions is None:
+            conditions = self._indexable_conditions(filter)
+        bits = None
+        names = []
+        try:
+            for field, (kind, operand) in conditions.items():
+                if kind != 'eq' or field == '_id':
+                    continue
+                name = self._index_manager.bitmap_index_for_field(field, filter)
+                if name is None:
+                    continue
+                matched = self._index_manager.bitmap_match(name, operand)
+                bits = matched if bits is None else bits & matched
+                names.append(name)
+        except TypeError:
+            return None  # Unhashable value, fall back to matching
+        if bits is None:
+            return None
+        return bits, names, len(names) == len(filter)
+    
+    def _equality_postings(self, filter: Dict) -> Optional[Tuple[str, List[str], List[Tuple[Any, List[Any]]]]]:
+        """Answer an equality-only filter from index postings alone.
+        
+        Applies when every condition is an equality ({field: value},
+        {field: {"$eq": value}}) or {field: {"$in": [...]}} on a non-None
+        scalar, and the condition fields are exactly the fields of one index
+        (or just _id). The postings are then the exact result, which makes
+        the query covered for counting and for projections onto the index
+        fields.
+        
+        Returns:
+            Tuple of (index name, index fields, [(key, ids), ...]) or None
+        """
+        values: Dict[str, List[Any]] = {}
+        for field, condition in filter.items():
+            if field.startswith('$'):
+                return None
+            if isinstance(condition, dict):
+                if set(condition) == {'$eq'}:
+                    options = [condition['$eq']]
+                elif set(condition) == {'$in'} and isinstance(condition['$in'], list):
+                    options = condition['$in']
+                else:
+                    return None
+            else:
+                options = [condition]
+            if any(value is None or isinstance(value, (dict, list)) for value in options):
+                return None
+            values[field] = options
+        if not values:
+            return None
+        
+        if list(values) == ['_id']:
+            try:
+                ids = dict.fromkeys(v for v in values['_id'] if v in self._id_map)
+            except TypeError:
+                return None
+            return '_id_', ['_id'], [(doc_id, [doc_id]) for doc_id in ids]
+        return self._index_manager.lookup_equal(values, filter)
+    
+    @_synchronized_read
+    def _find_covered(self, filter: Dict, fields: List[str], include_id: bool,
+                      stats: Optional[Dict] = None) -> Optional[List[Dict]]:
+        """Answer a find projected onto index fields from postings alone.
+        
+        Args:
+            filter: Query filter
+            fields: Projected fields (besides _id)
+            include_id: Whether _id is projected
+            stats: Optional dict filled with execution statistics
+        
+        Returns:
+            Projected documents in collection order, or None if the query is
+            not covered by an index
+        """
+        import time
+        start_time = time.perf_counter()
+        
+        covered = self._equality_postings(filter)
+        if covered is None:
+            return None
+        index_name, index_fields, postings = covered
+        if not set(fields) <= set(index_fields):
+            return None
+        
+        rows = []
+        for key, ids in postings:
+            components = key if len(index_fields) > 1 else (key,)
+            projected = {}
+            for field in fields:
+                position = index_fields.index(field)
+                value = self._index_manager.stored_value(index_name, position, components[position])
+                if value is _MISSING:
+                    return None  # Key 2 holds both 2 and 2.0: read the documents
+                projected[field] = value
+            rows.extend((doc_id, projected) for doc_id in ids)
+        rows.sort(key=lambda row: row[0])  # _id order is collection order
+        
+        results = []
+        for doc_id, projected in rows:
+            doc = {'_id': doc_id} if include_id else {}
+            doc.update(projected)
+            results.append(doc)
         
         exec_time_ms = (time.perf_counter() - start_time) * 1000
-        self._query_planner.record_query(filter, exec_time_ms, len(sorted_results), used_index)
+        self._query_planner.record_query(filter, exec_time_ms, len(results), index_name)
+        if stats is not None:
+            stats.update(stage=self._access_stage(index_name), indexName=index_name, cacheHit=False,
+                         docsExamined=0, keysExamined=len(rows), nReturned=len(results),
+                         executionTimeMillis=exec_time_ms)
+        return results
+    
+    def _prepare_filter(self, filter: Dict) -> Tuple[Any, Optional[Dict]]:
+        """Look up the cached plan for a filter's shape, compiling it on a miss.
         
-        return sorted_results
+        Args:
+            filter: Query filter
+        
+        Returns:
+            Tuple of (predicate taking a record, access plans for the shape).
+            Filters without a shape, or with operators the compiler does not
+            know, fall back to _match_filter and have no access plan cache.
+        """
+        params: List[Any] = []
+        shape = _filter_shape(filter, params)
+        if shape is None:
+            return (lambda record: self._match_filter(filter, record)), None
+        
+        entry = self._plan_cache.get(shape)
+        if entry is None:
+            try:
+                predicate = self._compile_filter_shape(shape)
+            except ValueError:
+                predicate = None  # Unknown operator, _match_filter reports it
+            entry = {'predicate': predicate, 'access': {}}
+            self._plan_cache.set(shape, entry)
+        
+        predicate = entry['predicate']
+        if predicate is None:
+            return (lambda record: self._match_filter(filter, record)), entry['access']
+        return (lambda record: predicate(record, params)), entry['access']
+    
+    def _compile_filter_shape(self, shape: Tuple) -> Any:
+        """Compile a filter shape into a predicate(record, params).
+        
+        The predicate has the semantics of _match_filter, with the filter
+        values read from ``params`` in _filter_shape order, so one compiled
+        predicate serves every filter of the shape.
+        
+        Raises:
+            ValueError: If the shape uses an unknown operator
+        """
+        positions = _count()
+        operators = self.operators
+        
+        def all_of(tests):
+            if len(tests) == 1:
+                return tests[0]
+            def match_all(record, params):
+                for test in tests:
+                    if not test(record, params):
+                        return False
+                return True
+            return match_all
+        
+        def compile_filter(items):
+            return all_of([compile_item(key, sub) for key, sub in items])
+        
+        def compile_item(key, sub):
+            if key in ('$or', '$and', '$nor'):
+                subs = [compile_filter(items) for items in sub]
+                if key == '$or':
+                    return lambda record, params: any(test(record, params) for test in subs)
+                if key == '$and':
+                    return lambda record, params: all(test(record, params) for test in subs)
+                return lambda record, params: not any(test(record, params) for test in subs)
+            if key == '$not':
+                inner = compile_filter(sub)
+                return lambda record, params: not inner(record, params)
+            return compile_condition(key, sub)
+        
+        def compile_condition(key, sub):
+            if sub == 'eq':
+                i = next(positions)
+                if '.' in key:
+                    get_path = _path_getter(key, True)
+                    
+                    def match_path_equal(record, params):
+                        value = get_path(record)
+                        if value is None:
+                            return False
+                        if isinstance(value, list):
+                            return params[i] in value
+                        return value == params[i]
+                    return match_path_equal
+                
+                def match_equal(record, params):
+                    if key not in record:
+                        return False
+                    value = record[key]
+                    return value == params[i] or (isinstance(value, list) and params[i] in value)
+                return match_equal
+            return all_of([compile_operator(key, operator, operand)
+                           for operator, operand in sub[1]])
+        
+        def compile_operator(key, operator, operand):
+            if operator == '$not':
+                inner = compile_condition(key, operand)
+                return lambda record, params: not inner(record, params)
+            if operator == '$ne':
+                inner = compile_operator(key, '$eq', operand)
+                return lambda record, params: not inner(record, params)
+            if operator == '$exists':
+                i = next(positions)
+                return lambda record, params: bool(params[i]) == (key in record)
+            function = operators.get(operator)
+            if function is None:
+                raise ValueError('Unknown operator: %s' % operator)
+            i = next(positions)
+            whole = operator in ('$in', '$all')
+            spread = operand == 'seq'
+            
+            if '.' in key:
+                get_path = _path_getter(key, True)
+                
+                def match_path(record, params):
+                    value = get_path(record)
+                    if value is None:
+                        return False
+                    cond_value = params[i]
+                    if isinstance(value, list):
+                        if whole:
+                            return function(value, cond_value)
+                        # Any array element may satisfy the condition
+                        for item in value:
+                            try:
+                                if function(item, *cond_value) if spread else function(item, cond_value):
+                                    return True
+                            except Exception:
+                                pass
+                        return False
+                    return bool(function(value, *cond_value) if spread else function(value, cond_value))
+                return match_path
+            
+            if spread and not whole:
+                return lambda record, params: key in record and bool(function(record[key], *params[i]))
+            if operator not in _ELEMENT_OPERATORS:
+                return lambda record, params: key in record and bool(function(record[key], params[i]))
+            equality = operator in ('$eq', '$in')
+            
+            def match_field(record, params):
+                if key not in record:
+                    return False
+                value = record[key]
+                cond_value = params[i]
+                if not isinstance(value, list):
+                    return bool(function(value, cond_value))
+                # Arrays match when any element does (or, for $eq and $in,
+                # the array as a whole)
+                return ((equality and bool(function(value, cond_value)))
+                        or _match_array_elements(function, value, cond_value))
+            return match_field
+        
+        return compile_filter(shape)
+    
+    def _index_candidates(self, filter: Dict, access: Optional[Dict] = None,
+                          hint: Any = None) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """Narrow a filter to candidate documents using the _id map or indexes.
+        
+        Top-level equality ({field: value}, {field: {"$eq": value}}),
+        {field: {"$in": [...]}} and range ($gt/$gte/$lt/$lte) conditions are
+        considered. Equality conditions on bitmap-indexed fields are ANDed
+        bitwise first (see _bitmap_filter); otherwise a cost-based plan (see
+        _choose_plan) decides between a collection scan, a single index and
+        an intersection of indexes.
+        Candidates are a superset of the matches in collection order, so
+        callers must still apply the full filter. Shared by find, update and
+        delete.
+        
+        Args:
+            filter: Query filter
+            access: Access plans cached for the filter's shape (from
+                _prepare_filter); looked up when omitted
+            hint: Optional index name, index keys or "$natural" that
+                replaces plan selection (see _hinted_candidates)
+        
+        Returns:
+            Tuple of (candidate documents, index name), or (None, None) if
+            no index applies and the collection must be scanned. Intersection
+            plans report their index names joined with "+".
+        """
+        if hint is not None:
+            return self._hinted_candidates(filter, hint)
+        if not isinstance(filter, dict):
+            return None, None
+        conditions = self._indexable_conditions(filter)
+        if not conditions:
+            return None, None
+        
+        # Bitmap indexes answer their equality conditions with bitwise ANDs;
+        # worth it unless nearly every document is a candidate
+        bitmap = self._bitmap_filter(filter, conditions)
+        if bitmap is not None:
+            bits, names, _ = bitmap
+            if _popcount(bits) * (1 + _PLAN_KEY_COST) < len(self._data):
+                return self._docs_for_ids(_bit_positions(bits)), '+'.join(names)
+        
+        if access is None:
+            _, access = self._prepare_filter(filter)
+        plan = self._choose_plan(conditions, access, filter)
+        if plan['type'] == 'COLLSCAN':
+            return None, None
+        
+        try:
+            id_lists = [self._condition_ids(field, *conditions[field], filter)
+                        for field in plan['fields']]
+        except TypeError:
+            return None, None  # Unhashable value, fall back to matching
+        if any(ids is None for ids in id_lists):
+            if access is not None:
+                access.clear()  # An index went away; replan next time
+            return None, None
+        
+        if len(id_lists) == 1:
+            ids = id_lists[0]
+        else:
+            # Intersect starting from the shortest posting list
+            id_lists.sort(key=len)
+            ids = _intersect_postings(id_lists)
+        return self._docs_for_ids(ids), '+'.join(plan['indexes'])
+    
+    def _resolve_hint(self, hint: Any) -> str:
+        """Normalize a hint to "$natural" or the name of an existing index.
+        
+        Args:
+            hint: "$natural" (or {"$natural": 1}), an index name, or index
+                keys as [(field, direction), ...] or {field: direction}
+        
+        Returns:
+            "$natural" or the index name ("_id_" for the _id map)
+        
+        Raises:
+            ValueError: If the hint does not correspond to an existing index
+        """
+        indexes = [info for info in self._index_manager.list_indexes() if 'keys' in info]
+        if isinstance(hint, str):
+            if hint in ('$natural', '_id_') or any(info['name'] == hint for info in indexes):
+                return hint
+        elif isinstance(hint, (list, tuple, dict)):
+            items = list(hint.items()) if isinstance(hint, dict) else list(hint)
+            if [tuple(item) for item in items] == [('$natural', 1)]:
+                return '$natural'
+            try:
+                keys = [(field, direction) for field, direction in items]
+            except (TypeError, ValueError):
+                keys = None
+            if keys == [('_id', 1)]:
+                return '_id_'
+            for info in indexes:
+                if keys and [tuple(key) for key in info['keys']] == keys:
+                    return info['name']
+        raise ValueError(f"hint provided does not correspond to an existing index: {hint!r}")
+    
+    def _hinted_candidates(self, filter: Dict, hint: Any) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """Narrow a filter to candidate documents through a hinted index.
+        
+        Conditions on a single-field index's field are looked up in it;
+        otherwise the whole index is scanned (the collection, for multikey
+        indexes; see IndexManager.hinted_ids). "$natural" means a collection
+        scan. Candidates are a superset of the matches in collection order.
+        
+        Returns:
+            Tuple of (candidate documents, index name), or (None, None) for
+            a collection scan
+        """
+        name = self._resolve_hint(hint)
+        if name == '$natural':
+            return None, None
+        if name != '_id_' and not self._index_manager.is_usable(name, filter):
+            raise ValueError(f"hint provided does not correspond to an eligible index: {hint!r} "
+                             f"(the filter does not imply its partialFilterExpression)")
+        conditions = self._indexable_conditions(filter) if isinstance(filter, dict) else {}
+        if name == '_id_':
+            condition = conditions.get('_id')
+            if condition is None:
+                return list(self._data), name
+            return self._docs_for_ids(self._condition_ids('_id', *condition)), name
+        ids = self._index_manager.hinted_ids(name, conditions)
+        if ids is None:
+            return list(self._data), name  # Whole multikey index: scan instead
+        return self._docs_for_ids(ids), name
+    
+    def _indexable_conditions(self, filter: Dict) -> Dict[str, Tuple[str, Any]]:
+        """Extract the top-level conditions an index could serve.
+        
+        Returns:
+            Dict of field -> (kind, operand), kind being "eq" (list of values),
+            "range" ((min, max, min_inclusive, max_inclusive)), or "prefix"
+            or "iprefix" (the literal prefix of an anchored $regex, matched
+            with or without case)
+        """
+        conditions = {}
+        for field, condition in filter.items():
+            if not isinstance(field, str) or field.startswith('$'):
+                continue
+            
+            if isinstance(condition, dict):
+                operators = set(condition)
+                if '$regex' in operators and operators <= {'$regex', '$options'} and field != '_id':
+                    try:
+                        pattern = (_regex_with_options(condition)['$regex'] if '$options' in operators
+                                   else condition['$regex'])
+                    except (ValueError, TypeError, re.error):
+                        continue
+                    prefix = _regex_prefix(pattern)
+                    if prefix is not None:
+                        conditions[field] = ('iprefix' if prefix[1] else 'prefix', prefix[0])
+                    continue
+                if operators == {'$eq'}:
+                    kind, values = 'eq', [condition['$eq']]
+                elif operators == {'$in'} and isinstance(condition['$in'], (list, tuple)):
+                    kind, values = 'eq', list(condition['$in'])
+                elif operators and operators <= {'$gt', '$gte', '$lt', '$lte'} and field != '_id':
+                    low = [op for op in ('$gt', '$gte') if op in condition]
+                    high = [op for op in ('$lt', '$lte') if op in condition]
+                    if len(low) > 1 or len(high) > 1:
+                        continue
+                    bounds = (condition[low[0]] if low else None, condition[high[0]] if high else None)
+                    if any(isinstance(v, (dict, list, bool)) for v in bounds) or bounds == (None, None):
+                        continue
+                    conditions[field] = ('range', (bounds[0], bounds[1],
+                                                   low == ['$gte'], high == ['$lte']))
+                    continue
+                else:
+                    continue
+            else:
+                kind, values = 'eq', [condition]
+            
+            # Sparse indexes omit explicit nulls, so None must be scanned
+            if any(value is None or isinstance(value, (dict, list)) for value in values):
+                continue
+            conditions[field] = (kind, values)
+        return conditions
+    
+    def _condition_ids(self, field: str, kind: str, operand: Any,
+                       filter: Optional[Dict] = None) -> Optional[List[Any]]:
+        """Resolve one indexable condition to document ids (None if unindexed).
+        
+        ``filter`` is the whole query filter, which decides whether partial
+        indexes may serve the condition.
+        """
+        if field == '_id':
+            return [value for value in operand if value in self._id_map]
+        if kind == 'range':
+            return self._index_manager.query_index_range(field, *operand, filter=filter)
+        if kind in ('prefix', 'iprefix'):
+            name = self._index_manager.prefix_index_for_field(field, kind == 'iprefix', filter)
+            return None if name is None else self._index_manager.query_index_prefix(name, operand)
+        if self._index_manager.find_index_for_field(field, filter) is None:
+            return None
+        return _merge_postings(self._index_manager.query_index(field, value, filter)
+                               for value in operand)
+    
+    def _estimate_condition(self, field: str, kind: str, operand: Any,
+                            filter: Optional[Dict] = None) -> Optional[Tuple[str, float, Tuple]]:
+        """Estimate the postings a condition reads from its index statistics.
+        
+        Returns:
+            Tuple of (index name, estimated ids, statistics snapshot) or None
+            if no index serves the condition
+        """
+        if field == '_id':
+            return '_id_', float(len(operand)), ()
+        if kind in ('prefix', 'iprefix'):
+            name = self._index_manager.prefix_index_for_field(field, kind == 'iprefix', filter)
+            if name is None:
+                return None
+            stats = self._index_manager.index_stats(name)
+            return (name, self._index_manager.estimate_prefix(name, operand),
+                    (stats['entries'], stats['distinct_keys']))
+        name = self._index_manager.find_index_for_field(field, filter)
+        if name is None:
+            return None
+        stats = self._index_manager.index_stats(name)
+        snapshot = (stats['entries'], stats['distinct_keys'])
+        if kind == 'range':
+            estimate = self._index_manager.estimate_range(field, *operand, filter=filter)
+            if estimate is None:
+                return None  # Hash-only index cannot serve ranges
+            return name, estimate, snapshot
+        return name, len(operand) * stats['expected_postings'], snapshot
+    
+    def _choose_plan(self, conditions: Dict[str, Tuple[str, Any]],
+                     access: Optional[Dict] = None, filter: Optional[Dict] = None) -> Dict[str, Any]:
+        """Pick the cheapest access plan for the indexable conditions.
+        
+        Costs are in documents fetched and matched; index postings cost
+        _PLAN_KEY_COST each. Candidates are a collection scan, each single
+        index, and intersections of the most selective indexes (assuming
+        independent conditions). The winner is kept in ``access`` keyed by
+        the condition fields and kinds, and re-costed once collection or
+        index sizes drift by more than _PLAN_DRIFT_RATIO, or the indexes on
+        those fields change.
+        
+        Args:
+            conditions: Indexable conditions from _indexable_conditions
+            access: Access plans cached for the filter's shape, if any
+            filter: The query filter; partial indexes are only considered
+                when it implies their expression
+        
+        Returns:
+            Plan dict with type (COLLSCAN, IXSCAN or INTERSECT), fields and
+            indexes
+        """
+        shape = tuple(sorted((field, kind) for field, (kind, _) in conditions.items()))
+        considered = tuple(tuple(self._index_manager.indexes_on_field(field, filter)) for field, _ in shape)
+        total = len(self._data)
+        
+        cached = access.get(shape) if access is not None else None
+        if cached is not None and cached['considered'] == considered and not self._plan_drifted(cached, total):
+            return cached['plan']
+        
+        estimates = []
+        snapshot = {}
+        for field, (kind, operand) in conditions.items():
+            estimate = self._estimate_condition(field, kind, operand, filter)
+            if estimate is not None:
+                name, rows, stats = estimate
+                estimates.append((min(rows, float(total)), field, name))
+                snapshot[name] = stats
+        estimates.sort()
+        
+        plan = {'type': 'COLLSCAN', 'fields': [], 'indexes': [], 'cost': float(total)}
+        for rows, field, name in estimates[:1]:
+            cost = rows * (1 + _PLAN_KEY_COST)
+            if cost < plan['cost']:
+                plan = {'type': 'IXSCAN', 'fields': [field], 'indexes': [name], 'cost': cost}
+        for size in range(2, len(estimates) + 1):
+            chosen = estimates[:size]
+            selectivity = 1.0
+            for rows, _, _ in chosen:
+                selectivity *= rows / total if total else 0.0
+            cost = sum(rows for rows, _, _ in chosen) * _PLAN_KEY_COST + total * selectivity
+            if cost < plan['cost']:
+                plan = {'type': 'INTERSECT', 'fields': [field for _, field, _ in chosen],
+                        'indexes': [name for _, _, name in chosen], 'cost': cost}
+        
+        if access is not None:
+            access[shape] = {'plan': plan, 'considered': considered,
+                             'total': total, 'snapshot': snapshot}
+        return plan
+    
+    def _plan_drifted(self, cached: Dict[str, Any], total: int) -> bool:
+        """Check whether statistics moved too far since a plan was costed."""
+        def drifted(old: float, new: float) -> bool:
+            low, high = min(old, new), max(old, new)
+            return high > max(low, 1) * _PLAN_DRIFT_RATIO
+        
+        if drifted(cached['total'], total):
+            return True
+        for name, snapshot in cached['snapshot'].items():
+            if not snapshot:
+                continue
+            stats = self._index_manager.index_stats(name)
+            if stats is None:
+                return True
+            if drifted(snapshot[0], stats['entries']) or drifted(snapshot[1], stats['distinct_keys']):
+                return True
+        return False
+    
+    def _docs_for_ids(self, ids: List[Any]) -> List[Dict]:
+        """Resolve document ids to stored documents, in collection order."""
+        id_map = self._id_map
+        docs = {}
+        for _id in ids:
+            doc = id_map.get(_id)
+            if doc is not None:
+                docs[_id] = doc
+        try:
+            return [docs[_id] for _id in sorted(docs)]
+        except TypeError:
+            return list(docs.values())
+    
+    @_synchronized_read
+    def _find_in_index_order(self, filter: Dict, field: str, direction: int,
+                             count: int, stats: Optional[Dict] = None,
+                             hint: Any = None) -> Optional[List[Dict]]:
+        """Return the first matches in the order of an index on a field.
+        
+        Documents are streamed in index order and the filter is applied
+        residually, stopping as soon as ``count`` matches are collected.
+        
+        Args:
+            filter: Query filter
+            field: Sort field (top-level)
+            direction: 1 for ascending, -1 for descending
+            count: Number of matches needed (skip + limit)
+            stats: Optional dict filled with execution statistics
+            hint: Optional hint; the walk is only used if it names the
+                walked index
+        
+        Returns:
+            Matching documents in sort order, or None if no ordered index on
+            the field can serve the sort
+        """
+        import time
+        start_time = time.perf_counter()
+        
+        if '.' in field or any(isinstance(c, dict) and '$near' in c for c in filter.values()):
+            return None
+        walk = self._index_manager.iter_index_order(field, direction)
+        if walk is None:
+            return None
+        index_name, ids = walk
+        if hint is not None:
+            hint = self._resolve_hint(hint)
+            if hint != index_name:
+                return None
+        match, _ = self._prepare_filter(filter)
+        
+        results = []
+        id_map = self._id_map
+        examined = 0
+        for examined, doc_id in enumerate(ids, 1):
+            record = id_map.get(doc_id)
+            if record is not None and match(record):
+                results.append(record)
+                if len(results) >= count:
+                    break
+        
+        exec_time_ms = (time.perf_counter() - start_time) * 1000
+        self._query_planner.record_query(filter, exec_time_ms, len(results), index_name, examined, hint)
+        if stats is not None:
+            stats.update(stage='IXSCAN', indexName=index_name, cacheHit=False,
+                         docsExamined=examined, keysExamined=examined, nReturned=len(results),
+                         executionTimeMillis=exec_time_ms)
+        return results
     
     def _try_geospatial_index_query(self, filter: Dict, find_all: bool) -> Optional[List[Dict]]:
         """Try to use geospatial index for location-based queries.
@@ -4897,8 +8695,7 @@ class JSONlite:
                 )
                 
                 if candidate_ids:
-                    # Build id -> record map
-                    id_map = {doc['_id']: doc for doc in self._data}
+                    id_map = self._id_map
                     results = []
                     
                     for doc_id in candidate_ids:
@@ -4909,6 +8706,8 @@ class JSONlite:
                             if record_point:
                                 distance = _haversine_distance(near_point, record_point)
                                 if min_dist <= distance and (max_dist is None or distance <= max_dist):
+                                    # Attach the distance to a copy, not the stored document
+                                    record = dict(record)
                                     record['_geo_distance_' + field] = distance
                                     results.append(record)
                     
@@ -4930,8 +8729,7 @@ class JSONlite:
                 candidate_ids = self._index_manager.query_geospatial_within(field, geometry)
                 
                 if candidate_ids:
-                    # Build id -> record map
-                    id_map = {doc['_id']: doc for doc in self._data}
+                    id_map = self._id_map
                     results = []
                     
                     for doc_id in candidate_ids:
@@ -5058,6 +8856,9 @@ class Collection:
         self._name = name
         self._db_path = database._db_path
         self._collection_file = os.path.join(self._db_path, f"{name}.json")
+        pool = database._client._cache_pool
+        if pool is not None and 'cache_pool' not in kwargs:
+            kwargs = dict(kwargs, cache_pool=pool, cache_namespace=f"{database._name}.{name}")
         self._jsonlite = JSONlite(self._collection_file, **kwargs)
         # Set parent reference for $lookup to access sibling collections
         self._jsonlite._parent_collection = self
@@ -5100,41 +8901,48 @@ class Collection:
         """Find and update a single document."""
         return self._jsonlite.find_one_and_update(filter, update)
     
-    def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+    def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False,
+                   hint: Any = None) -> UpdateResult:
         """Update a single document."""
-        return self._jsonlite.update_one(filter, update, upsert)
+        return self._jsonlite.update_one(filter, update, upsert, hint=hint)
     
-    def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+    def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False,
+                    hint: Any = None) -> UpdateResult:
         """Update multiple documents."""
-        return self._jsonlite.update_many(filter, update, upsert)
+        return self._jsonlite.update_many(filter, update, upsert, hint=hint)
     
-    def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+    def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False,
+                    hint: Any = None) -> UpdateResult:
         """Replace a single document."""
-        return self._jsonlite.replace_one(filter, replacement, upsert)
+        return self._jsonlite.replace_one(filter, replacement, upsert, hint=hint)
     
-    def delete_one(self, filter: Dict[str, Any]) -> DeleteResult:
+    def delete_one(self, filter: Dict[str, Any], hint: Any = None) -> DeleteResult:
         """Delete a single document."""
-        return self._jsonlite.delete_one(filter)
+        return self._jsonlite.delete_one(filter, hint=hint)
     
-    def delete_many(self, filter: Dict[str, Any]) -> DeleteResult:
+    def delete_many(self, filter: Dict[str, Any], hint: Any = None) -> DeleteResult:
         """Delete multiple documents."""
-        return self._jsonlite.delete_many(filter)
+        return self._jsonlite.delete_many(filter, hint=hint)
     
-    def count_documents(self, filter: Dict[str, Any]) -> int:
+    def count_documents(self, filter: Dict[str, Any], hint: Any = None, cache: bool = True) -> int:
         """Count documents matching filter."""
-        return self._jsonlite.count_documents(filter)
+        return self._jsonlite.count_documents(filter, hint=hint, cache=cache)
     
-    def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None) -> List[Any]:
+    def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, cache: bool = True) -> List[Any]:
         """Get distinct values for a key."""
-        return self._jsonlite.distinct(key, filter)
+        return self._jsonlite.distinct(key, filter, cache=cache)
     
-    def aggregate(self, pipeline: List[Dict[str, Any]]) -> AggregationCursor:
+    def aggregate(self, pipeline: List[Dict[str, Any]], explain: bool = False,
+                  cache: bool = True) -> Union[AggregationCursor, Dict[str, Any]]:
         """Run aggregation pipeline."""
-        return self._jsonlite.aggregate(pipeline)
+        return self._jsonlite.aggregate(pipeline, explain=explain, cache=cache)
     
-    def create_index(self, keys: Union[str, List[Tuple[str, int]]], unique: bool = False, sparse: bool = False, name: Optional[str] = None) -> str:
+    def create_index(self, keys: Union[str, List[Tuple[str, int]]], unique: bool = False, sparse: bool = False, name: Optional[str] = None,
+                     partialFilterExpression: Optional[Dict[str, Any]] = None,
+                     collation: Optional[Dict[str, Any]] = None) -> str:
         """Create an index."""
-        return self._jsonlite.create_index(keys, unique, sparse, name)
+        return self._jsonlite.create_index(keys, unique, sparse, name, partialFilterExpression,
+                                           collation)
     
     def drop_index(self, index_or_name: Union[str, List[Tuple[str, int]]]) -> None:
         """Drop an index."""
@@ -5146,6 +8954,7 @@ class Collection:
     
     def drop(self) -> None:
         """Drop the collection (delete the file)."""
+        self._jsonlite.clear_cache()
         if os.path.exists(self._collection_file):
             os.remove(self._collection_file)
         # Also drop associated index files
@@ -5382,10 +9191,17 @@ class MongoClient:
         
         Args:
             data_dir: Base directory for all databases (default: './jsonlite_data')
+            shared_cache: Give all collections one CachePool, with a single
+                memory budget, instead of a query cache each (default: True).
+                cache_max_bytes and cache_max_entry_bytes then size the pool.
             **kwargs: Additional options for collections (compression_enabled, compression_level, cache_enabled, etc.)
         """
         self._data_dir = data_dir
         self._databases: Dict[str, Database] = {}
+        self._cache_pool = None
+        if kwargs.pop('shared_cache', True) and kwargs.get('cache_enabled', True):
+            self._cache_pool = CachePool(max_bytes=kwargs.pop('cache_max_bytes', _CACHE_MAX_BYTES),
+                                         max_entry_bytes=kwargs.pop('cache_max_entry_bytes', None))
         self._collection_kwargs = kwargs
         
         # Create data directory if it doesn't exist
@@ -5464,6 +9280,21 @@ class MongoClient:
             })
         return databases
     
+    def get_cache_stats(self) -> Optional[Dict]:
+        """Get statistics of the shared query cache pool.
+        
+        Returns:
+            Dict with size, memory_bytes, max_bytes, evictions and usage per
+            collection namespace (see CachePool.stats), or None without a
+            shared cache
+        """
+        return self._cache_pool.stats if self._cache_pool is not None else None
+    
+    def clear_cache(self) -> None:
+        """Clear the cached results of every collection in the shared pool."""
+        if self._cache_pool is not None:
+            self._cache_pool.clear()
+    
     def _get_db_size(self, path: str) -> int:
         """Get total size of database directory in bytes."""
         total = 0
@@ -83,6 +83,8 @@ class TransactionContext:
             self.db._data = restored_data
             # Also update _database["data"] since _save_database uses _database
             self.db._database["data"] = restored_data
+            if hasattr(self.db, '_rebuild_index_data'):
+                self.db._rebuild_index_data()
         if self.backup_indexes is not None:
             restored_indexes = copy.deepcopy(self.backup_indexes)
             self.db._indexes = restored_indexes
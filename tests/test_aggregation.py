@@ -783,3 +783,56 @@ class TestExpressionOperators:
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+
+class TestDottedPaths:
+    """Test dotted field paths in $group, $sort and cursor sorts."""
+    
+    @pytest.fixture
+    def nested_db(self):
+        test_file = '/tmp/test_aggregation_dotted.json'
+        if os.path.exists(test_file):
+            os.remove(test_file)
+        db = JSONlite(test_file)
+        db.insert_many([
+            {"name": "a", "meta": {"team": "x", "score": 3}},
+            {"name": "b", "meta": {"team": "y", "score": 1}},
+            {"name": "c", "meta": {"team": "x", "score": 5}},
+            {"name": "d"},
+        ])
+        yield db
+        if os.path.exists(test_file):
+            os.remove(test_file)
+    
+    def test_group_by_dotted_path(self, nested_db):
+        result = nested_db.aggregate([
+            {"$match": {"meta": {"$exists": True}}},
+            {"$group": {"_id": "$meta.team",
+                        "total": {"$sum": "$meta.score"},
+                        "top": {"$max": "$meta.score"}}},
+            {"$sort": {"_id": 1}},
+        ]).all()
+        assert result == [
+            {"_id": "x", "total": 8, "top": 5},
+            {"_id": "y", "total": 1, "top": 1},
+        ]
+    
+    def test_sort_stage_by_dotted_path(self, nested_db):
+        result = nested_db.aggregate([
+            {"$sort": {"meta.score": -1}},
+        ]).all()
+        assert [doc["name"] for doc in result] == ["c", "a", "b", "d"]
+    
+    def test_cursor_sort_by_dotted_path(self, nested_db):
+        result = nested_db.find({}).sort("meta.score", 1).all()
+        assert [doc["name"] for doc in result] == ["b", "a", "c", "d"]
+    
+    def test_path_getter_matches_array_semantics(self, nested_db):
+        from jsonlite.jsonlite import _path_getter
+        doc = {"items": [{"tags": ["p", "q"]}, {"tags": "r"}, 3, {"other": 1}]}
+        assert _path_getter("items.tags", True)(doc) == ["p", "q", "r"]
+        assert _path_getter("items.tags", True) is _path_getter("items.tags", True)
+        assert _path_getter("items.missing", True)(doc) is None
+        assert _path_getter("items.tags")(doc) is None
+        assert _path_getter("a.b")({"a": {"b": 2}}) == 2
+        assert nested_db._get_value_by_path(doc, "items.tags") == ["p", "q", "r"]
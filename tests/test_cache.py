@@ -126,14 +126,19 @@ class TestCacheInvalidation:
             os.unlink(db._filename)
     
     def test_cache_cleared_on_insert_one(self, db):
-        """Cache should be cleared after insert_one."""
+        """Inserting a matching document drops the cached query."""
         # Populate cache
         db.find({'age': 25}).all()
         assert db.get_cache_stats()['size'] == 1
         
-        # Insert should clear cache
+        # A document the filter does not match leaves the entry valid
         db.insert_one({'name': 'Charlie', 'age': 35})
+        assert db.get_cache_stats()['size'] == 1
+        
+        # A matching document invalidates it
+        db.insert_one({'name': 'Dora', 'age': 25})
         assert db.get_cache_stats()['size'] == 0
+        assert len(db.find({'age': 25}).all()) == 2
     
     def test_cache_cleared_on_insert_many(self, db):
         """Cache should be cleared after insert_many."""
@@ -149,14 +154,19 @@ class TestCacheInvalidation:
         assert db.get_cache_stats()['size'] == 0
     
     def test_cache_cleared_on_update(self, db):
-        """Cache should be cleared after update operations."""
+        """Updating a field the filter reads drops the cached query."""
         # Populate cache
         db.find({'name': 'Alice'}).all()
         assert db.get_cache_stats()['size'] == 1
         
-        # Update should clear cache
+        # Other fields leave the entry valid, and hits see the new version
         db.update_one({'name': 'Alice'}, {'$set': {'age': 26}})
+        assert db.get_cache_stats()['size'] == 1
+        assert db.find({'name': 'Alice'}).all()[0]['age'] == 26
+        
+        db.update_one({'name': 'Alice'}, {'$set': {'name': 'Alicia'}})
         assert db.get_cache_stats()['size'] == 0
+        assert db.find({'name': 'Alice'}).all() == []
     
     def test_cache_cleared_on_delete(self, db):
         """Cache should be cleared after delete operations."""
@@ -167,6 +177,22 @@ class TestCacheInvalidation:
         # Delete should clear cache
         db.delete_one({'name': 'Alice'})
         assert db.get_cache_stats()['size'] == 0
+    
+    def test_cache_cleared_on_external_write(self, db):
+        """Writes through another instance drop the cache on the next reload."""
+        db.find({'name': 'Alice'}).all()
+        db.count_documents({'age': 25})
+        assert db.get_cache_stats()['size'] == 2
+        
+        # Own writes keep unrelated entries
+        db.insert_one({'name': 'Charlie', 'age': 35})
+        assert db.get_cache_stats()['size'] == 2
+        
+        other = JSONlite(db._filename)
+        other.update_one({'name': 'Alice'}, {'$set': {'name': 'Alicia'}})
+        other.insert_one({'name': 'Dora', 'age': 25})
+        assert db.find({'name': 'Alice'}).all() == []
+        assert db.count_documents({'age': 25}) == 2
 
 
 class TestCacheStats:
@@ -333,3 +359,346 @@ class TestCacheWithEmptyFilter:
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
+
+
+class TestCopyOnWriteResults:
+    """Results share stored documents until a caller mutates them."""
+    
+    @pytest.fixture
+    def db(self):
+        """Create a test database with nested documents."""
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            db.insert_many([
+                {'name': 'Alice', 'tags': ['a', 'b'], 'address': {'city': 'NYC'}},
+                {'name': 'Bob', 'tags': ['c'], 'address': {'city': 'LA'}},
+            ])
+            yield db
+            os.unlink(f.name)
+    
+    def test_cache_holds_references(self, db):
+        """Cached entries resolve to stored documents instead of copies."""
+        db.find({'name': 'Alice'}).all()
+        assert db._cache.get({'name': 'Alice'}) == [1]
+        hit = next(db._iter_matches({'name': 'Alice'}))
+        assert hit is db._id_map[1]
+    
+    def test_nested_mutation_does_not_leak(self, db):
+        """Mutating nested values of a result leaves stored data intact."""
+        result = db.find({'name': 'Alice'}).all()[0]
+        result['tags'].append('z')
+        result['address']['city'] = 'Boston'
+        fresh = db.find({'name': 'Alice'}).all()[0]
+        dict(fresh)['tags'].append('y')
+        {**fresh}['address']['zip'] = '10001'
+        
+        again = db.find({'name': 'Alice'}).all()[0]
+        assert again['tags'] == ['a', 'b']
+        assert again['address'] == {'city': 'NYC'}
+        assert result['tags'] == ['a', 'b', 'z']
+    
+    def test_find_one_result_is_private(self, db):
+        """find_one results can be modified without touching the engine."""
+        doc = db.find_one({'name': 'Bob'})
+        del doc['_id']
+        doc['address']['city'] = 'SF'
+        assert db.find_one({'name': 'Bob'})['address'] == {'city': 'LA'}
+        assert '_id' in db.find_one({'name': 'Bob'})
+    
+    def test_aggregation_results_are_private(self, db):
+        """Aggregation stages build new documents instead of copying inputs."""
+        results = db.aggregate([{'$unwind': '$tags'}, {'$addFields': {'n': 1}}]).all()
+        assert [r['tags'] for r in results] == ['a', 'b', 'c']
+        results[0]['address']['city'] = 'Paris'
+        stored = db.find_one({'name': 'Alice'})
+        assert stored['tags'] == ['a', 'b']
+        assert stored['address'] == {'city': 'NYC'}
+        assert 'n' not in stored
+    
+    def test_results_behave_like_dicts(self, db):
+        """Results serialize and compare like plain documents."""
+        import copy
+        import json
+        result = db.find_one({'name': 'Alice'})
+        plain = {'_id': result['_id'], 'name': 'Alice', 'tags': ['a', 'b'],
+                 'address': {'city': 'NYC'}}
+        assert isinstance(result, dict)
+        assert result == plain
+        assert json.loads(json.dumps(result)) == plain
+        assert type(copy.deepcopy(result)) is dict
+
+
+class TestFieldAwareInvalidation:
+    """Test that writes drop only the cache entries they affect."""
+    
+    @pytest.fixture
+    def db(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            db.insert_many([
+                {'name': 'Alice', 'age': 25, 'address': {'city': 'NYC', 'zip': '10001'}},
+                {'name': 'Bob', 'age': 30, 'address': {'city': 'LA', 'zip': '90001'}},
+            ])
+            yield db
+            os.unlink(f.name)
+    
+    def _cached(self, db, filter):
+        return db._cache.get(filter) is not None
+    
+    def test_update_checks_nested_paths(self, db):
+        """Sibling sub-document fields do not invalidate each other."""
+        db.find({'address.city': 'NYC'}).all()
+        db.find({'address': {'$exists': True}}).all()
+        db.update_one({'name': 'Alice'}, {'$set': {'address.zip': '10002'}})
+        assert self._cached(db, {'address.city': 'NYC'})
+        assert not self._cached(db, {'address': {'$exists': True}})
+        assert db.find({'address.city': 'NYC'}).all()[0]['address']['zip'] == '10002'
+    
+    def test_logical_filters_track_every_field(self, db):
+        """Fields under $or/$and/$nor/$not are dependencies too."""
+        db.find({'$or': [{'name': 'Alice'}, {'age': {'$gt': 28}}]}).all()
+        db.update_many({}, {'$set': {'nickname': 'x'}})
+        assert self._cached(db, {'$or': [{'name': 'Alice'}, {'age': {'$gt': 28}}]})
+        db.update_one({'name': 'Bob'}, {'$inc': {'age': -10}})
+        assert not self._cached(db, {'$or': [{'name': 'Alice'}, {'age': {'$gt': 28}}]})
+        assert [d['name'] for d in db.find({'$or': [{'name': 'Alice'}, {'age': {'$gt': 28}}]}).all()] == ['Alice']
+    
+    def test_delete_drops_matching_entries_only(self, db):
+        """Deleting a document drops only the queries it matched."""
+        db.find({'age': 25}).all()
+        db.find({'age': 30}).all()
+        db.find({}).all()
+        db.delete_one({'name': 'Bob'})
+        assert self._cached(db, {'age': 25})
+        assert not self._cached(db, {'age': 30})
+        assert not self._cached(db, {})
+        assert db.get_cache_stats()['invalidations'] == 2
+    
+    def test_empty_filter_survives_updates(self, db):
+        """Updates never change which documents {} matches."""
+        db.find({}).all()
+        db.update_many({}, {'$inc': {'age': 1}})
+        assert self._cached(db, {})
+        assert [d['age'] for d in db.find({}).all()] == [26, 31]
+    
+    def test_rollback_clears_cache(self, db):
+        """Results cached inside a rolled back transaction are dropped."""
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.insert_one({'name': 'Carol', 'age': 25})
+                assert len(db.find({'age': 25}).all()) == 2
+                raise RuntimeError("rollback")
+        assert len(db.find({'age': 25}).all()) == 1
+    
+    def test_callable_filters_invalidate_on_any_write(self, db):
+        """Filters whose dependencies are unknown are dropped by any update."""
+        older = lambda value, threshold: value > threshold
+        db.find({'age': {older: 26}}).all()
+        assert self._cached(db, {'age': {older: 26}})
+        db.update_one({'name': 'Alice'}, {'$set': {'nickname': 'Al'}})
+        assert self._cached(db, {'age': {older: 26}})
+        from jsonlite.jsonlite import _filter_fields
+        assert _filter_fields({'$where': 'x'}) is None
+        assert _filter_fields({'age': {older: 1}, '$nor': [{'a.b': 1}]}) == frozenset({'age', 'a.b'})
+
+
+class TestCacheMemoryLimits:
+    """Test byte accounting, the memory budget and TTL expiry."""
+    
+    def test_memory_reported_in_stats(self):
+        from jsonlite.jsonlite import QueryCache
+        cache = QueryCache()
+        cache.set({'a': 1}, list(range(100)))
+        stats = cache.stats
+        assert stats['memory_bytes'] > 100 * 8
+        cache.invalidate({'a': 1})
+        assert cache.stats['memory_bytes'] == 0
+    
+    def test_byte_budget_evicts_lru(self):
+        from jsonlite.jsonlite import QueryCache, _approximate_size
+        entry = _approximate_size(list(range(50)))
+        cache = QueryCache(max_bytes=entry * 2, max_entry_bytes=entry)
+        cache.set({'a': 1}, list(range(50)))
+        cache.set({'a': 2}, list(range(50)))
+        cache.get({'a': 1})
+        cache.set({'a': 3}, list(range(50)))
+        assert cache.get({'a': 2}) is None
+        assert cache.get({'a': 1}) is not None
+        stats = cache.stats
+        assert stats['evictions'] == 1
+        assert stats['memory_bytes'] <= stats['max_bytes']
+    
+    def test_oversized_entry_is_rejected(self):
+        from jsonlite.jsonlite import QueryCache
+        cache = QueryCache(max_bytes=10000, max_entry_bytes=2000)
+        cache.set({'a': 1}, [1, 2, 3])
+        cache.set({'big': 1}, list(range(1000)))
+        assert cache.get({'big': 1}) is None
+        assert cache.get({'a': 1}) == [1, 2, 3]
+        assert cache.stats['rejected'] == 1
+    
+    def test_large_results_are_sampled(self):
+        from jsonlite.jsonlite import _approximate_size
+        docs = [{'name': 'x' * 40, 'n': i} for i in range(10000)]
+        exact = sum(_approximate_size(doc) for doc in docs[:64])
+        estimate = _approximate_size(docs)
+        assert abs(estimate - exact * 10000 / 64) < exact * 10000 / 64 * 0.1
+    
+    def test_ttl_expires_entries(self, monkeypatch):
+        from jsonlite.jsonlite import QueryCache
+        now = [100.0]
+        monkeypatch.setattr(QueryCache, '_now', staticmethod(lambda: now[0]))
+        cache = QueryCache(ttl=5)
+        cache.set({'a': 1}, [1])
+        now[0] = 104.0
+        assert cache.get({'a': 1}) == [1]
+        now[0] = 105.0
+        assert cache.get({'a': 1}) is None
+        assert cache.stats['expirations'] == 1
+        assert cache.stats['size'] == 0
+    
+    def test_database_options(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name, cache_max_bytes=4096, cache_ttl=60, cache_max_entry_bytes=1024)
+            try:
+                db.insert_many([{'n': i} for i in range(200)])
+                db.find({}).all()
+                db.find({'n': 1}).all()
+                stats = db.get_cache_stats()
+                assert stats['max_bytes'] == 4096 and stats['ttl'] == 60
+                assert stats['size'] == 1 and stats['rejected'] == 1
+                assert 0 < stats['memory_bytes'] <= 1024
+            finally:
+                os.unlink(f.name)
+
+
+class TestCacheKeys:
+    """Test structural cache keys."""
+    
+    def test_flat_equality_fast_path(self):
+        from jsonlite.jsonlite import QueryCache
+        cache = QueryCache()
+        key = cache.key_for({'a': 1, 'b': 'x'})
+        assert key == cache.key_for({'b': 'x', 'a': 1})
+        assert key[0] == 'eq'
+        assert key != cache.key_for({'a': 1, 'b': 'y'})
+    
+    def test_operator_filters_use_shape(self):
+        from jsonlite.jsonlite import QueryCache
+        cache = QueryCache()
+        key = cache.key_for({'ts': {'$gt': 5}, 'tags': {'$in': ['a', 'b']}})
+        assert key[0] == 'shape'
+        assert key == cache.key_for({'ts': {'$gt': 5}, 'tags': {'$in': ['a', 'b']}})
+        assert key != cache.key_for({'ts': {'$gt': 6}, 'tags': {'$in': ['a', 'b']}})
+        assert key != cache.key_for({'ts': {'$gte': 5}, 'tags': {'$in': ['a', 'b']}})
+        assert cache.key_for({'a': {'$in': [[1], 2]}}) != cache.key_for({'a': {'$in': [1, 2]}})
+    
+    def test_values_keep_their_types(self):
+        from datetime import datetime
+        from jsonlite.jsonlite import QueryCache
+        cache = QueryCache()
+        when = datetime(2024, 1, 2)
+        assert cache.key_for({'t': {'$gt': when}}) != cache.key_for({'t': {'$gt': str(when)}})
+    
+    def test_callables_are_keyed_by_identity(self):
+        from jsonlite.jsonlite import QueryCache
+        cache = QueryCache()
+        first = lambda value, cond: value == cond
+        second = lambda value, cond: value == cond
+        assert cache.key_for({'a': {first: 1}}) == cache.key_for({'a': {first: 1}})
+        assert cache.key_for({'a': {first: 1}}) != cache.key_for({'a': {second: 1}})
+        assert not any(isinstance(part, str) and 'callable' in part
+                       for part in cache.key_for({'a': {first: 1}}))
+        cache.set({'a': {first: 1}}, [1])
+        assert cache.get({'a': {first: 1}}) == [1]
+        assert cache.get({'a': {second: 1}}) is None
+
+
+class TestDerivedResultCaching:
+    """Test caching of aggregate, count_documents and distinct results."""
+    
+    @pytest.fixture
+    def db(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            db.insert_many([
+                {'status': 'a', 'country': 'us', 'amount': 10},
+                {'status': 'a', 'country': 'de', 'amount': 20},
+                {'status': 'b', 'country': 'us', 'amount': 5},
+            ])
+            yield db
+            os.unlink(f.name)
+    
+    PIPELINE = [
+        {'$match': {'status': 'a'}},
+        {'$group': {'_id': '$country', 'total': {'$sum': '$amount'}}},
+        {'$sort': {'_id': 1}},
+    ]
+    
+    def test_aggregate_hit_and_invalidation(self, db):
+        first = db.aggregate(self.PIPELINE).all()
+        db.reset_cache_stats()
+        assert db.aggregate(self.PIPELINE).all() == first
+        assert db.get_cache_stats()['hits'] == 1
+        
+        # Rejected by the leading $match: the result stays valid
+        db.insert_one({'status': 'b', 'country': 'fr', 'amount': 1})
+        assert db.aggregate(self.PIPELINE).all() == first
+        assert db.get_cache_stats()['hits'] == 2
+        
+        db.insert_one({'status': 'a', 'country': 'fr', 'amount': 1})
+        assert db.aggregate(self.PIPELINE).all() == [
+            {'_id': 'de', 'total': 20}, {'_id': 'fr', 'total': 1}, {'_id': 'us', 'total': 10}]
+        db.update_many({'country': 'de'}, {'$inc': {'amount': 1}})
+        assert db.aggregate(self.PIPELINE).all()[0] == {'_id': 'de', 'total': 21}
+    
+    def test_aggregate_results_are_private(self, db):
+        db.aggregate(self.PIPELINE).all()[0]['total'] = -1
+        assert db.aggregate(self.PIPELINE).all()[0]['total'] == 20
+    
+    def test_aggregate_key_keeps_stage_order(self, db):
+        ascending = db.aggregate([{'$sort': {'status': 1, 'amount': 1}}]).all()
+        descending = db.aggregate([{'$sort': {'amount': 1, 'status': 1}}]).all()
+        assert [d['amount'] for d in ascending] == [10, 20, 5]
+        assert [d['amount'] for d in descending] == [5, 10, 20]
+    
+    def test_aggregate_opt_outs(self, db):
+        db.reset_cache_stats()
+        db.aggregate(self.PIPELINE, cache=False).all()
+        db.aggregate(self.PIPELINE, cache=False).all()
+        lookup = [{'$lookup': {'from': 'other', 'localField': 'country',
+                               'foreignField': 'code', 'as': 'c'}}]
+        from jsonlite.jsonlite import _pipeline_cacheable
+        assert not _pipeline_cacheable(lookup)
+        assert not _pipeline_cacheable([{'$facet': {'x': [{'$sample': {'size': 1}}]}}])
+        assert _pipeline_cacheable(self.PIPELINE)
+        assert db.get_cache_stats()['hits'] == 0
+    
+    def test_count_documents_cached(self, db):
+        assert db.count_documents({'country': 'us'}) == 2
+        db.reset_cache_stats()
+        assert db.count_documents({'country': 'us'}) == 2
+        assert db.get_cache_stats()['hits'] == 1
+        db.update_one({'status': 'b'}, {'$set': {'amount': 6}})
+        assert db.count_documents({'country': 'us'}) == 2
+        assert db.get_cache_stats()['hits'] == 2
+        db.update_one({'status': 'b'}, {'$set': {'country': 'ca'}})
+        assert db.count_documents({'country': 'us'}) == 1
+        db.delete_one({'country': 'us'})
+        assert db.count_documents({'country': 'us'}) == 0
+        assert db.count_documents({'country': 'us'}, cache=False) == 0
+    
+    def test_distinct_cached(self, db):
+        assert sorted(db.distinct('country')) == ['de', 'us']
+        db.reset_cache_stats()
+        values = db.distinct('country')
+        values.append('zz')
+        assert sorted(db.distinct('country')) == ['de', 'us']
+        assert db.get_cache_stats()['hits'] == 2
+        db.update_many({}, {'$inc': {'amount': 1}})
+        assert db.get_cache_stats()['size'] >= 1
+        assert sorted(db.distinct('country', {'status': 'a'})) == ['de', 'us']
+        db.update_one({'country': 'de'}, {'$set': {'country': 'at'}})
+        assert sorted(db.distinct('country')) == ['at', 'us']
+        assert sorted(db.distinct('country', {'status': 'a'})) == ['at', 'us']
+        assert sorted(db.distinct('country', cache=False)) == ['at', 'us']
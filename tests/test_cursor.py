@@ -275,3 +275,178 @@ def test_projection_no_match(temp_db):
     db, _ = temp_db
     results = db.find({'name': 'Nonexistent'}).projection({'name': 1}).all()
     assert results == []
+
+
+# ============== TOP-K / LAZINESS ==============
+
+def test_sort_limit_matches_full_sort(temp_db):
+    db, _ = temp_db
+    full = db.find({}).sort("score", -1).all()
+    top = db.find({}).sort("score", -1).skip(1).limit(3).all()
+    assert top == full[1:4]
+
+
+def test_sort_limit_uses_top_k(temp_db, monkeypatch):
+    db, _ = temp_db
+    import jsonlite.jsonlite as engine
+    calls = []
+    original = engine.heapq.nsmallest
+
+    def spy(n, iterable, key=None):
+        calls.append(n)
+        return original(n, iterable, key=key)
+
+    monkeypatch.setattr(engine.heapq, 'nsmallest', spy)
+    results = db.find({}).sort("age", 1).skip(1).limit(2).all()
+    assert [r['age'] for r in results] == [25, 28]
+    assert calls == [3]
+
+
+def test_cursor_does_not_modify_engine_documents(temp_db):
+    db, _ = temp_db
+    cursor = db.find({})
+    results = cursor.sort("age", -1).all()
+    results[0]['name'] = 'Changed'
+    # Stored order and contents are untouched
+    assert [r['name'] for r in db._data][:2] == ['Alice', 'Bob']
+    assert db.find_one({'age': 35})['name'] == 'Charlie'
+
+
+def test_repeated_execution_is_stable(temp_db):
+    db, _ = temp_db
+    cursor = db.find({}).sort("age", 1).skip(2).limit(2)
+    assert len(cursor) == 2
+    assert [r['age'] for r in cursor] == [28, 30]
+    assert cursor.count() == 6
+
+
+# ============== INDEX-BACKED SORT ==============
+
+def test_sort_desc_strings(temp_db):
+    db, _ = temp_db
+    results = db.find({}).sort("name", -1).all()
+    assert [r['name'] for r in results] == ['Frank', 'Eve', 'David', 'Charlie', 'Bob', 'Alice']
+
+
+def test_indexed_sort_matches_scan(temp_db):
+    db, _ = temp_db
+    db.insert_one({'name': 'Grace', 'age': None, 'city': 'Boston', 'score': 88})
+    queries = [
+        ({}, "score", -1, 0, 3),
+        ({}, "age", 1, 2, 10),
+        ({'city': 'NYC'}, "name", -1, 0, 2),
+        ({'age': {'$gt': 25}}, "score", 1, 1, 2),
+    ]
+    expected = [db.find(f).sort(k, d).skip(s).limit(n).all() for f, k, d, s, n in queries]
+    for field in ("score", "age", "name"):
+        db.create_index(field)
+    actual = [db.find(f).sort(k, d).skip(s).limit(n).all() for f, k, d, s, n in queries]
+    assert actual == expected
+
+
+def test_indexed_sort_stops_at_limit(temp_db, monkeypatch):
+    db, _ = temp_db
+    db.create_index("age")
+    calls = count_matches(db, monkeypatch)
+    results = db.find({'city': 'NYC'}).sort("age", -1).limit(2).all()
+    assert [r['name'] for r in results] == ['Charlie', 'Alice']
+    # Walked Charlie(35), Eve(32), Alice(30) and stopped
+    assert [db._id_map[i]['name'] for i in calls if db._id_map.get(i)] == ['Charlie', 'Eve', 'Alice']
+    assert db._query_planner._query_history[-1]['used_index'] == 'age_1'
+
+
+def test_indexed_sort_none_last(temp_db):
+    db, _ = temp_db
+    db.create_index("age")
+    db.insert_one({'name': 'Grace', 'city': 'Boston'})
+    for direction in (1, -1):
+        results = db.find({}).sort("age", direction).limit(7).all()
+        assert results[-1]['name'] == 'Grace'
+
+
+# ============== STREAMING ==============
+
+def count_matches(db, monkeypatch):
+    calls = []
+    original = db._prepare_filter
+
+    def counting(filter):
+        match, access = original(filter)
+
+        def counted(record):
+            calls.append(record.get('_id'))
+            return match(record)
+        return counted, access
+
+    monkeypatch.setattr(db, '_prepare_filter', counting)
+    return calls
+
+
+def test_find_is_lazy(temp_db, monkeypatch):
+    db, _ = temp_db
+    calls = count_matches(db, monkeypatch)
+    cursor = db.find({'age': {'$gt': 20}})
+    assert calls == []
+    for record in cursor:
+        if record['name'] == 'Bob':
+            break
+    # Scan stopped at the second document
+    assert len(calls) == 2
+
+
+def test_iterating_twice_evaluates_once(temp_db, monkeypatch):
+    db, _ = temp_db
+    calls = count_matches(db, monkeypatch)
+    cursor = db.find({'city': 'NYC'})
+    first = [r['name'] for r in cursor]
+    second = [r['name'] for r in cursor]
+    assert first == second == ['Alice', 'Charlie', 'Frank']
+    assert len(cursor) == 3
+    assert cursor[1]['name'] == 'Charlie'
+    assert len(calls) == 6
+
+
+def test_batch_size(temp_db, monkeypatch):
+    db, _ = temp_db
+    calls = count_matches(db, monkeypatch)
+    cursor = db.find({'age': {'$gt': 20}}).batch_size(4)
+    assert next(iter(cursor))['name'] == 'Alice'
+    # One batch of four documents was fetched
+    assert len(calls) == 4
+    assert [r['name'] for r in cursor] == ['Alice', 'Bob', 'Charlie', 'David', 'Eve', 'Frank']
+
+    with pytest.raises(ValueError):
+        cursor.batch_size(-1)
+    with pytest.raises(TypeError):
+        cursor.batch_size("10")
+
+
+def test_writes_while_iterating(temp_db):
+    db, _ = temp_db
+    # Streams walk a snapshot, even in a transaction where nothing is reloaded
+    with db.transaction():
+        visited = []
+        for record in db.find({}):
+            visited.append(record['name'])
+            db.delete_one({'_id': record['_id']})
+        assert len(visited) == 6
+    assert db.count_documents({}) == 0
+
+    db.insert_many([{'n': n} for n in range(5)])
+    with db.transaction():
+        visited = 0
+        for record in db.find({'n': {'$gte': 0}}):
+            visited += 1
+            db.insert_one({'n': record['n'] + 10})
+            assert visited <= 5
+    assert visited == 5
+    assert db.count_documents({}) == 10
+
+
+def test_partial_iteration_is_not_cached(temp_db):
+    db, _ = temp_db
+    db.clear_cache()
+    for _ in db.find({'city': 'LA'}):
+        break
+    assert db.find({'city': 'LA'}).count() == 2
+    assert len(db.find({'city': 'LA'}).all()) == 2
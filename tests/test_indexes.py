@@ -4,6 +4,7 @@ import pytest
 import os
 import tempfile
 from jsonlite import JSONlite
+from jsonlite.jsonlite import IndexManager
 
 
 @pytest.fixture
@@ -267,5 +268,764 @@ class TestIndexPersistence:
         assert len(results) == 2
 
 
+class TestPrimaryIdIndex:
+    """Test the maintained _id -> document primary index."""
+
+    def test_find_one_by_id_uses_primary_index(self, populated_db):
+        """find_one on _id resolves through the _id map."""
+        doc = populated_db.find_one({"_id": 3})
+        assert doc['name'] == "Charlie"
+        assert populated_db._query_planner._query_history[-1]['used_index'] == "_id_"
+        assert populated_db.find_one({"_id": 999}) is None
+        assert populated_db.find_one({"_id": [1]}) is None
+
+    def test_id_map_tracks_writes(self, populated_db):
+        """Inserts, updates and deletes keep the _id map in sync."""
+        new_id = populated_db.insert_one({"name": "Frank"}).inserted_id
+        assert populated_db._id_map[new_id]['name'] == "Frank"
+
+        populated_db.update_one({"_id": new_id}, {"$set": {"age": 50}})
+        assert populated_db.find_one({"_id": new_id})['age'] == 50
+        assert populated_db._id_map[new_id] is populated_db._data[-1]
+
+        populated_db.delete_one({"_id": new_id})
+        assert new_id not in populated_db._id_map
+        assert populated_db.find_one({"_id": new_id}) is None
+
+        populated_db.delete_many({})
+        assert populated_db._id_map == {}
+
+    def test_id_map_restored_on_rollback(self, populated_db):
+        """Rolling back a transaction rebuilds the _id map."""
+        with pytest.raises(RuntimeError):
+            with populated_db.transaction():
+                populated_db.delete_one({"_id": 1})
+                raise RuntimeError("abort")
+        assert populated_db._id_map[1] is populated_db._data[0]
+
+
+class TestIndexedWrites:
+    """Test that update and delete locate targets through indexes."""
+
+    def _count_matches(self, db, monkeypatch):
+        calls = []
+        original = db._prepare_filter
+
+        def counting(filter):
+            match, access = original(filter)
+
+            def counted(record):
+                calls.append(record.get('_id'))
+                return match(record)
+            return counted, access
+
+        monkeypatch.setattr(db, '_prepare_filter', counting)
+        return calls
+
+    def test_update_uses_index(self, populated_db, monkeypatch):
+        """update_many on an indexed equality only visits candidates."""
+        populated_db.create_index("city")
+        calls = self._count_matches(populated_db, monkeypatch)
+
+        result = populated_db.update_many({"city": "LA"}, {"$inc": {"score": 1}})
+        assert result.matched_count == 2
+        assert sorted(calls) == [2, 5]
+        assert populated_db.find_one({"name": "Eve"})['score'] == 89
+
+    def test_delete_one_on_unique_index(self, db, monkeypatch):
+        """delete_one on a unique index touches a single document."""
+        for i in range(20):
+            db.insert_one({"email": f"user{i}@example.com"})
+        db.create_index("email", unique=True)
+        calls = self._count_matches(db, monkeypatch)
+
+        result = db.delete_one({"email": "user7@example.com"})
+        assert result.deleted_count == 1
+        assert calls == [8]
+        assert db.count_documents({}) == 19
+        assert db.find({"email": "user7@example.com"}).all() == []
+
+    def test_delete_many_compacts_once(self, populated_db):
+        """delete_many removes every match and keeps the rest in order."""
+        populated_db.create_index("age")
+        result = populated_db.delete_many({"age": {"$in": [25, 35]}})
+        assert result.deleted_count == 3
+        names = [doc['name'] for doc in populated_db.find({}).all()]
+        assert names == ["Bob", "Eve"]
+        assert populated_db.find({"age": 25}).all() == []
+
+    def test_replace_one_maintains_index(self, populated_db):
+        """replace_one keeps indexes in sync with the replacement."""
+        populated_db.create_index("city")
+        populated_db.replace_one({"name": "Bob"}, {"name": "Bob", "city": "Boston"})
+        assert [r['name'] for r in populated_db.find({"city": "Boston"}).all()] == ["Bob"]
+        assert [r['name'] for r in populated_db.find({"city": "LA"}).all()] == ["Eve"]
+
+    def test_find_one_and_delete_maintains_index(self, populated_db):
+        """find_one_and_delete removes the document from indexes."""
+        populated_db.create_index("city")
+        deleted = populated_db.find_one_and_delete({"city": "Chicago"})
+        assert deleted['name'] == "Diana"
+        assert populated_db.find({"city": "Chicago"}).all() == []
+
+
+class TestCoveredQueries:
+    """Test queries answered from index postings alone."""
+
+    def _forbid_documents(self, db, monkeypatch):
+        def fail(*args, **kwargs):
+            raise AssertionError("document was read")
+        monkeypatch.setattr(db, '_match_filter', fail)
+        monkeypatch.setattr(db, '_prepare_filter', lambda filter: (fail, None))
+
+    def test_count_documents_from_postings(self, populated_db, monkeypatch):
+        """count_documents on an indexed equality is the postings size."""
+        populated_db.create_index("city")
+        self._forbid_documents(populated_db, monkeypatch)
+        assert populated_db.count_documents({"city": "NYC"}) == 2
+        assert populated_db.count_documents({"city": {"$eq": "LA"}}) == 2
+        assert populated_db.count_documents({"city": {"$in": ["LA", "Chicago", "LA"]}}) == 3
+        assert populated_db.count_documents({"city": "Paris"}) == 0
+        assert populated_db.count_documents({"_id": 3}) == 1
+
+    def test_count_documents_compound(self, populated_db, monkeypatch):
+        """Equality on every field of a compound index is covered."""
+        populated_db.create_index([("city", 1), ("age", 1)])
+        self._forbid_documents(populated_db, monkeypatch)
+        assert populated_db.count_documents({"age": 25, "city": "NYC"}) == 2
+        assert populated_db.count_documents({"city": "LA", "age": {"$in": [28, 30]}}) == 2
+
+    def test_count_documents_falls_back(self, populated_db):
+        """Filters the index cannot answer still count correctly."""
+        populated_db.create_index("city")
+        assert populated_db.count_documents({"city": "NYC", "age": 25}) == 2
+        assert populated_db.count_documents({"age": {"$gt": 26}}) == 3
+        assert populated_db.count_documents({}) == 5
+
+    def test_covered_find(self, populated_db, monkeypatch):
+        """A projection onto the index fields is built from postings."""
+        populated_db.create_index("city")
+        expected = populated_db.find({"city": "LA"}).projection({"city": 1}).all()
+        self._forbid_documents(populated_db, monkeypatch)
+        assert populated_db.find({"city": "LA"}).projection({"city": 1}).all() == expected
+        assert expected == [{"_id": 2, "city": "LA"}, {"_id": 5, "city": "LA"}]
+        assert populated_db.find({"city": {"$in": ["NYC", "LA"]}}).projection(
+            {"city": 1, "_id": 0}).skip(1).limit(2).all() == [{"city": "LA"}, {"city": "NYC"}]
+        assert populated_db._query_planner._query_history[-1]['used_index'] == "city_1"
+
+    def test_covered_find_keeps_stored_types(self, db):
+        """Keys shared by 2 and 2.0 (or 1 and True) return the stored values."""
+        db.insert_many([{"x": 2.0}, {"x": True}, {"x": "a"}, {"x": 2}])
+        db.create_index("x")
+        assert db.find({"x": 2}).projection({"x": 1, "_id": 0}).all() == [{"x": 2.0}, {"x": 2}]
+        assert db.find({"x": 1}).projection({"x": 1, "_id": 0}).all() == [{"x": True}]
+        assert db.find({"x": "a"}).projection({"x": 1, "_id": 0}).explain()[
+            "executionStats"]["totalDocsExamined"] == 0
+        assert db.count_documents({"x": 2}) == 2
+        # With one numeric type stored, the key converts back without reads
+        db.insert_many([{"y": 2.0}, {"y": 3.5}])
+        db.create_index("y")
+        plan = db.find({"y": 2}).projection({"y": 1, "_id": 0}).explain()
+        assert plan["executionStats"]["totalDocsExamined"] == 0
+        assert db.find({"y": 2}).projection({"y": 1, "_id": 0}).all() == [{"y": 2.0}]
+
+    def test_uncovered_projection_reads_documents(self, populated_db):
+        """Projecting a field outside the index reads the documents."""
+        populated_db.create_index("city")
+        results = populated_db.find({"city": "LA"}).projection({"name": 1, "_id": 0}).all()
+        assert results == [{"name": "Bob"}, {"name": "Eve"}]
+
+    def test_postings_restored_on_rollback(self, populated_db):
+        """Rolled back inserts disappear from postings used for counting."""
+        populated_db.create_index("city")
+        with pytest.raises(RuntimeError):
+            with populated_db.transaction():
+                populated_db.insert_one({"name": "Frank", "city": "NYC"})
+                raise RuntimeError("rollback")
+        assert populated_db.count_documents({"city": "NYC"}) == 2
+
+
+class TestIndexedDistinct:
+    """Test distinct() answered from indexes."""
+
+    def test_distinct_from_index_keys(self, populated_db, monkeypatch):
+        """Without a filter the index key set is the answer."""
+        populated_db.create_index("city")
+        monkeypatch.setattr(populated_db, '_get_value_by_path', None)
+        assert populated_db.distinct("city") == ["Chicago", "LA", "NYC"]
+        assert populated_db._query_planner._query_history[-1]['used_index'] == "city_1"
+
+    def test_distinct_matches_scan(self, populated_db):
+        """Indexed and unindexed distinct return the same values."""
+        populated_db.insert_one({"name": "Frank"})
+        expected = populated_db.distinct("age")
+        populated_db.create_index("age")
+        assert sorted(populated_db.distinct("age"), key=str) == sorted(expected, key=str)
+        assert None in expected
+
+    def test_distinct_with_filter_uses_planner(self, populated_db):
+        """Filtered distinct reads only the documents the index selects."""
+        populated_db.create_index("city")
+        assert sorted(populated_db.distinct("age", {"city": "NYC"})) == [25]
+        assert sorted(populated_db.distinct("age", {"city": {"$in": ["LA", "NYC"]}})) == [25, 28, 30]
+        assert sorted(populated_db.distinct("city", {"city": {"$in": ["LA", "Paris"]}})) == ["LA"]
+        assert sorted(populated_db.distinct("city", {"age": {"$gte": 30}})) == ["Chicago", "LA"]
+
+    def test_distinct_keeps_stored_types(self, db):
+        """Covered distinct returns stored values, not the filter's operands."""
+        db.insert_many([{"x": 2.0}, {"x": True}, {"y": 4.0}, {"y": 5.0}])
+        db.create_index("x")
+        db.create_index("y")
+        assert db.distinct("x", {"x": {"$in": [1, 2]}}) == [2.0, True]
+        assert db.distinct("y", {"y": {"$in": [5, 4]}}) == [5.0, 4.0]
+        assert db._query_planner._query_history[-1]['used_index'] == "y_1"
+
+    def test_distinct_dotted_and_array_values(self, db):
+        """Dotted paths are resolved and arrays contribute their elements."""
+        db.insert_many([
+            {"address": {"city": "NYC"}, "tags": ["a", "b"]},
+            {"address": {"city": "LA"}, "tags": ["b", "c"]},
+            {"address": {"city": "NYC"}, "tags": [{"x": 1}, {"x": 1}]},
+        ])
+        assert db.distinct("address.city") == ["NYC", "LA"]
+        assert db.distinct("tags") == ["a", "b", "c", {"x": 1}]
+
+
+
+class TestMultikeyIndex:
+    """Test indexes on array fields."""
+
+    @pytest.fixture
+    def tagged_db(self, db):
+        db.insert_many([
+            {"name": "a", "tags": ["red", "blue", "red"], "sizes": [1, 10]},
+            {"name": "b", "tags": ["green"], "sizes": [4]},
+            {"name": "c", "tags": [], "sizes": []},
+            {"name": "d", "tags": "red", "sizes": 7},
+            {"name": "e", "items": [{"sku": "x1"}, {"sku": "x2"}]},
+        ])
+        return db
+
+    def _names(self, db, filter):
+        return [doc["name"] for doc in db.find(filter).all()]
+
+    def test_one_posting_per_element(self, tagged_db):
+        """Array elements become keys, deduplicated per document."""
+        tagged_db.create_index("tags")
+        data = tagged_db._index_manager._indexes["tags_1"]["data"]
+        assert list(data["red"]) == [1, 4]
+        assert list(data["blue"]) == [1]
+        assert None in data  # Documents without the field
+        assert tagged_db._index_manager.index_stats("tags_1")["multikey"] is True
+
+    def test_queries_match_scan(self, tagged_db):
+        """Indexed queries return what a collection scan returns."""
+        filters = [
+            {"tags": "red"},
+            {"tags": {"$in": ["blue", "green"]}},
+            {"tags": {"$eq": "green"}},
+            {"sizes": {"$gt": 5}},
+            {"sizes": {"$gt": 3, "$lt": 5}},
+            {"sizes": {"$gte": 2, "$lte": 3}},
+            {"items.sku": "x2"},
+            {"tags": {"$ne": "red"}},
+        ]
+        expected = [self._names(tagged_db, f) for f in filters]
+        for field in ("tags", "sizes", "items.sku"):
+            tagged_db.create_index(field)
+        assert [self._names(tagged_db, f) for f in filters] == expected
+        assert expected[0] == ["a", "d"]
+        assert expected[1] == ["a", "b"]
+        # [1, 10] matches: 10 > 3 and 1 < 5 are met by different elements
+        assert expected[4] == ["a", "b"]
+        plan = tagged_db.find({"tags": "red"}).explain()["queryPlanner"]["winningPlan"]
+        assert plan["inputStage"]["indexName"] == "tags_1"
+
+    def test_counts_are_deduplicated(self, tagged_db):
+        """A document matching several elements is counted once."""
+        tagged_db.create_index("tags")
+        assert tagged_db.count_documents({"tags": {"$in": ["red", "blue"]}}) == 2
+        assert len(tagged_db.find({"tags": {"$in": ["red", "blue"]}}).all()) == 2
+
+    def test_empty_arrays_and_missing_fields_are_indexed(self, tagged_db):
+        """[] and a missing field still have keys, so full index scans see them."""
+        from jsonlite.jsonlite import _EMPTY_ARRAY
+        tagged_db.create_index("tags")
+        data = tagged_db._index_manager._indexes["tags_1"]["data"]
+        assert list(data[_EMPTY_ARRAY]) == [3]
+        assert list(data[None]) == [5]
+        assert self._names(tagged_db, {"tags": {"$gte": "a"}}) == ["a", "b", "d"]
+        everyone = ["a", "b", "c", "d", "e"]
+        assert [doc["name"] for doc in tagged_db.find({}).hint("tags_1").all()] == everyone
+        assert tagged_db.count_documents({}, hint="tags_1") == 5
+        tagged_db.update_many({}, {"$set": {"seen": True}}, hint="tags_1")
+        assert tagged_db.count_documents({"seen": True}) == 5
+        # Rolled back writes keep the key intact
+        with pytest.raises(RuntimeError):
+            with tagged_db.transaction():
+                tagged_db.insert_one({"name": "f", "tags": []})
+                raise RuntimeError("rollback")
+        tagged_db.delete_many({"tags": []}, hint="tags_1")
+        assert _EMPTY_ARRAY not in tagged_db._index_manager._indexes["tags_1"]["data"]
+        assert tagged_db.count_documents({}, hint="tags_1") == 4
+
+    def test_maintained_on_writes(self, tagged_db):
+        """Updates and deletes move element postings."""
+        tagged_db.create_index("tags")
+        tagged_db.update_one({"name": "a"}, {"$set": {"tags": ["blue", "pink"]}})
+        assert self._names(tagged_db, {"tags": "red"}) == ["d"]
+        assert self._names(tagged_db, {"tags": "pink"}) == ["a"]
+        tagged_db.update_one({"name": "b"}, {"$push": {"tags": "pink"}})
+        assert self._names(tagged_db, {"tags": "pink"}) == ["a", "b"]
+        tagged_db.delete_many({"tags": "pink"})
+        data = tagged_db._index_manager._indexes["tags_1"]["data"]
+        assert "pink" not in data and "blue" not in data
+
+    def test_index_order_sort_skips_multikey(self, tagged_db):
+        """Sorting by an array field does not walk the multikey index."""
+        expected = [doc["name"] for doc in tagged_db.find({"name": {"$in": ["a", "b"]}}).sort("tags").all()]
+        tagged_db.create_index("tags")
+        assert [doc["name"] for doc in tagged_db.find(
+            {"name": {"$in": ["a", "b"]}}).sort("tags").all()] == expected
+        assert tagged_db._index_manager.iter_index_order("tags") is None
+
+    def test_unique_multikey(self, db):
+        """Uniqueness holds across documents, not within one array."""
+        db.create_index("codes", unique=True)
+        db.insert_one({"codes": ["a", "b", "a"]})
+        with pytest.raises(ValueError):
+            db.insert_one({"codes": ["c", "b"]})
+
+    def test_parallel_arrays_rejected(self, db):
+        """A compound index cannot hold two array fields of one document."""
+        db.create_index([("a", 1), ("b", 1)])
+        db.insert_one({"a": [1, 2], "b": 3})
+        assert db.count_documents({"a": 2, "b": 3}) == 1
+        with pytest.raises(ValueError):
+            db.insert_one({"a": [1], "b": [2]})
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+
+class TestHashedIndex:
+    """Test hashed indexes."""
+
+    @pytest.fixture
+    def url_db(self, db):
+        db.insert_many([
+            {"url": "https://example.com/" + "a" * 200, "n": -1},
+            {"url": "https://example.com/" + "b" * 200, "n": -2},
+            {"url": "https://example.com/" + "a" * 200, "n": 3},
+            {"n": 4},
+        ])
+        return db
+
+    def test_keys_are_hashes(self, url_db):
+        """Postings are keyed by 64-bit integers, not the values."""
+        name = url_db.create_index([("url", "hashed")])
+        assert name == "url_hashed"
+        data = url_db._index_manager._indexes[name]["data"]
+        assert all(isinstance(key, int) for key in data if key is not None)
+        assert len(data) == 3  # Two URLs and the missing field
+        assert url_db._index_manager.find_index_for_field("url") == name
+
+    def test_equality_uses_index(self, url_db):
+        """Equality and $in are served by the hashed index."""
+        url_db.create_index([("url", "hashed")])
+        url = "https://example.com/" + "a" * 200
+        assert [doc["n"] for doc in url_db.find({"url": url}).all()] == [-1, 3]
+        plan = url_db.find({"url": {"$in": [url]}}).explain()["queryPlanner"]["winningPlan"]
+        assert plan["inputStage"]["indexName"] == "url_hashed"
+        assert url_db.count_documents({"url": url}) == 2
+
+    def test_collisions_are_verified(self, db):
+        """Values sharing a hash (-1 and -2 in CPython) are told apart by the document."""
+        db.insert_many([{"n": -1}, {"n": -2}, {"n": -2}])
+        db.create_index([("n", "hashed")])
+        assert db.count_documents({"n": -1}) == 1
+        assert db.count_documents({"n": -2}) == 2
+        assert db.distinct("n") == [-1, -2]
+
+    def test_ranges_and_sorts_scan(self, url_db):
+        """Hashes have no order, so ranges fall back to a scan."""
+        url_db.create_index([("n", "hashed")])
+        assert [doc["n"] for doc in url_db.find({"n": {"$gt": 0}}).all()] == [3, 4]
+        plan = url_db.find({"n": {"$gt": 0}}).explain()["queryPlanner"]["winningPlan"]
+        assert plan["stage"] == "COLLSCAN"
+        assert [doc["n"] for doc in url_db.find().sort("n", -1).all()] == [4, 3, -1, -2]
+
+    def test_maintained_and_persisted(self, url_db):
+        """Writes keep the index current, and it survives a reload."""
+        url_db.create_index([("url", "hashed")])
+        url_db.update_many({"n": 3}, {"$set": {"url": "x"}})
+        url_db.delete_one({"n": -2})
+        reopened = JSONlite(url_db._filename)
+        assert [doc["n"] for doc in reopened.find({"url": "x"}).all()] == [3]
+        assert reopened.list_indexes()[0]["keys"] == [["url", "hashed"]]
+
+    def test_invalid_hashed_indexes(self, db):
+        """Hashed indexes are single-field and not unique."""
+        with pytest.raises(ValueError):
+            db.create_index([("a", "hashed"), ("b", 1)])
+        with pytest.raises(ValueError):
+            db.create_index([("a", "hashed")], unique=True)
+
+    def test_smaller_than_regular_index(self, url_db):
+        """Hashing long strings reduces index memory."""
+        manager = url_db._index_manager
+        url_db.create_index("url")
+        url_db.create_index([("url", "hashed")])
+        assert manager.index_memory("url_hashed") < manager.index_memory("url_1")
+
+
+class TestPartialIndex:
+    """Test indexes with a partialFilterExpression."""
+
+    @pytest.fixture
+    def orders_db(self, db):
+        db.insert_many([
+            {"n": n, "status": "active" if n % 50 == 0 else "done", "score": n % 100}
+            for n in range(200)
+        ])
+        db.create_index("n", partial_filter_expression={"status": "active"})
+        return db
+
+    def _plan(self, db, filter):
+        winning = db.find(filter).explain()["queryPlanner"]["winningPlan"]
+        return winning.get("inputStage", winning)
+
+    def test_only_matching_documents_indexed(self, orders_db):
+        """Documents outside the expression stay out of the index."""
+        stats = orders_db._index_manager.index_stats("n_1")
+        assert stats["entries"] == 4
+        assert orders_db.list_indexes()[0]["partialFilterExpression"] == {"status": "active"}
+
+    def test_used_when_filter_implies_expression(self, orders_db):
+        """A filter containing the expression's equality uses the index."""
+        filter = {"status": "active", "n": {"$gte": 100}}
+        assert self._plan(orders_db, filter)["indexName"] == "n_1"
+        assert [doc["n"] for doc in orders_db.find(filter).all()] == [100, 150]
+        assert orders_db.count_documents({"status": "active", "n": 50}) == 1
+
+    def test_not_used_otherwise(self, orders_db):
+        """Filters that may match unindexed documents scan instead."""
+        for filter in ({"n": 120}, {"status": "done", "n": 120}, {"status": {"$ne": "done"}, "n": 100}):
+            assert self._plan(orders_db, filter)["stage"] == "COLLSCAN"
+        assert [doc["status"] for doc in orders_db.find({"n": 120}).all()] == ["done"]
+        assert orders_db.count_documents({"n": {"$lt": 3}}) == 3
+        assert orders_db.distinct("n", {"n": {"$lt": 2}}) == [0, 1]
+        assert [doc["n"] for doc in orders_db.find().sort("n", -1).limit(2)] == [199, 198]
+
+    def test_plan_follows_filter_values(self, orders_db):
+        """Filters of one shape may or may not imply the expression."""
+        assert orders_db.count_documents({"status": "done", "n": 100}) == 0
+        assert orders_db.count_documents({"status": "active", "n": 100}) == 1
+        assert orders_db.count_documents({"status": "done", "n": 101}) == 1
+
+    def test_range_expression(self, db):
+        """Tighter bounds imply the expression's bounds."""
+        db.insert_many([{"score": s, "user": s % 7} for s in range(100)])
+        db.create_index("user", partial_filter_expression={"score": {"$gt": 90}})
+        assert self._plan(db, {"score": {"$gte": 95}, "user": 3})["indexName"] == "user_1"
+        assert self._plan(db, {"score": 97, "user": 6})["indexName"] == "user_1"
+        assert self._plan(db, {"score": {"$gte": 90}, "user": 6})["stage"] == "COLLSCAN"
+        assert [doc["score"] for doc in db.find({"score": {"$gte": 95}, "user": 4}).all()] == [95]
+
+    def test_maintained_on_writes(self, orders_db):
+        """Updates move documents in and out of the index."""
+        orders_db.update_one({"n": 1}, {"$set": {"status": "active"}})
+        orders_db.update_one({"n": 0}, {"$set": {"status": "done"}})
+        orders_db.delete_one({"n": 50})
+        filter = {"status": "active", "n": {"$lt": 150}}
+        assert [doc["n"] for doc in orders_db.find(filter).all()] == [1, 100]
+        assert orders_db._index_manager.index_stats("n_1")["entries"] == 3
+
+    def test_persisted(self, orders_db):
+        """The expression survives a reload."""
+        reopened = JSONlite(orders_db._filename)
+        filter = {"status": "active", "n": 150}
+        assert self._plan(reopened, filter)["indexName"] == "n_1"
+        assert reopened._index_manager.index_stats("n_1")["entries"] == 4
+
+    def test_hint_needs_implied_expression(self, orders_db):
+        """Hinting a partial index for other documents is an error."""
+        assert len(orders_db.find({"status": "active"}).hint("n_1").all()) == 4
+        with pytest.raises(ValueError):
+            orders_db.find({"n": 3}).hint("n_1").all()
+
+    def test_invalid_expressions(self, db):
+        """Unsupported expressions and sparse partial indexes are rejected."""
+        with pytest.raises(ValueError):
+            db.create_index("a", partial_filter_expression={"$or": [{"b": 1}, {"c": 1}]})
+        with pytest.raises(ValueError):
+            db.create_index("a", partial_filter_expression={"b": {"$ne": 1}})
+        with pytest.raises(ValueError):
+            db.create_index("a", sparse=True, partial_filter_expression={"b": 1})
+
+
+class TestPostingLists:
+    """Test the compact posting lists of regular indexes."""
+
+    def test_integer_ids_in_sorted_arrays(self):
+        """Integer ids are stored sorted, 8 bytes each."""
+        from array import array
+        manager = IndexManager()
+        manager.create_index("color")
+        for i in (9, 3, 7, 1, 5, 2):
+            manager.add_document({"_id": i, "color": "red" if i % 2 else "blue"})
+        data = manager._indexes["color_1"]["data"]
+        assert isinstance(data["red"], array) and data["red"].itemsize == 8
+        assert list(data["red"]) == [1, 3, 5, 7, 9]
+        manager.add_document({"_id": 4, "color": "red"})
+        manager.add_document({"_id": 4, "color": "red"})
+        manager.remove_document({"_id": 3, "color": "red"})
+        manager.remove_document({"_id": 8, "color": "red"})
+        assert list(data["red"]) == [1, 4, 5, 7, 9]
+        assert manager.index_stats("color_1")["entries"] == 6
+
+    def test_other_ids_use_sets(self):
+        """Non-integer ids switch a posting list to a set."""
+        manager = IndexManager()
+        manager.create_index("k")
+        for doc_id, key in ((1, "x"), ("a", "x"), ("b", "y"), (2 ** 70, "z")):
+            manager.add_document({"_id": doc_id, "k": key})
+        data = manager._indexes["k_1"]["data"]
+        assert data["x"] == {1, "a"}
+        assert data["y"] == {"b"}
+        assert data["z"] == {2 ** 70}
+        manager.remove_document({"_id": "a", "k": "x"})
+        assert manager.query_index("k", "x") == [1]
+        assert manager.index_stats("k_1")["entries"] == 3
+
+    def test_low_cardinality_counts(self, db):
+        """Many documents under one key keep exact statistics."""
+        db.insert_many([{"flag": n % 2 == 0, "n": n} for n in range(3000)])
+        db.create_index("flag")
+        stats = db._index_manager.index_stats("flag_1")
+        assert stats["entries"] == 3000
+        db.delete_many({"n": {"$lt": 1000}})
+        assert db._index_manager.index_stats("flag_1")["entries"] == 2000
+        assert db.count_documents({"flag": True}) == 1000
+
+    def test_intersection_and_union(self, db):
+        """Intersections of sorted postings match a scan."""
+        filter = {"a": {"$in": [0, 1]}, "b": 2, "c": {"$gte": 4}}
+        db.insert_many([{"a": n % 3, "b": n % 5, "c": n % 7} for n in range(300)])
+        expected = [doc["_id"] for doc in db.find(filter).all()]
+        for field in ("a", "b", "c"):
+            db.create_index(field)
+        assert [doc["_id"] for doc in db.find(filter).all()] == expected
+        ids = db._index_manager.query_index_range("c", 4, None)
+        assert ids == sorted(ids) and len(ids) == len(set(ids))
+
+    def test_intersect_helper(self):
+        """Galloping intersection and the unorderable fallback."""
+        from jsonlite.jsonlite import _intersect_postings, _merge_postings
+        from array import array
+        assert _intersect_postings([[5, 1, 3], array('q', range(0, 100, 1)), [3, 5, 7]]) == [3, 5]
+        assert _intersect_postings([[1, "a"], {"a", 2, 1}]) == [1, "a"]
+        assert _merge_postings([array('q', [1, 4]), array('q', [2, 3])]) == [1, 2, 3, 4]
+
+
+class TestBitmapIndex:
+    """Test bitmap indexes on low-cardinality fields."""
+
+    @pytest.fixture
+    def events_db(self, db):
+        db.insert_many([
+            {"status": ["open", "closed", "held"][n % 3], "region": ["eu", "us"][n % 2],
+             "level": n % 4, "n": n}
+            for n in range(120)
+        ])
+        return db
+
+    def test_bits_per_value(self, events_db):
+        """Each value keeps a bitset with bit n set for _id n."""
+        name = events_db.create_index([("status", "bitmap")])
+        assert name == "status_bitmap"
+        info = events_db._index_manager._indexes[name]
+        assert set(info["bitmaps"]) == {"open", "closed", "held"}
+        assert info["counts"] == {"open": 40, "closed": 40, "held": 40}
+        ids = [doc["_id"] for doc in events_db.find({"status": "held"}).all()]
+        bits = events_db._index_manager.bitmap_match(name, ["held"])
+        assert [n for n in range(bits.bit_length()) if bits >> n & 1] == ids
+
+    def test_and_or_of_predicates(self, events_db):
+        """Equality and $in on several bitmap fields combine bitwise."""
+        filters = [
+            {"status": "open", "region": "eu"},
+            {"status": {"$in": ["open", "held"]}, "region": "us"},
+            {"status": "held", "region": "eu", "n": {"$gt": 60}},
+            {"status": "missing", "region": "eu"},
+        ]
+        expected = [[doc["n"] for doc in events_db.find(f).all()] for f in filters]
+        events_db.create_index([("status", "bitmap")])
+        events_db.create_index([("region", "bitmap")])
+        for filter, ns in zip(filters, expected):
+            assert [doc["n"] for doc in events_db.find(filter).all()] == ns
+            assert events_db.count_documents(filter) == len(ns)
+        plan = events_db.find(filters[0]).explain()["queryPlanner"]["winningPlan"]
+        stages = plan["inputStage"]["inputStages"]
+        assert [stage["indexName"] for stage in stages] == ["status_bitmap", "region_bitmap"]
+
+    def test_count_by_popcount(self, events_db):
+        """Counts of exact bitmap filters never touch the documents."""
+        events_db.create_index([("level", "bitmap")])
+        events_db.create_index([("region", "bitmap")])
+        events_db._iter_matches = None  # Any scan would fail
+        assert events_db.count_documents({"level": {"$in": [0, 1]}, "region": "eu"}, cache=False) == 30
+        assert events_db.count_documents({"level": 3}, cache=False) == 30
+
+    def test_maintained_and_persisted(self, events_db):
+        """Writes keep the bitsets current, and the index survives a reload."""
+        events_db.create_index([("status", "bitmap")])
+        events_db.update_many({"status": "held"}, {"$set": {"status": "open"}})
+        events_db.delete_many({"n": {"$lt": 30}})
+        info = events_db._index_manager._indexes["status_bitmap"]
+        assert "held" not in info["bitmaps"]
+        assert events_db.count_documents({"status": "open"}) == 60
+        reopened = JSONlite(events_db._filename)
+        assert reopened.count_documents({"status": "open"}) == 60
+        assert reopened.list_indexes()[0]["keys"] == [["status", "bitmap"]]
+
+    def test_ranges_and_sorts_scan(self, events_db):
+        """Bitsets have no key order, so ranges and sorts do not use them."""
+        events_db.create_index([("level", "bitmap")])
+        plan = events_db.find({"level": {"$gte": 2}}).explain()["queryPlanner"]["winningPlan"]
+        assert plan["stage"] == "COLLSCAN"
+        assert [doc["level"] for doc in events_db.find().sort("level", -1).limit(2).all()] == [3, 3]
+
+    def test_invalid_bitmap_indexes(self, db):
+        """Bitmap indexes are single-field and not unique."""
+        with pytest.raises(ValueError):
+            db.create_index([("a", "bitmap"), ("b", 1)])
+        with pytest.raises(ValueError):
+            db.create_index([("a", "bitmap")], unique=True)
+
+    def test_smaller_than_regular_index(self, events_db):
+        """A few dense bitsets take less memory than posting lists."""
+        manager = events_db._index_manager
+        events_db.create_index("region")
+        events_db.create_index([("region", "bitmap")])
+        assert manager.index_memory("region_bitmap") < manager.index_memory("region_1")
+
+
+class TestRegexPrefixIndex:
+    """Test anchored $regex prefixes served by ordered indexes."""
+
+    @pytest.fixture
+    def names_db(self, db):
+        db.insert_many([
+            {"name": "Alice"}, {"name": "alina"}, {"name": "Bob"}, {"name": ["ALbert", "Zed"]},
+            {"name": 5}, {"age": 3}, {"name": "Ålesund"}, {"name": "al"},
+        ])
+        return db
+
+    @staticmethod
+    def plan(db, filter):
+        plan = db.find(filter).explain()["queryPlanner"]["winningPlan"]
+        return plan.get("inputStage", plan)
+
+    def test_options(self, names_db):
+        """$options letters apply to the pattern; unknown letters raise."""
+        names = [doc["name"] for doc in names_db.find({"name": {"$regex": "^al", "$options": "i"}}).all()]
+        assert names == ["Alice", "alina", ["ALbert", "Zed"], "al"]
+        assert names_db.count_documents({"name": {"$not": {"$regex": "^AL", "$options": "i"}}}) == 4
+        with pytest.raises(ValueError):
+            names_db.find({"name": {"$regex": "a", "$options": "q"}}).all()
+
+    def test_prefix_extraction(self):
+        """Only the literal, always-present start of an anchored pattern is used."""
+        import re
+        from jsonlite.jsonlite import _regex_prefix
+        assert _regex_prefix("^abc") == ("abc", False)
+        assert _regex_prefix("^ab.c") == ("ab", False)
+        assert _regex_prefix("^abc?") == ("ab", False)
+        assert _regex_prefix("^a\\.b+") == ("a.b", False)
+        assert _regex_prefix("\\Afoo\\d") == ("foo", False)
+        assert _regex_prefix(re.compile("^Ab", re.I)) == ("Ab", True)
+        assert _regex_prefix("(?i)^ab") is None
+        for pattern in ("abc", "^a|b", "^.a", "^\\d", "^a*", "["):
+            assert _regex_prefix(pattern) is None
+        assert _regex_prefix(re.compile("^ab", re.M)) is None
+
+    def test_case_sensitive_prefix_scans_range(self, names_db):
+        """^prefix on an ordered index reads just the matching keys."""
+        filter = {"name": {"$regex": "^Al"}}
+        expected = [doc["_id"] for doc in names_db.find(filter).all()]
+        names_db.create_index("name")
+        assert [doc["_id"] for doc in names_db.find(filter).all()] == expected == [1]
+        plan = self.plan(names_db, filter)
+        assert plan["stage"] == "IXSCAN" and plan["indexName"] == "name_1"
+        assert names_db._index_manager.query_index_prefix("name_1", "Al") == [1]
+        # Case-insensitive patterns cannot use binary key order
+        assert self.plan(names_db, {"name": {"$regex": "^al", "$options": "i"}})["stage"] == "COLLSCAN"
+
+    def test_collation_serves_case_insensitive_prefix(self, names_db):
+        """A case-folded collation index serves ^prefix and ^value$ with "i"."""
+        filters = [
+            {"name": {"$regex": "^AL", "$options": "i"}},
+            {"name": {"$regex": "^alice$", "$options": "i"}},
+            {"name": {"$regex": "^Al"}},
+        ]
+        expected = [[doc["_id"] for doc in names_db.find(f).all()] for f in filters]
+        name = names_db.create_index("name", collation={"locale": "en", "strength": 2})
+        keys = [key for _, key in names_db._index_manager._indexes[name]["sorted_keys"]]
+        assert "alice" in keys and "Alice" not in keys
+        for filter, ids in zip(filters, expected):
+            assert [doc["_id"] for doc in names_db.find(filter).all()] == ids
+            assert names_db.count_documents(filter) == len(ids)
+            assert self.plan(names_db, filter)["indexName"] == name
+        assert expected[0] == [1, 2, 4, 8]
+
+    def test_collation_index_does_not_serve_binary_queries(self, names_db):
+        """Folded keys answer neither exact equality, ranges, sorts nor distinct."""
+        name = names_db.create_index("name", collation={"locale": "en", "strength": 2})
+        manager = names_db._index_manager
+        assert names_db.count_documents({"name": "ALICE"}) == 0
+        assert self.plan(names_db, {"name": "Alice"})["stage"] == "COLLSCAN"
+        assert manager.find_index_for_field("name") is None
+        assert manager.query_index_range("name", "B") is None
+        assert manager.iter_index_order("name") is None
+        assert names_db.distinct("name")[:2] == ["Alice", "alina"]
+        # Hinted equality looks up the folded key and verifies each match
+        assert [doc["_id"] for doc in names_db.find({"name": "alina"}).hint(name).all()] == [2]
+
+    def test_multi_character_folds_are_not_skipped(self, db):
+        """"İ" folds to two characters but matches "i" ignoring case."""
+        import re
+        from jsonlite.jsonlite import _regex_prefix
+        db.insert_many([{"s": "İstanbul"}, {"s": "istanbul"}, {"s": "Straße"}, {"s": "STRASSE"}])
+        filters = [{"s": {"$regex": "^İ", "$options": "i"}}, {"s": {"$regex": "^İst", "$options": "i"}},
+                   {"s": {"$regex": "^straß", "$options": "i"}}]
+        expected = [[doc["_id"] for doc in db.find(f).all()] for f in filters]
+        assert expected[0] == [1, 2]
+        db.create_index("s", collation={"locale": "en", "strength": 2})
+        for filter, ids in zip(filters, expected):
+            assert [doc["_id"] for doc in db.find(filter).all()] == ids
+        assert _regex_prefix(re.compile("^İst", re.I)) is None
+        assert _regex_prefix(re.compile("^straß", re.I)) == ("stra", True)
+        assert _regex_prefix("^İst") == ("İst", False)
+
+    def test_strength_one_ignores_diacritics(self, names_db):
+        """Strength 1 also strips accents, still verified against the pattern."""
+        name = names_db.create_index("name", collation={"locale": "en", "strength": 1})
+        filter = {"name": {"$regex": "^ål", "$options": "i"}}
+        assert [doc["name"] for doc in names_db.find(filter).all()] == ["Ålesund"]
+        candidates = names_db._index_manager.query_index_prefix(name, "ål")
+        assert len(candidates) > 1  # Alice, alina, ... share the folded prefix
+
+    def test_collation_persisted_and_validated(self, names_db):
+        """The collation is kept in the index metadata; bad ones are rejected."""
+        names_db.create_index("name", collation={"locale": "en", "strength": 2})
+        reopened = JSONlite(names_db._filename)
+        assert reopened.list_indexes()[0]["collation"] == {"locale": "en", "strength": 2}
+        assert reopened.count_documents({"name": {"$regex": "^ALI", "$options": "i"}}) == 2
+        with pytest.raises(ValueError):
+            names_db.create_index("age", collation={"strength": 2})
+        with pytest.raises(ValueError):
+            names_db.create_index("age", collation={"locale": "en", "strength": 4})
+        with pytest.raises(ValueError):
+            names_db.create_index([("age", "hashed")], collation={"locale": "en"})
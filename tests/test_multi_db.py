@@ -4,7 +4,8 @@ Test multi-database and collection management (pymongo-compatible API).
 import pytest
 import os
 import shutil
-from jsonlite import MongoClient, Database, Collection
+from jsonlite import MongoClient, Database, Collection, CachePool
+from jsonlite.jsonlite import QueryCache, _approximate_size
 
 
 @pytest.fixture
@@ -511,3 +512,98 @@ class TestEdgeCases:
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
+
+
+class TestSharedCachePool:
+    """Test the query cache pool shared by the collections of a client."""
+    
+    def test_collections_share_pool(self, client):
+        """Collections of all databases cache into the client's pool."""
+        users = client.app.users
+        logs = client.audit.logs
+        assert users._jsonlite._cache._pool is client._cache_pool
+        assert logs._jsonlite._cache._pool is client._cache_pool
+        users.insert_one({'name': 'Alice'})
+        logs.insert_one({'event': 'login'})
+        list(users.find({'name': 'Alice'}))
+        list(logs.find({'event': 'login'}))
+        stats = client.get_cache_stats()
+        assert stats['size'] == 2
+        assert set(stats['namespaces']) == {'app.users', 'audit.logs'}
+        assert stats['memory_bytes'] == sum(ns['memory_bytes'] for ns in stats['namespaces'].values())
+    
+    def test_namespaces_keep_keys_and_invalidation_apart(self, client):
+        """Equal filters on two collections are separate entries, and writes
+        to one collection leave the other's entries alone."""
+        a, b = client.db.a, client.db.b
+        a.insert_one({'x': 1})
+        b.insert_many([{'x': 1}, {'x': 1}])
+        assert len(list(a.find({'x': 1}))) == 1
+        assert len(list(b.find({'x': 1}))) == 2
+        a.insert_one({'x': 1})
+        assert b._jsonlite.get_cache_stats()['size'] == 1
+        assert a._jsonlite.get_cache_stats()['size'] == 0
+        assert len(list(a.find({'x': 1}))) == 2
+    
+    def test_global_memory_budget(self, tmp_path):
+        """Entries of all collections together stay within one budget."""
+        client = MongoClient(str(tmp_path), cache_max_bytes=4096, cache_max_entry_bytes=4096)
+        for i in range(10):
+            collection = client.db[f'c{i}']
+            collection.insert_many([{'n': n} for n in range(20)])
+            list(collection.find({'n': {'$gte': 0}}))
+        stats = client.get_cache_stats()
+        assert stats['max_bytes'] == 4096
+        assert 0 < stats['memory_bytes'] <= 4096
+        assert stats['evictions'] > 0
+        # The most recent collection's result is still cached
+        assert 'db.c9' in stats['namespaces']
+    
+    def test_eviction_prefers_cheap_entries(self):
+        """Among the least recently used entries, the cheapest to recompute goes first."""
+        size = _approximate_size([1, 2, 3])
+        pool = CachePool(max_bytes=2 * size, max_entry_bytes=size)
+        a = QueryCache(pool=pool, namespace='a')
+        b = QueryCache(pool=pool, namespace='b')
+        a.set({'q': 1}, [1, 2, 3], cost=50.0)
+        b.set({'q': 2}, [1, 2, 3], cost=0.1)
+        a.set({'q': 3}, [1, 2, 3], cost=1.0)
+        # The older but expensive entry survives
+        assert a.get({'q': 1}) == [1, 2, 3]
+        assert b.get({'q': 2}) is None
+        assert b.stats['evictions'] == 1
+        assert pool.stats['size'] == 2
+    
+    def test_hits_refresh_recency(self):
+        """An entry hit recently is not evicted while older ones remain."""
+        size = _approximate_size([1, 2, 3])
+        pool = CachePool(max_bytes=2 * size, max_entry_bytes=size, max_size=2)
+        a = QueryCache(pool=pool, namespace='a')
+        a.set({'q': 1}, [1, 2, 3], cost=1.0)
+        a.set({'q': 2}, [1, 2, 3], cost=1.0)
+        # Both are equally cheap: only recency decides
+        assert a.get({'q': 1}) is not None
+        a.set({'q': 3}, [1, 2, 3], cost=1.0)
+        assert a.get({'q': 1}) is not None
+        assert a.get({'q': 2}) is None
+    
+    def test_clear_and_drop_release_pool_memory(self, client):
+        """Clearing or dropping a collection returns its bytes to the pool."""
+        a, b = client.db.a, client.db.b
+        a.insert_one({'x': 1})
+        b.insert_one({'x': 1})
+        list(a.find({'x': 1}))
+        list(b.find({'x': 1}))
+        client.db.drop_collection('a')
+        stats = client.get_cache_stats()
+        assert set(stats['namespaces']) == {'db.b'}
+        client.clear_cache()
+        assert client.get_cache_stats()['memory_bytes'] == 0
+    
+    def test_shared_cache_disabled(self, tmp_path):
+        """shared_cache=False keeps a private cache per collection."""
+        client = MongoClient(str(tmp_path), shared_cache=False, cache_max_bytes=1 << 20)
+        assert client.get_cache_stats() is None
+        cache = client.db.a._jsonlite._cache
+        assert cache._pool is None
+        assert cache.stats['max_bytes'] == 1 << 20
@@ -2,7 +2,8 @@
 
 import pytest
 import os
-from jsonlite import JSONlite
+import tempfile
+from jsonlite import JSONlite, AutoIndexPolicy
 
 
 @pytest.fixture
@@ -230,3 +231,461 @@ class TestQueryPlannerIntegration:
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+
+class TestExplain:
+    """Test explain() for cursors and aggregation pipelines."""
+
+    @pytest.fixture
+    def db(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            db.insert_many([{'a': i % 5, 'b': i} for i in range(50)])
+            yield db
+            os.unlink(f.name)
+
+    def test_collscan(self, db):
+        """Unindexed queries report a collection scan."""
+        plan = db.find({'a': 3}).explain()
+        assert plan['queryPlanner']['winningPlan']['stage'] == 'COLLSCAN'
+        assert plan['queryPlanner']['indexesConsidered'] == []
+        stats = plan['executionStats']
+        assert stats['nReturned'] == 10
+        assert stats['totalDocsExamined'] == 50
+        assert stats['estimatedDocsExamined'] == 50
+        assert stats['totalKeysExamined'] == 0
+
+    def test_ixscan(self, db):
+        """Indexed equality reports FETCH over IXSCAN."""
+        db.create_index('a')
+        plan = db.find({'a': 3, 'b': {'$gt': 20}}).explain()
+        winning = plan['queryPlanner']['winningPlan']
+        assert winning['stage'] == 'FETCH'
+        assert winning['inputStage'] == {'stage': 'IXSCAN', 'indexName': 'a_1'}
+        stats = plan['executionStats']
+        assert stats['nReturned'] == 6
+        assert stats['totalDocsExamined'] == stats['totalKeysExamined'] == 10
+        assert 'executionTimeMillis' in stats['executionStages']
+
+    def test_id_lookup(self, db):
+        """_id equality goes through the primary id map."""
+        plan = db.find({'_id': 7}).explain()
+        assert plan['queryPlanner']['winningPlan']['inputStage']['stage'] == 'ID_LOOKUP'
+        assert plan['executionStats']['totalDocsExamined'] == 1
+
+    def test_sort_limit_stages(self, db):
+        """Sort, skip, limit and projection appear as stages."""
+        plan = db.find({'a': 1}).sort('b', -1).skip(1).limit(2).projection({'b': 1}).explain()
+        stages = []
+        node = plan['executionStats']['executionStages']
+        while node:
+            stages.append(node['stage'])
+            node = node.get('inputStage')
+        assert stages == ['PROJECTION_SIMPLE', 'LIMIT', 'SKIP', 'SORT', 'COLLSCAN']
+        assert plan['executionStats']['nReturned'] == 2
+
+    def test_index_order_and_covered_plans(self, db):
+        """Index-order sorts and covered projections are reported."""
+        db.create_index('a')
+        db.create_index('b')
+        plan = db.find({'a': 1}).sort('b', 1).limit(2).explain()
+        assert 'b_1' in plan['queryPlanner']['indexesConsidered']
+        assert plan['queryPlanner']['rejectedPlans'] == [{'stage': 'IXSCAN', 'indexName': 'a_1'}]
+        scan = plan['queryPlanner']['winningPlan']['inputStage']['inputStage']
+        assert scan == {'stage': 'IXSCAN', 'indexName': 'b_1', 'direction': 'forward'}
+
+        plan = db.find({'a': 1}).projection({'a': 1, '_id': 0}).explain()
+        assert plan['queryPlanner']['winningPlan']['stage'] == 'PROJECTION_COVERED'
+        assert plan['executionStats']['totalDocsExamined'] == 0
+
+    def test_cache_hit_reported(self, db):
+        """A repeated query reports the cache hit."""
+        db.find({'a': 2}).all()
+        plan = db.find({'a': 2}).explain()
+        assert plan['executionStats']['cacheHit'] is True
+        assert plan['executionStats']['totalDocsExamined'] == 0
+
+    def test_explain_leaves_cursor_unexecuted(self, db):
+        """explain() does not consume the cursor."""
+        cursor = db.find({'a': 4}).limit(3)
+        cursor.explain()
+        assert [r['b'] for r in cursor] == [4, 9, 14]
+
+    def test_aggregate_explain(self, db):
+        """aggregate(explain=True) returns the access plan and per-stage stats."""
+        db.create_index('a')
+        plan = db.aggregate([
+            {'$match': {'a': 1}},
+            {'$group': {'_id': '$a', 'n': {'$sum': 1}}},
+        ], explain=True)
+        cursor_stage = plan['stages'][0]['$cursor']
+        assert cursor_stage['queryPlanner']['winningPlan'] == {'stage': 'IXSCAN', 'indexName': 'a_1'}
+        assert cursor_stage['executionStats']['totalDocsExamined'] == 10
+        assert plan['stages'][1]['nReturned'] == 1
+        assert plan['nReturned'] == 1
+        assert db.aggregate([{'$match': {'a': 1}}, {'$count': 'n'}]).all() == [{'n': 10}]
+
+
+class TestCostBasedPlanning:
+    """Test index statistics and cost-based plan selection."""
+
+    @pytest.fixture
+    def db(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            # 'status' is heavily skewed, 'user' is nearly unique
+            db.insert_many([{'status': 'done' if i % 50 else 'open', 'user': i % 100, 'n': i}
+                            for i in range(500)])
+            db.create_index('status')
+            db.create_index('user')
+            yield db
+            os.unlink(f.name)
+
+    def test_index_stats(self, db):
+        stats = db._index_manager.index_stats('status_1')
+        assert stats['entries'] == 500
+        assert stats['distinct_keys'] == 2
+        assert stats['null_count'] == 0
+        assert sum(stats['histogram'].values()) == 2
+
+        db.insert_one({'status': None})
+        db.delete_many({'status': 'open'})
+        stats = db._index_manager.index_stats('status_1')
+        assert stats['entries'] == 491
+        assert stats['null_count'] == 1
+        assert stats['distinct_keys'] == 2
+
+    def test_picks_selective_index(self, db):
+        cursor = db.find({'status': 'done', 'user': 7})
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        assert plan['inputStage']['indexName'] == 'user_1'
+        assert len(cursor.toArray()) == 5
+
+    def test_collscan_for_unselective_filter(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            db.insert_many([{'kind': 'x'} for _ in range(200)] + [{'kind': 'y'}])
+            db.create_index('kind')
+            cursor = db.find({'kind': 'x'})
+            assert cursor.explain()['queryPlanner']['winningPlan']['stage'] == 'COLLSCAN'
+            assert len(cursor.toArray()) == 200
+            os.unlink(f.name)
+
+    def test_intersection_plan(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            db.insert_many([{'a': i % 10, 'b': i % 7} for i in range(700)])
+            db.create_index('a')
+            db.create_index('b')
+            cursor = db.find({'a': 3, 'b': 4})
+            plan = cursor.explain()['queryPlanner']['winningPlan']
+            assert plan['inputStage']['stage'] == 'AND_HASH'
+            assert [s['indexName'] for s in plan['inputStage']['inputStages']] == ['a_1', 'b_1']
+            results = cursor.toArray()
+            assert len(results) == 10
+            assert all(doc['a'] == 3 and doc['b'] == 4 for doc in results)
+            os.unlink(f.name)
+
+    def test_range_estimate(self, db):
+        db.create_index('n')
+        cursor = db.find({'n': {'$gte': 10, '$lt': 15}, 'status': 'done'})
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        assert plan['inputStage']['indexName'] == 'n_1'
+        assert [doc['n'] for doc in cursor] == [10, 11, 12, 13, 14]
+
+    def test_plan_cached_per_shape(self, db):
+        db.find({'user': 1, 'status': 'done'}).toArray()
+        db.find({'user': 2, 'status': 'open'}).toArray()
+        assert db.get_plan_cache_stats()['size'] == 1
+        _, access = db._prepare_filter({'user': 3, 'status': 'done'})
+        assert list(access) == [(('status', 'eq'), ('user', 'eq'))]
+
+    def test_plan_replanned_on_drift(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            db.insert_many([{'a': i % 100, 'b': i % 2} for i in range(500)])
+            db.create_index('a')
+            db.create_index('b')
+            filter = {'a': 0, 'b': 0}
+            plan = db.find(filter).explain()['queryPlanner']['winningPlan']
+            assert plan['inputStage']['indexName'] == 'a_1'
+            _, access = db._prepare_filter(filter)
+            entry = access[(('a', 'eq'), ('b', 'eq'))]
+            db.find({'a': 1, 'b': 1}).toArray()
+            assert access[(('a', 'eq'), ('b', 'eq'))] is entry
+
+            # 'a' collapses to a single value while 'b' becomes selective
+            db.update_many({}, {'$set': {'a': 0}})
+            db.insert_many([{'a': 0, 'b': i + 10} for i in range(1000)])
+            plan = db.find(filter).explain()['queryPlanner']['winningPlan']
+            assert plan['inputStage']['indexName'] == 'b_1'
+            assert len(db.find(filter).toArray()) == 250
+            os.unlink(f.name)
+
+
+class TestPlanCache:
+    """Test the plan cache keyed by filter shape."""
+
+    @pytest.fixture
+    def db(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            db.insert_many([
+                {'name': 'Alice', 'age': 30, 'tags': ['a', 'b'], 'address': {'city': 'NYC'}},
+                {'name': 'Bob', 'age': 25, 'tags': ['c'], 'address': {'city': 'LA'}},
+                {'name': 'Carol', 'age': None, 'items': [{'sku': 'x', 'qty': 2}, {'sku': 'y', 'qty': 5}]},
+                {'name': 'Dave'},
+            ])
+            yield db
+            os.unlink(f.name)
+
+    def test_values_share_one_plan(self, db):
+        db.find({'age': {'$gt': 20}, 'name': 'Alice'}).toArray()
+        db.find({'age': {'$gt': 40}, 'name': 'Bob'}).toArray()
+        stats = db.get_plan_cache_stats()
+        assert stats['size'] == 1
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    def test_compiled_predicate_matches_interpreter(self, db):
+        filters = [
+            {}, {'name': 'Alice'}, {'age': 30}, {'age': None}, {'tags': ['c']},
+            {'age': {'$gt': 26}}, {'age': {'$gte': 25, '$lt': 30}}, {'age': {'$ne': 30}},
+            {'age': {'$in': [25, 30]}}, {'age': {'$exists': False}}, {'age': {'$eq': None}},
+            {'age': {'$not': {'$gt': 26}}}, {'name': {'$regex': '^[AB]'}},
+            {'tags': {'$all': ['a', 'b']}}, {'address.city': 'NYC'},
+            {'address.city': {'$ne': 'NYC'}}, {'items.sku': 'y'}, {'items.qty': {'$gt': 4}},
+            {'items.qty': {'$in': [2]}},
+            {'$or': [{'age': 25}, {'name': 'Dave'}]}, {'$and': [{'age': {'$gt': 1}}, {'tags': 'a'}]},
+            {'$nor': [{'age': 25}]}, {'$not': {'name': 'Bob'}}, {'$or': []},
+        ]
+        for filter in filters:
+            match, _ = db._prepare_filter(filter)
+            for record in db._data:
+                assert match(record) == db._match_filter(filter, record), (filter, record)
+
+    def test_uncompilable_filters_fall_back(self, db):
+        assert len(db.find({'age': {lambda v, c: v == c: 30}}).toArray()) == 1
+        assert db.get_plan_cache_stats()['size'] == 0
+        with pytest.raises(ValueError):
+            db.find({'age': {'$bogus': 1}}).toArray()
+
+    def test_invalidated_by_index_changes(self, db):
+        db.find({'age': 30}).toArray()
+        assert db.get_plan_cache_stats()['size'] == 1
+        db.create_index('age')
+        assert db.get_plan_cache_stats()['size'] == 0
+        assert db.find({'age': 25}).explain()['queryPlanner']['winningPlan']['inputStage']['indexName'] == 'age_1'
+        assert db.get_plan_cache_stats()['size'] == 1
+        db.drop_index('age_1')
+        assert db.get_plan_cache_stats()['size'] == 0
+
+    def test_exposed_in_cache_stats(self, db):
+        db.find({'age': 30}).toArray()
+        db.find({'age': 31}).toArray()
+        stats = db.get_cache_stats()
+        assert stats['plan_cache']['hits'] == 1
+        db.reset_cache_stats()
+        assert db.get_cache_stats()['plan_cache']['hits'] == 0
+
+
+class TestAutoIndex:
+    """Test automatic index creation from query planner suggestions."""
+
+    def _open(self, path, **policy):
+        settings = dict(min_queries=3, min_docs_examined=10, min_collection_size=50,
+                        check_interval=5)
+        settings.update(policy)
+        return JSONlite(path, auto_index=AutoIndexPolicy(**settings))
+
+    @pytest.fixture
+    def path(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            JSONlite(f.name).insert_many([{'a': i, 'b': i % 3} for i in range(100)])
+            yield f.name
+            os.unlink(f.name)
+
+    def _run_queries(self, db, field, count, start=0):
+        for i in range(start, start + count):
+            db.find({field: i}).toArray()
+
+    def test_disabled_by_default(self, path):
+        db = JSONlite(path)
+        self._run_queries(db, 'a', 20)
+        assert db.list_indexes() == []
+        assert db.get_auto_index_log() == []
+
+    def test_builds_suggested_index(self, path):
+        db = self._open(path)
+        self._run_queries(db, 'a', 5)
+        assert db.list_indexes() == []
+        assert db.find({'a': 42}).explain()['queryPlanner']['winningPlan']['inputStage']['indexName'] == 'a_1'
+        log = db.get_auto_index_log()
+        assert [(e['action'], e['field'], e['index']) for e in log] == [('create', 'a', 'a_1')]
+        assert 'unindexed queries' in log[0]['reason']
+        # The index is persisted like a hand-made one
+        assert [i['name'] for i in JSONlite(path).list_indexes()] == ['a_1']
+
+    def test_thresholds(self, path):
+        db = self._open(path, min_queries=10)
+        self._run_queries(db, 'a', 10)
+        db.find({'a': 1}).toArray()
+        assert db.list_indexes() == []
+        assert db.get_auto_index_log() == []
+
+    def test_small_collection_skipped(self, path):
+        db = self._open(path, min_collection_size=1000)
+        self._run_queries(db, 'a', 6)
+        assert db.list_indexes() == []
+        entry, = db.get_auto_index_log()
+        assert entry['action'] == 'skip'
+        assert 'min_collection_size' in entry['reason']
+
+    def test_memory_budget(self, path):
+        db = self._open(path, max_index_memory=100)
+        self._run_queries(db, 'a', 6)
+        assert db.list_indexes() == []
+        entry, = db.get_auto_index_log()
+        assert entry['action'] == 'skip'
+        assert 'budget' in entry['reason']
+
+    def test_unused_index_dropped(self, path):
+        db = self._open(path, unused_window=60)
+        self._run_queries(db, 'a', 6)
+        assert [i['name'] for i in db.list_indexes()] == ['a_1']
+        db._auto_indexer.indexes['a_1']['last_used'] -= 120
+        for i in range(1, 6):
+            db.find({'_id': i}).toArray()
+        db.find({'_id': 7}).toArray()
+        assert db.list_indexes() == []
+        assert [e['action'] for e in db.get_auto_index_log()] == ['create', 'drop']
+        assert JSONlite(path).list_indexes() == []
+
+    def test_used_index_kept(self, path):
+        db = self._open(path, unused_window=60)
+        self._run_queries(db, 'a', 6)
+        db._auto_indexer.indexes['a_1']['last_used'] -= 120
+        self._run_queries(db, 'a', 6, start=50)
+        assert [i['name'] for i in db.list_indexes()] == ['a_1']
+
+    def test_auto_flag_survives_reopen(self, path):
+        db = self._open(path, unused_window=60)
+        self._run_queries(db, 'a', 6)
+        JSONlite(path).create_index('b')
+        assert [(i['name'], i.get('auto', False)) for i in JSONlite(path).list_indexes()] == [
+            ('a_1', True), ('b_1', False)]
+        db = self._open(path, unused_window=60)
+        assert set(db._auto_indexer.indexes) == {'a_1'}
+        db._auto_indexer.indexes['a_1']['last_used'] -= 120
+        for i in range(1, 7):
+            db.find({'_id': i}).toArray()
+        assert [i['name'] for i in db.list_indexes()] == ['b_1']
+        assert [(e['action'], e['index']) for e in db.get_auto_index_log()] == [('drop', 'a_1')]
+
+    def test_memory_budget_estimated_before_build(self, path, monkeypatch):
+        db = self._open(path, max_index_memory=100)
+        monkeypatch.setattr(db._index_manager, 'rebuild_index',
+                            lambda *args: pytest.fail("index built over budget"))
+        self._run_queries(db, 'a', 6)
+        entry, = db.get_auto_index_log()
+        assert 'estimated' in entry['reason']
+
+    def test_memory_estimate(self, path):
+        db = JSONlite(path)
+        db.insert_many([{'a': i, 'b': i % 3, 'tags': ['x', i]} for i in range(100, 5000)])
+        manager = db._index_manager
+        for field in ('a', 'b', 'tags'):
+            estimate = manager.estimate_index_memory(field, db._data)
+            db.create_index(field)
+            actual = manager.index_memory(f"{field}_1")
+            assert actual / 2 < estimate < actual * 2, field
+
+    def test_collection_size_read_fresh(self, path):
+        db = self._open(path, min_collection_size=150)
+        self._run_queries(db, 'a', 5)
+        JSONlite(path).insert_many([{'a': i} for i in range(100, 200)])
+        db.find({'a': 150}).toArray()
+        assert [(e['action'], e['index']) for e in db.get_auto_index_log()] == [('create', 'a_1')]
+
+
+class TestHint:
+    """Test hint() on cursors, counts, updates and deletes."""
+
+    @pytest.fixture
+    def db(self):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            db = JSONlite(f.name)
+            db.insert_many([{'a': i % 2, 'b': i % 10, 'n': i} for i in range(100)])
+            db.create_index('a')
+            db.create_index('b')
+            db.create_index('n')
+            yield db
+            os.unlink(f.name)
+
+    def _access(self, cursor):
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        return plan.get('inputStage', plan)
+
+    def test_hint_forces_index(self, db):
+        filter = {'a': 1, 'b': 3}
+        assert self._access(db.find(filter))['stage'] == 'AND_HASH'
+        cursor = db.find(filter).hint('a_1')
+        assert self._access(cursor)['indexName'] == 'a_1'
+        assert cursor.toArray() == db.find(filter).toArray()
+
+    def test_hint_by_keys(self, db):
+        cursor = db.find({'a': 1, 'b': 3}).hint([('a', 1)])
+        assert self._access(cursor)['indexName'] == 'a_1'
+        cursor = db.find({'a': 1}).hint({'n': 1})
+        assert self._access(cursor)['indexName'] == 'n_1'
+        assert len(cursor.toArray()) == 50
+
+    def test_natural_forces_collscan(self, db):
+        cursor = db.find({'b': 3}).hint('$natural')
+        explain = cursor.explain()
+        assert explain['queryPlanner']['winningPlan']['stage'] == 'COLLSCAN'
+        assert explain['queryPlanner']['hint'] == '$natural'
+        assert explain['executionStats']['totalDocsExamined'] == 100
+        assert [doc['n'] for doc in cursor] == list(range(3, 100, 10))
+
+    def test_unknown_hint(self, db):
+        with pytest.raises(ValueError):
+            db.find({'a': 1}).hint('missing_1').toArray()
+        with pytest.raises(ValueError):
+            db.count_documents({'a': 1}, hint=[('missing', 1)])
+
+    def test_hint_with_sort(self, db):
+        cursor = db.find({'b': 3}).sort('n', -1).limit(2)
+        assert [doc['n'] for doc in cursor.hint('n_1')] == [93, 83]
+        explain = db.find({'b': 3}).sort('n', -1).limit(2).hint('b_1').explain()
+        assert explain['queryPlanner']['winningPlan']['stage'] == 'LIMIT'
+        assert explain['executionStats']['totalDocsExamined'] == 10
+
+    def test_count_documents(self, db):
+        assert db.count_documents({'b': 3}, hint='$natural') == 10
+        assert db.count_documents({'b': 3}, hint='a_1') == 10
+        assert db.count_documents({}, hint='_id_') == 100
+
+    def test_update_and_delete(self, db):
+        result = db.update_many({'b': 3}, {'$set': {'hit': True}}, hint='a_1')
+        assert result.matched_count == 10
+        assert db.update_one({'b': 4}, {'$set': {'hit': True}}, hint='$natural').modified_count == 1
+        assert db.count_documents({'hit': True}) == 11
+        assert db.delete_many({'b': 3}, hint=[('n', 1)]).deleted_count == 10
+        assert db.delete_one({'b': 4}, hint='b_1').deleted_count == 1
+        assert db.count_documents({}) == 89
+
+    def test_whole_multikey_index_scans_collection(self, db):
+        db.insert_many([{'tags': ['x', 'y']}, {'tags': []}, {'tags': 'x'}])
+        db.create_index('tags')
+        assert db._index_manager.hinted_ids('tags_1', {}) is None
+        assert db.count_documents({}, hint='tags_1') == 103
+        assert db.count_documents({'tags': 'x'}, hint='tags_1') == 2
+        assert db.delete_many({'n': {'$exists': False}}, hint='tags_1').deleted_count == 3
+        assert db.count_documents({}) == 100
+
+    def test_query_stats(self, db):
+        db.find({'a': 1}).hint('$natural').toArray()
+        db.find({'a': 0}).toArray()
+        assert db.get_query_stats()['hinted_queries'] == 1
+        assert db._query_planner._query_history[-2]['hint'] == '$natural'